@@ -0,0 +1,6 @@
+"""
+本地推流 / 检测结果 API 模块
+"""
+from .server import StreamServer
+
+__all__ = ['StreamServer']
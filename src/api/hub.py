@@ -0,0 +1,154 @@
+"""
+帧与检测结果的发布中心
+生产者（解码线程、检测线程）只调用 offer/publish，开销与观看人数无关：
+- FrameHub: 有人观看时才把最新帧编码为 JPEG，每路每个时刻只编码一次，所有 MJPEG 观众共享同一份字节
+- DetectionFeed: 把每次检测的轨迹与上一次比较生成增量（新增/更新/消失），序列化一次后分发给所有订阅者
+"""
+import io
+import json
+import time
+from threading import Thread, Event, Lock
+
+
+class FrameHub:
+    """按摄像机保存最新帧，在独立线程中按需编码
+
+    max_fps: 每路最高编码帧率（MJPEG 观众不需要源帧率）
+    on_encoded(camera, jpeg, timestamp): 编码完成后调用（由服务端转发到事件循环）
+    """
+    def __init__(self, on_encoded, max_fps=10.0, quality=75, max_width=1280):
+        self.on_encoded = on_encoded
+        self.max_fps = max_fps
+        self.quality = quality
+        self.max_width = max_width
+        self.lock = Lock()
+        self._viewers = {}  # camera -> 观众数
+        self._pending = {}  # camera -> (image, timestamp)
+        self._last_encode = {}
+        self._wake = Event()
+        self._stop = Event()
+        self.frames_encoded = 0
+        self.encode_ms = 0.0
+        self._thread = Thread(target=self._run, name='api-encoder', daemon=True)
+        self._thread.start()
+
+    def add_viewer(self, camera):
+        with self.lock:
+            self._viewers[camera] = self._viewers.get(camera, 0) + 1
+
+    def remove_viewer(self, camera):
+        with self.lock:
+            n = self._viewers.get(camera, 0) - 1
+            if n > 0:
+                self._viewers[camera] = n
+            else:
+                self._viewers.pop(camera, None)
+                self._pending.pop(camera, None)
+
+    def viewers(self, camera=None):
+        with self.lock:
+            return self._viewers.get(camera, 0) if camera is not None else sum(self._viewers.values())
+
+    def offer(self, camera, image, timestamp=None):
+        """解码线程每帧调用：没有观众或未到编码间隔时立即返回，只保存图像引用"""
+        if camera not in self._viewers:
+            return False
+        now = time.time()
+        if now - self._last_encode.get(camera, 0.0) < 1.0 / self.max_fps:
+            return False
+        with self.lock:
+            self._pending[camera] = (image, timestamp or now)
+            self._last_encode[camera] = now
+        self._wake.set()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(1.0)
+            self._wake.clear()
+            with self.lock:
+                pending, self._pending = self._pending, {}
+            for camera, (image, timestamp) in pending.items():
+                try:
+                    start = time.perf_counter()
+                    img = image
+                    if img.width > self.max_width:
+                        img = img.resize((self.max_width, int(img.height * self.max_width / img.width)))
+                    buf = io.BytesIO()
+                    img.convert('RGB').save(buf, 'JPEG', quality=self.quality)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    self.encode_ms = 0.9 * self.encode_ms + 0.1 * elapsed if self.frames_encoded else elapsed
+                    self.frames_encoded += 1
+                    self.on_encoded(camera, buf.getvalue(), timestamp)
+                except Exception as e:
+                    print(f"API 帧编码失败 {camera}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def _track_dict(track, frame_w, frame_h):
+    x1, y1, x2, y2 = track.box
+    d = {'id': track.track_id, 'class': track.class_name, 'conf': round(float(track.conf), 3),
+         'box': [int(x1), int(y1), int(x2), int(y2)]}
+    if frame_w and frame_h:
+        d['nbox'] = [round(x1 / frame_w, 4), round(y1 / frame_h, 4), round(x2 / frame_w, 4), round(y2 / frame_h, 4)]
+    return d
+
+
+class DetectionFeed:
+    """每路摄像机的检测状态与增量消息
+
+    消息格式（JSON）：
+    - {"type": "snapshot", "camera", "ts", "tracks": [...]}：新订阅者首先收到的完整状态
+    - {"type": "delta", "camera", "ts", "seq", "added": [...], "updated": [...], "removed": [id, ...]}
+    """
+    def __init__(self, min_move=2):
+        self.min_move = min_move  # 框移动小于该像素数且置信度变化很小时不算更新
+        self.lock = Lock()
+        self._state = {}  # camera -> {track_id: dict}
+        self._meta = {}  # camera -> (ts, seq)
+        self.published = 0
+
+    def update(self, camera, timestamp, tracks, frame_w=0, frame_h=0):
+        """计算增量，返回序列化好的消息（无变化时返回 None）"""
+        current = {t.track_id: _track_dict(t, frame_w, frame_h) for t in tracks}
+        with self.lock:
+            previous = self._state.get(camera, {})
+            added = [d for tid, d in current.items() if tid not in previous]
+            removed = [tid for tid in previous if tid not in current]
+            updated = []
+            for tid, d in current.items():
+                old = previous.get(tid)
+                if old is None:
+                    continue
+                moved = max(abs(a - b) for a, b in zip(d['box'], old['box']))
+                if moved >= self.min_move or abs(d['conf'] - old['conf']) >= 0.05:
+                    updated.append(d)
+                else:
+                    current[tid] = old  # 保留上次发送的值，微小抖动累积后仍会触发更新
+            seq = self._meta.get(camera, (0, 0))[1] + 1
+            self._state[camera] = current
+            self._meta[camera] = (timestamp, seq)
+        if not (added or updated or removed):
+            return None
+        self.published += 1
+        return json.dumps({'type': 'delta', 'camera': camera, 'ts': round(timestamp, 3), 'seq': seq,
+                           'added': added, 'updated': updated, 'removed': removed}, ensure_ascii=False)
+
+    def snapshot(self, camera=None):
+        """完整状态消息（camera 为 None 时返回所有摄像机的列表）"""
+        with self.lock:
+            cameras = [camera] if camera is not None else list(self._state)
+            messages = []
+            for cam in cameras:
+                ts, seq = self._meta.get(cam, (0.0, 0))
+                messages.append(json.dumps({'type': 'snapshot', 'camera': cam, 'ts': round(ts, 3), 'seq': seq,
+                                            'tracks': list(self._state.get(cam, {}).values())},
+                                           ensure_ascii=False))
+            return messages
+
+    def cameras(self):
+        with self.lock:
+            return list(self._state)
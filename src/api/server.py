@@ -0,0 +1,401 @@
+"""
+本地 HTTP / WebSocket 推流服务
+基于 asyncio 的轻量服务端（不依赖第三方 Web 框架），在独立线程的事件循环中运行：
+
+- GET /stream/<camera>.mjpg     MJPEG（multipart/x-mixed-replace），帧来自已解码的画面，编码一次多人共享
+- GET /snapshot/<camera>.jpg    最新一帧（没有实时帧时取快照服务）
+- GET /ws/detections[?camera=]  WebSocket 检测结果：先发完整状态，之后只发增量
+- GET /cameras                  可用的摄像机 ID
+- GET /health                   JSON 健康状态
+- GET /metrics                  Prometheus 文本格式指标
+
+观众再多，编码与检测也只做一次；慢的 MJPEG 观众自动跳帧，慢的 WebSocket 订阅者重新同步完整状态。
+
+访问控制：带 Origin 头的请求（浏览器中的网页发起）只接受 allowed_origins 中的来源，
+跨域响应头只回给这些来源，WebSocket 握手同样检查；配置了 token 时所有请求都需携带
+`Authorization: Bearer <token>` 或 `?token=<token>`。
+"""
+import asyncio
+import hmac
+import json
+import time
+from threading import Thread, Event
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from .hub import FrameHub, DetectionFeed
+from .websocket import (handshake_response, encode_frame, read_frame, WebSocketClosed,
+                        OP_CLOSE, OP_PING, OP_PONG)
+
+_BOUNDARY = 'frame'
+_RESYNC = object()
+
+
+class _Channel:
+    """一路摄像机的最新 MJPEG 分段（所有观众共享同一份字节）"""
+    __slots__ = ('jpeg', 'part', 'timestamp', 'version', 'event')
+
+    def __init__(self):
+        self.jpeg = None
+        self.part = None
+        self.timestamp = 0.0
+        self.version = 0
+        self.event = asyncio.Event()
+
+    def publish(self, jpeg, timestamp):
+        self.jpeg = jpeg
+        self.part = (f"--{_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n"
+                     f"X-Timestamp: {timestamp:.3f}\r\n\r\n").encode('ascii') + jpeg + b"\r\n"
+        self.timestamp = timestamp
+        self.version += 1
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+
+class _WSClient:
+    __slots__ = ('camera', 'queue')
+
+    def __init__(self, camera, max_queue):
+        self.camera = camera
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+
+class StreamServer:
+    """推流服务
+
+    host/port: 监听地址（默认仅本机；port=0 时由系统分配，启动后从 self.port 读取）
+    snapshot_service: 可选的 SnapshotService，用于没有实时帧的摄像机
+    token: 访问令牌，为空时不校验（仍只接受允许来源的浏览器请求）
+    allowed_origins: 允许访问的网页来源（如 "http://localhost:3000"），默认拒绝所有跨域网页
+    """
+    def __init__(self, host='127.0.0.1', port=8765, snapshot_service=None, max_fps=10.0, ws_queue=64,
+                 token='', allowed_origins=()):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.allowed_origins = frozenset(o.rstrip('/') for o in allowed_origins)
+        self.snapshot_service = snapshot_service
+        self.ws_queue = ws_queue
+        self.hub = FrameHub(self._on_encoded, max_fps=max_fps)
+        self.feed = DetectionFeed()
+        self.started_at = time.time()
+        self.requests = 0
+        self.rejected = 0
+        self.ws_resyncs = 0
+        self._health = {}  # 名称 -> 返回 dict 的回调，合并到 /health
+        self._metrics = {}  # 名称 -> 返回 {指标: 数值} 的回调，输出到 /metrics
+        self._loop = None
+        self._server = None
+        self._channels = {}
+        self._ws_clients = set()
+        self._ready = Event()
+        self._thread = None
+        self.error = None
+
+    # ---- 生命周期 ----
+
+    def start(self, timeout=5.0):
+        """在后台线程中启动事件循环并开始监听，返回是否成功"""
+        self._thread = Thread(target=self._run, name='api-server', daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout)
+        return self._server is not None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            print(f"API 服务已启动: http://{self.host}:{self.port}/")
+        except Exception as e:
+            self.error = str(e)
+            print(f"API 服务启动失败: {e}")
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+    def stop(self):
+        self.hub.stop()
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def add_health(self, name, provider):
+        """登记一个健康信息来源：provider() 返回可 JSON 序列化的 dict"""
+        self._health[name] = provider
+
+    def add_metrics(self, name, provider):
+        """登记一组指标：provider() 返回 {键: 数值}，输出为 rtsp_<name>_<键> 的 gauge"""
+        self._metrics[name] = provider
+
+    # ---- 生产者接口（任意线程调用） ----
+
+    def publish_frame(self, camera, image, timestamp=None):
+        """解码线程每帧调用（PIL Image）；没有观众时几乎没有开销"""
+        return self.hub.offer(camera, image, timestamp)
+
+    def publish_detections(self, camera, timestamp, tracks, frame_w=0, frame_h=0):
+        """检测线程每次检测后调用（IoUTracker 轨迹）；增量只计算和序列化一次"""
+        if self._loop is None:
+            return
+        message = self.feed.update(camera, timestamp, tracks, frame_w, frame_h)
+        if message is not None and self._ws_clients:
+            self._loop.call_soon_threadsafe(self._fanout, camera, encode_frame(message))
+
+    def _on_encoded(self, camera, jpeg, timestamp):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._channel(camera).publish, jpeg, timestamp)
+
+    def _channel(self, camera):
+        channel = self._channels.get(camera)
+        if channel is None:
+            channel = self._channels[camera] = _Channel()
+        return channel
+
+    def _fanout(self, camera, frame):
+        for client in list(self._ws_clients):
+            if client.camera is not None and client.camera != camera:
+                continue
+            try:
+                client.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # 订阅者跟不上：丢弃积压的增量，改发一次完整状态
+                while not client.queue.empty():
+                    client.queue.get_nowait()
+                client.queue.put_nowait(_RESYNC)
+                self.ws_resyncs += 1
+
+    # ---- HTTP ----
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=10)
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = lines[0].split(' ', 2)
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    k, v = line.split(':', 1)
+                    headers[k.strip().lower()] = v.strip()
+            self.requests += 1
+            url = urlsplit(target)
+            path = unquote(url.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            denied = self._check_access(headers, query)
+            cors = self._cors_header(headers)
+            if denied is not None:
+                self.rejected += 1
+                await self._respond(writer, denied, b'forbidden' if denied == 403 else b'unauthorized', extra=cors)
+            elif method != 'GET':
+                await self._respond(writer, 405, b'method not allowed', extra=cors)
+            elif path == '/health':
+                await self._respond_json(writer, self.health(), cors)
+            elif path == '/metrics':
+                await self._respond(writer, 200, self.metrics().encode('utf-8'), 'text/plain; version=0.0.4', cors)
+            elif path == '/cameras':
+                await self._respond_json(writer, self.cameras(), cors)
+            elif path.startswith('/stream/') and path.endswith('.mjpg'):
+                await self._mjpeg(writer, path[len('/stream/'):-len('.mjpg')], cors)
+            elif path.startswith('/snapshot/') and path.endswith('.jpg'):
+                await self._snapshot(writer, path[len('/snapshot/'):-len('.jpg')], cors)
+            elif path == '/ws/detections' and headers.get('upgrade', '').lower() == 'websocket':
+                await self._websocket(reader, writer, headers, query.get('camera'))
+            else:
+                await self._respond(writer, 404, b'not found', extra=cors)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, WebSocketClosed):
+            pass
+        except Exception as e:
+            print(f"API 请求处理错误: {e}")
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    def _check_access(self, headers, query):
+        """校验来源与令牌，通过时返回 None，否则返回 HTTP 状态码
+
+        浏览器会给跨域请求和 WebSocket 握手带上 Origin：来源不在允许列表中时一律拒绝，
+        防止用户浏览器里任意网页读取画面、摄像机列表或订阅检测结果。
+        """
+        origin = headers.get('origin')
+        if origin is not None and origin.rstrip('/') not in self.allowed_origins:
+            return 403
+        if self.token:
+            auth = headers.get('authorization', '')
+            supplied = auth[7:].strip() if auth.lower().startswith('bearer ') else query.get('token', '')
+            if not hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8')):
+                return 401
+        return None
+
+    def _cors_header(self, headers):
+        """只对允许的来源回显跨域响应头"""
+        origin = headers.get('origin')
+        if origin is not None and origin.rstrip('/') in self.allowed_origins:
+            return f"Access-Control-Allow-Origin: {origin}\r\nVary: Origin\r\n"
+        return ''
+
+    async def _respond(self, writer, status, body, content_type='text/plain; charset=utf-8', extra=''):
+        reason = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found',
+                  405: 'Method Not Allowed', 503: 'Service Unavailable'}.get(status, '')
+        writer.write((f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\nCache-Control: no-cache\r\n"
+                      f"{extra}Connection: close\r\n\r\n").encode('ascii') + body)
+        await writer.drain()
+
+    async def _respond_json(self, writer, data, extra=''):
+        await self._respond(writer, 200, json.dumps(data, ensure_ascii=False).encode('utf-8'),
+                            'application/json; charset=utf-8', extra)
+
+    async def _mjpeg(self, writer, camera, extra=''):
+        writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace; boundary={_BOUNDARY}\r\n"
+                      f"Cache-Control: no-cache\r\n{extra}"
+                      f"Connection: close\r\n\r\n").encode('ascii'))
+        channel = self._channel(camera)
+        version = channel.version
+        if channel.part is not None:
+            writer.write(channel.part)
+        elif self.snapshot_service is not None:
+            # 首个实时帧到达前先发一张缓存快照
+            snap = self.snapshot_service.get(camera, refresh=False)
+            if snap is not None:
+                tmp = _Channel()
+                tmp.publish(snap.jpeg, snap.timestamp)
+                writer.write(tmp.part)
+        await writer.drain()
+        self.hub.add_viewer(camera)
+        try:
+            while True:
+                if channel.version == version:
+                    try:
+                        await asyncio.wait_for(channel.event.wait(), timeout=15)
+                    except asyncio.TimeoutError:
+                        continue
+                # 只发最新的一帧：观众写得慢时中间的帧被跳过
+                version = channel.version
+                writer.write(channel.part)
+                await writer.drain()
+        finally:
+            self.hub.remove_viewer(camera)
+
+    async def _snapshot(self, writer, camera, extra=''):
+        channel = self._channels.get(camera)
+        jpeg = channel.jpeg if channel is not None and time.time() - channel.timestamp < 5 else None
+        if jpeg is None and self.snapshot_service is not None:
+            snap = await asyncio.get_running_loop().run_in_executor(None, self.snapshot_service.get_blocking, camera)
+            jpeg = snap.jpeg if snap is not None else None
+        if jpeg is None and channel is not None:
+            jpeg = channel.jpeg
+        if jpeg is None:
+            await self._respond(writer, 404, b'no frame', extra=extra)
+        else:
+            await self._respond(writer, 200, jpeg, 'image/jpeg', extra)
+
+    async def _websocket(self, reader, writer, headers, camera):
+        key = headers.get('sec-websocket-key')
+        if not key:
+            await self._respond(writer, 400, b'missing Sec-WebSocket-Key')
+            return
+        writer.write(handshake_response(key))
+        client = _WSClient(camera, self.ws_queue)
+        for message in self.feed.snapshot(camera):
+            writer.write(encode_frame(message))
+        await writer.drain()
+        self._ws_clients.add(client)
+        receiver = asyncio.ensure_future(self._ws_receive(reader, writer))
+        try:
+            while not receiver.done():
+                getter = asyncio.ensure_future(client.queue.get())
+                done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    break
+                frame = getter.result()
+                if frame is _RESYNC:
+                    for message in self.feed.snapshot(camera):
+                        writer.write(encode_frame(message))
+                else:
+                    writer.write(frame)
+                await writer.drain()
+        finally:
+            self._ws_clients.discard(client)
+            receiver.cancel()
+
+    async def _ws_receive(self, reader, writer):
+        """处理客户端发来的帧：ping 回 pong，close 或断开时结束"""
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == OP_CLOSE:
+                writer.write(encode_frame(payload[:2], OP_CLOSE))
+                return
+            if opcode == OP_PING:
+                writer.write(encode_frame(payload, OP_PONG))
+
+    # ---- 状态 ----
+
+    def cameras(self):
+        cameras = set(self._channels) | set(self.feed.cameras())
+        if self.snapshot_service is not None:
+            cameras |= set(self.snapshot_service.cameras())
+        return sorted(cameras)
+
+    def health(self):
+        data = {
+            'status': 'ok',
+            'uptime': round(time.time() - self.started_at, 1),
+            'cameras': self.cameras(),
+            'mjpeg_viewers': self.hub.viewers(),
+            'ws_clients': len(self._ws_clients),
+            'frames_encoded': self.hub.frames_encoded,
+            'encode_ms': round(self.hub.encode_ms, 2),
+            'detection_deltas': self.feed.published,
+        }
+        for name, provider in list(self._health.items()):
+            try:
+                data[name] = provider()
+            except Exception as e:
+                data[name] = {'error': str(e)}
+        return data
+
+    def metrics(self):
+        lines = [
+            '# TYPE rtsp_api_uptime_seconds gauge',
+            f'rtsp_api_uptime_seconds {time.time() - self.started_at:.1f}',
+            '# TYPE rtsp_api_requests_total counter',
+            f'rtsp_api_requests_total {self.requests}',
+            '# TYPE rtsp_api_frames_encoded_total counter',
+            f'rtsp_api_frames_encoded_total {self.hub.frames_encoded}',
+            '# TYPE rtsp_api_encode_ms gauge',
+            f'rtsp_api_encode_ms {self.hub.encode_ms:.2f}',
+            '# TYPE rtsp_api_rejected_total counter',
+            f'rtsp_api_rejected_total {self.rejected}',
+            '# TYPE rtsp_api_ws_clients gauge',
+            f'rtsp_api_ws_clients {len(self._ws_clients)}',
+            '# TYPE rtsp_api_ws_resyncs_total counter',
+            f'rtsp_api_ws_resyncs_total {self.ws_resyncs}',
+            '# TYPE rtsp_api_detection_deltas_total counter',
+            f'rtsp_api_detection_deltas_total {self.feed.published}',
+            '# TYPE rtsp_api_mjpeg_viewers gauge',
+        ]
+        for camera in sorted(self._channels):
+            lines.append(f'rtsp_api_mjpeg_viewers{{camera="{camera}"}} {self.hub.viewers(camera)}')
+        if self.snapshot_service is not None:
+            lines.append('# TYPE rtsp_snapshot_events_total counter')
+            for k, v in sorted(self.snapshot_service.stats.items()):
+                lines.append(f'rtsp_snapshot_events_total{{event="{k}"}} {v}')
+        for name, provider in list(self._metrics.items()):
+            try:
+                values = provider()
+            except Exception:
+                continue
+            for k, v in sorted(values.items()):
+                if isinstance(v, (bool, int, float)):
+                    lines.append(f'# TYPE rtsp_{name}_{k} gauge')
+                    lines.append(f'rtsp_{name}_{k} {int(v) if isinstance(v, (bool, int)) else round(v, 3)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,66 @@
+"""
+最小化的 WebSocket（RFC 6455）服务端实现
+只支持服务端需要的部分：握手、发送文本帧、读取客户端帧（自动回复 ping、处理 close）。
+"""
+import base64
+import hashlib
+import struct
+
+_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+def accept_key(key):
+    """Sec-WebSocket-Accept 的值"""
+    digest = hashlib.sha1((key.strip() + _GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def handshake_response(key):
+    return ("HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n").encode('ascii')
+
+
+def encode_frame(payload, opcode=OP_TEXT):
+    """服务端发出的帧（不加掩码）；文本消息可预先编码一次再发给所有订阅者"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_frame(reader, max_size=1 << 20):
+    """读取一个客户端帧，返回 (opcode, payload)"""
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > max_size:
+        raise WebSocketClosed('帧过大')
+    mask = await reader.readexactly(4) if masked else None
+    payload = await reader.readexactly(length) if length else b''
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
@@ -0,0 +1,217 @@
+"""
+检测事件存储模块
+把每次检测得到的目标（摄像机、帧时间、类别、置信度、框、轨迹 ID）追加写入 SQLite（WAL 模式）。
+检测线程只把记录放进队列，由独立的写线程批量插入，数据库再慢也不会拖住检测；
+按 (camera, ts) 与 (class, ts) 建索引，支持时间范围、类别查询和按分钟聚合统计。
+"""
+import os
+import queue
+import sqlite3
+import time
+from threading import Thread, Event, local
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    ts REAL NOT NULL,
+    class TEXT NOT NULL,
+    conf REAL NOT NULL,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    track_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_events_camera_ts ON events (camera, ts);
+CREATE INDEX IF NOT EXISTS idx_events_class_ts ON events (class, ts);
+"""
+
+_INSERT = "INSERT INTO events (camera, ts, class, conf, x1, y1, x2, y2, track_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+class EventStore:
+    """只追加的检测事件库
+
+    path: 数据库文件路径
+    batch_size: 单个事务最多插入的行数
+    flush_interval: 队列不满一批时最长等待多久提交一次（秒）
+    max_queue: 队列上限；写入跟不上时丢弃新记录并计数，而不是阻塞检测线程
+    """
+    def __init__(self, path=None, batch_size=1000, flush_interval=0.5, max_queue=100000):
+        self.path = path or os.path.join(os.getcwd(), 'cache', 'events.db')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.inserted = 0
+        self.dropped = 0
+        self.last_batch_ms = 0.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = local()
+        self._closed = Event()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = self._open()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self._thread = Thread(target=self._writer, name='event-store', daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')  # WAL 下只在检查点 fsync，断电最多丢最后几个事务
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _reader(self):
+        """每个查询线程一个只读连接（WAL 下读不阻塞写）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    # ---- 写入 ----
+
+    def add(self, camera, timestamp, class_name, conf, box, track_id=None):
+        """登记一个目标（非阻塞）"""
+        x1, y1, x2, y2 = (int(v) for v in box[:4])
+        self._put((camera, float(timestamp), class_name, float(conf), x1, y1, x2, y2, track_id))
+
+    def add_detections(self, camera, timestamp, detections):
+        """登记检测线程输出的 [x1, y1, x2, y2, conf, class_id, class_name] 列表"""
+        for det in detections:
+            self.add(camera, timestamp, det[6], det[4], det[:4])
+
+    def add_tracks(self, camera, timestamp, tracks):
+        """登记 IoUTracker.update 返回的轨迹（带轨迹 ID）"""
+        for t in tracks:
+            self.add(camera, timestamp, t.class_name, t.conf, t.box, t.track_id)
+
+    def _put(self, row):
+        if self._closed.is_set():
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer(self):
+        conn = self._open()
+        while True:
+            batch = []
+            waiters = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._closed.set()
+                    break
+                if isinstance(item, Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+            if batch:
+                start = time.perf_counter()
+                try:
+                    with conn:
+                        conn.executemany(_INSERT, batch)
+                    self.inserted += len(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    print(f"写入检测事件失败: {e}")
+                self.last_batch_ms = (time.perf_counter() - start) * 1000
+            for w in waiters:
+                w.set()
+            if self._closed.is_set() and self._queue.empty():
+                break
+        conn.close()
+
+    def flush(self, timeout=5.0):
+        """等待此前登记的记录全部写入，最多 timeout 秒（包括队列已满时等待入队的时间）"""
+        if self._closed.is_set():
+            return False
+        deadline = time.time() + timeout
+        done = Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(max(0.0, deadline - time.time()))
+
+    def close(self, timeout=5.0):
+        """写完队列中剩余的记录后关闭"""
+        if not self._closed.is_set():
+            self._queue.put(None)
+        self._thread.join(timeout)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---- 查询 ----
+
+    @staticmethod
+    def _where(camera=None, class_name=None, start=None, end=None, min_conf=None):
+        clauses, params = [], []
+        if camera is not None:
+            clauses.append('camera = ?')
+            params.append(camera)
+        if class_name is not None:
+            clauses.append('class = ?')
+            params.append(class_name)
+        if start is not None:
+            clauses.append('ts >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('ts < ?')
+            params.append(end)
+        if min_conf is not None:
+            clauses.append('conf >= ?')
+            params.append(min_conf)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, camera=None, class_name=None, start=None, end=None, min_conf=None, limit=1000,
+              newest_first=True):
+        """按摄像机/类别/时间范围查询，返回 dict 列表"""
+        where, params = self._where(camera, class_name, start, end, min_conf)
+        order = 'DESC' if newest_first else 'ASC'
+        sql = f"SELECT * FROM events{where} ORDER BY ts {order} LIMIT ?"
+        rows = self._reader().execute(sql, params + [int(limit)]).fetchall()
+        return [dict(r) for r in rows]
+
+    def recent(self, seconds, camera=None, class_name=None, **kwargs):
+        """最近 seconds 秒内的记录，例如 recent(3600, camera='cam3', class_name='drone')"""
+        return self.query(camera=camera, class_name=class_name, start=time.time() - seconds, **kwargs)
+
+    def counts_per_minute(self, start=None, end=None, camera=None, class_name=None):
+        """按分钟聚合：[(分钟起点时间戳, 类别, 检测次数, 不同轨迹数), ...]"""
+        start = start if start is not None else time.time() - 3600
+        where, params = self._where(camera, class_name, start, end)
+        sql = (f"SELECT CAST(ts / 60 AS INTEGER) * 60 AS minute, class, COUNT(*) AS n, "
+               f"COUNT(DISTINCT track_id) AS objects FROM events{where} "
+               f"GROUP BY minute, class ORDER BY minute")
+        return [tuple(r) for r in self._reader().execute(sql, params).fetchall()]
+
+    def class_counts(self, start=None, end=None, camera=None):
+        """各类别的检测次数与不同轨迹数：{class: (n, objects)}"""
+        where, params = self._where(camera, None, start, end)
+        sql = f"SELECT class, COUNT(*), COUNT(DISTINCT track_id) FROM events{where} GROUP BY class"
+        return {r[0]: (r[1], r[2]) for r in self._reader().execute(sql, params).fetchall()}
+
+    def cameras(self):
+        return [r[0] for r in self._reader().execute('SELECT DISTINCT camera FROM events').fetchall()]
+
+    def prune(self, older_than):
+        """删除 older_than（时间戳）之前的记录，返回删除行数"""
+        conn = self._reader()
+        with conn:
+            cur = conn.execute('DELETE FROM events WHERE ts < ?', (older_than,))
+        return cur.rowcount
+
+    def stats(self):
+        return {
+            'inserted': self.inserted,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize(),
+            'last_batch_ms': self.last_batch_ms,
+        }
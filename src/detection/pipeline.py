@@ -0,0 +1,275 @@
+"""
+检测流水线阶段
+生产者（解码线程）只调用 submit，永不阻塞；每个阶段有自己的有界输入队列、丢弃策略、工作线程与计数器：
+- drop_oldest: 队列满时丢弃最早的一项（保留最近 N 项，按顺序处理）
+- drop_newest: 队列满时拒绝新提交的一项（先到先处理）
+- latest_only: 新提交总是替换队列中尚未处理的项（只处理最新一帧，延迟最小）
+每次丢弃都会计数，阶段可以停止后重新启动。处理结果由 ResultCoalescer 按界面刷新率合并后投递。
+"""
+import time
+from collections import deque
+from threading import Thread, Event, Condition, Lock, current_thread
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+LATEST_ONLY = 'latest_only'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, LATEST_ONLY)
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class BoundedQueue:
+    """带丢弃策略的有界队列：put 从不阻塞，get 可超时等待；close 后唤醒所有等待者"""
+    def __init__(self, maxsize=1, policy=LATEST_ONLY):
+        if policy not in POLICIES:
+            raise ValueError(f"未知的丢弃策略: {policy}，可选: {', '.join(POLICIES)}")
+        if maxsize < 1:
+            raise ValueError(f"队列容量必须不小于 1: {maxsize}")
+        self.maxsize = 1 if policy == LATEST_ONLY else maxsize
+        self.policy = policy
+        self._items = deque()
+        self._cond = Condition(Lock())
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        """放入一项，返回该项是否被接受（drop_newest 且队列已满时返回 False）"""
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                # drop_oldest / latest_only：挤掉最早的项
+                while len(self._items) >= self.maxsize:
+                    self._items.popleft()
+                    self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+            return True
+
+    def get(self, timeout=None):
+        """取出一项；超时返回 None，队列关闭时抛出 QueueClosed"""
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items:
+                if self._closed:
+                    raise QueueClosed()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._items.popleft()
+
+    def clear(self):
+        """丢弃所有未处理的项（计入 dropped），返回丢弃数"""
+        with self._cond:
+            n = len(self._items)
+            self._items.clear()
+            self.dropped += n
+            return n
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class PipelineStage:
+    """流水线中的一个阶段：有界输入队列 + 一个工作线程
+
+    handler(item) 的返回值传给 on_result(result, item)（在工作线程中调用）；
+    handler 抛出的异常计入 errors，不会终止工作线程。
+    submit 的 timestamp 为该项的采集时间，用于统计从采集到处理完成的端到端延迟。
+    """
+    def __init__(self, name, handler, maxsize=1, policy=LATEST_ONLY, on_result=None):
+        self.name = name
+        self.handler = handler
+        self.on_result = on_result
+        self.maxsize = maxsize
+        self.policy = policy
+        self._queue = BoundedQueue(maxsize, policy)
+        self._thread = None
+        self._stop = Event()
+        self._lock = Lock()
+        self.submitted = 0
+        self.processed = 0
+        self.errors = 0
+        self._dropped_before = 0  # 之前各次运行累计的丢弃数
+        self.busy_ms = 0.0  # 处理耗时（指数滑动平均）
+        self.max_busy_ms = 0.0
+        self.latency_ms = 0.0  # 采集到处理完成（指数滑动平均）
+        self._done_times = deque(maxlen=30)
+        self._busy_total = 0.0
+        self.started_at = 0.0
+
+    # ---- 生命周期 ----
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def start(self):
+        """启动工作线程（已在运行时直接返回）；停止后可再次启动"""
+        with self._lock:
+            if self.is_running:
+                return self
+            self._dropped_before += self._queue.dropped
+            self._queue = BoundedQueue(self.maxsize, self.policy)
+            self._stop = Event()
+            self.started_at = time.time()
+            self._busy_total = 0.0
+            self._thread = Thread(target=self._run, args=(self._queue, self._stop),
+                                  name=f"stage-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        """停止工作线程并丢弃未处理的项；等待当前一项处理完成（最多 timeout 秒）
+
+        界面线程调用时应传 timeout=0：处理中的一项可能正需要回调界面线程，等待会互相阻塞。
+        停止后处理完的那一项不再调用 on_result。
+        """
+        with self._lock:
+            thread = self._thread
+            self._stop.set()
+            pending = self._queue.clear()
+            self._queue.close()
+        if pending:
+            print(f"[{self.name}] 停止，丢弃 {pending} 项未处理数据")
+        if timeout and thread is not None and thread.is_alive() and thread is not current_thread():
+            thread.join(timeout)
+            if thread.is_alive():
+                print(f"[{self.name}] 工作线程未在 {timeout}s 内退出（当前处理仍在进行）")
+        return pending
+
+    # ---- 生产者接口 ----
+
+    def submit(self, item, timestamp=None):
+        """提交一项（不阻塞），返回是否被接受；阶段未运行时直接拒绝"""
+        if not self.is_running:
+            return False
+        self.submitted += 1
+        return self._queue.put((item, timestamp or time.time()))
+
+    # ---- 工作线程 ----
+
+    def _run(self, q, stop):
+        while not stop.is_set():
+            try:
+                entry = q.get(timeout=0.5)
+            except QueueClosed:
+                break
+            if entry is None:
+                continue
+            item, timestamp = entry
+            start = time.perf_counter()
+            try:
+                result = self.handler(item)
+            except Exception as e:
+                self.errors += 1
+                # 连续出错时只打印前几次和之后每 100 次，避免刷屏
+                if self.errors <= 3 or self.errors % 100 == 0:
+                    print(f"[{self.name}] 处理错误（累计 {self.errors} 次）: {e}")
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            done = time.time()
+            self._record(elapsed, (done - timestamp) * 1000, done)
+            if self.on_result is not None and not stop.is_set():
+                try:
+                    self.on_result(result, item)
+                except Exception as e:
+                    print(f"[{self.name}] 结果投递错误: {e}")
+
+    def _record(self, busy_ms, latency_ms, done):
+        first = self.processed == 0
+        self.processed += 1
+        self.busy_ms = busy_ms if first else 0.9 * self.busy_ms + 0.1 * busy_ms
+        self.latency_ms = latency_ms if first else 0.9 * self.latency_ms + 0.1 * latency_ms
+        self.max_busy_ms = max(self.max_busy_ms, busy_ms)
+        self._busy_total += busy_ms / 1000
+        self._done_times.append(done)
+
+    # ---- 统计 ----
+
+    @property
+    def dropped(self):
+        return self._dropped_before + self._queue.dropped
+
+    @property
+    def rate(self):
+        """最近的处理速率（次/秒）"""
+        times = list(self._done_times)
+        if len(times) < 2:
+            return 0.0
+        span = max(times[-1], time.time() - 1.0) - times[0]
+        return (len(times) - 1) / span if span > 0 else 0.0
+
+    def stats(self):
+        """可 JSON 序列化的计数器快照"""
+        running_for = time.time() - self.started_at if self.is_running else 0.0
+        return {
+            'running': self.is_running,
+            'policy': self.policy,
+            'queue_depth': len(self._queue),
+            'queue_size': self._queue.maxsize,
+            'submitted': self.submitted,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'rate': round(self.rate, 2),
+            'busy_ms': round(self.busy_ms, 1),
+            'max_busy_ms': round(self.max_busy_ms, 1),
+            'latency_ms': round(self.latency_ms, 1),
+            # 工作线程忙碌时间占比：接近 1 表示检测已饱和，提交间隔再小也只会增加丢弃
+            'utilization': round(min(1.0, self._busy_total / running_for), 3) if running_for > 1 else 0.0,
+        }
+
+
+class ResultCoalescer:
+    """把高频结果合并到界面刷新率：任意线程 post，主线程最多每 min_interval 秒收到一次最新结果
+
+    schedule(delay_ms, fn): 把 fn 安排到界面线程执行（例如 widget.after）
+    已有一次投递在排队时，新结果只替换待投递的值，不再重复安排。
+    """
+    def __init__(self, schedule, callback, min_interval=0.2):
+        self.schedule = schedule
+        self.callback = callback
+        self.min_interval = min_interval
+        self._lock = Lock()
+        self._pending = False
+        self._value = None
+        self._last_delivery = 0.0
+        self.posted = 0
+        self.delivered = 0
+
+    def post(self, *args):
+        with self._lock:
+            self.posted += 1
+            self._value = args
+            if self._pending:
+                return
+            self._pending = True
+            delay = max(0.0, self.min_interval - (time.monotonic() - self._last_delivery))
+        try:
+            self.schedule(int(delay * 1000), self._deliver)
+        except Exception:
+            # 界面已销毁
+            with self._lock:
+                self._pending = False
+
+    def _deliver(self):
+        with self._lock:
+            args, self._value = self._value, None
+            self._pending = False
+            self._last_delivery = time.monotonic()
+        if args is None:
+            return
+        self.delivered += 1
+        self.callback(*args)
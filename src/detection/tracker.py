@@ -0,0 +1,110 @@
+"""
+简单的 IoU 目标跟踪模块
+把相邻两次检测的框按 IoU 贪心匹配，给同一目标分配稳定的 ID，并估计中心点速度（像素/秒），
+供自动跟踪等需要"同一个目标"的功能使用。
+"""
+import time
+from itertools import count
+
+
+def box_iou(a, b):
+    """两个 (x1, y1, x2, y2) 框的交并比"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter <= 0:
+        return 0.0
+    area_a = max(0, a[2] - a[0]) * max(0, a[3] - a[1])
+    area_b = max(0, b[2] - b[0]) * max(0, b[3] - b[1])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """一条目标轨迹"""
+    def __init__(self, track_id, box, conf, class_name, timestamp):
+        self.track_id = track_id
+        self.box = box
+        self.conf = conf
+        self.class_name = class_name
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+        self.missed = 0
+        self.velocity = (0.0, 0.0)  # 中心点速度（像素/秒）
+
+    @property
+    def center(self):
+        return ((self.box[0] + self.box[2]) / 2.0, (self.box[1] + self.box[3]) / 2.0)
+
+    @property
+    def area(self):
+        return max(0, self.box[2] - self.box[0]) * max(0, self.box[3] - self.box[1])
+
+    def update(self, box, conf, timestamp, smoothing=0.5):
+        old_cx, old_cy = self.center
+        dt = timestamp - self.last_seen
+        self.box = box
+        self.conf = conf
+        if dt > 0:
+            cx, cy = self.center
+            vx, vy = (cx - old_cx) / dt, (cy - old_cy) / dt
+            # 指数平滑，抑制检测框抖动带来的速度噪声
+            self.velocity = (smoothing * vx + (1 - smoothing) * self.velocity[0],
+                             smoothing * vy + (1 - smoothing) * self.velocity[1])
+        self.last_seen = timestamp
+        self.hits += 1
+        self.missed = 0
+
+
+class IoUTracker:
+    """贪心 IoU 匹配跟踪器
+
+    detections 为检测线程输出的 [x1, y1, x2, y2, conf, class_id, class_name] 列表；
+    只有同类别的框才会匹配；连续 max_missed 次未匹配的轨迹被删除。
+    """
+    def __init__(self, iou_threshold=0.3, max_missed=5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []
+        self._ids = count(1)
+
+    def update(self, detections, timestamp=None):
+        """用一次检测结果更新轨迹，返回当前仍被检测到的轨迹"""
+        timestamp = timestamp if timestamp is not None else time.time()
+        candidates = []
+        for ti, track in enumerate(self.tracks):
+            for di, det in enumerate(detections):
+                if det[6] != track.class_name:
+                    continue
+                iou = box_iou(track.box, det[:4])
+                if iou >= self.iou_threshold:
+                    candidates.append((iou, ti, di))
+        candidates.sort(reverse=True)
+        matched_tracks, matched_dets = set(), set()
+        for iou, ti, di in candidates:
+            if ti in matched_tracks or di in matched_dets:
+                continue
+            det = detections[di]
+            self.tracks[ti].update(tuple(det[:4]), det[4], timestamp)
+            matched_tracks.add(ti)
+            matched_dets.add(di)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        for di, det in enumerate(detections):
+            if di not in matched_dets:
+                self.tracks.append(Track(next(self._ids), tuple(det[:4]), det[4], det[6], timestamp))
+        return [t for t in self.tracks if t.missed == 0]
+
+    def get(self, track_id):
+        for t in self.tracks:
+            if t.track_id == track_id:
+                return t
+        return None
+
+    def reset(self):
+        self.tracks = []
@@ -5,13 +5,30 @@ YOLO目标检测器模块
 from threading import Lock
 from PIL import Image, ImageDraw, ImageFont
 
-# YOLO相关导入（可选，如果未安装则使用占位实现）
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-except ImportError:
-    YOLO_AVAILABLE = False
-    print("警告: ultralytics未安装，智能模式将不可用。请运行: pip install ultralytics")
+from src.utils.lazy_import import module_available, optional_import
+
+# YOLO相关导入（可选）：ultralytics 会连带导入 torch，耗时数秒，
+# 因此只在第一次创建检测器（或后台预加载）时导入，启动时只检查是否已安装
+YOLO = None
+
+
+def load_yolo():
+    """导入 ultralytics 并返回 YOLO 类，未安装时返回 None"""
+    global YOLO
+    if YOLO is None:
+        module = optional_import('ultralytics')
+        if module is None:
+            print("警告: ultralytics未安装，智能模式将不可用。请运行: pip install ultralytics")
+            return None
+        YOLO = module.YOLO
+    return YOLO
+
+
+def __getattr__(name):
+    # YOLO_AVAILABLE 按需计算（只查找包，不导入）
+    if name == 'YOLO_AVAILABLE':
+        return module_available('ultralytics')
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 
 class YOLODetector:
@@ -27,7 +44,8 @@ class YOLODetector:
         self.device = device
         self.use_fp16 = use_fp16
 
-        if not YOLO_AVAILABLE:
+        YOLO = load_yolo()
+        if YOLO is None:
             print("YOLO不可用，智能模式将无法使用")
             return
 
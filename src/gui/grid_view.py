@@ -0,0 +1,255 @@
+"""
+多摄像机宫格预览窗口
+1 / 4 / 9 / 16 宫格，每格的解码尺寸与帧率跟随格子在屏幕上的大小（见 plan_tile），
+双击某格放大为全屏解码，其余格子降为仅关键帧；窗口最小化或翻页后不可见的格子挂起解码。
+首帧到达之前先显示快照服务中的缓存预览，解码出的画面也顺带刷新快照缓存。
+"""
+import io
+import tkinter as tk
+from tkinter import ttk, Label
+from collections import namedtuple
+
+from PIL import Image, ImageTk
+
+from src.rtsp.tile_decoder import TileDecoder, plan_tile
+
+# 一路可显示的摄像机：名称、主码流地址、子码流地址（可为 None）、快照缓存 ID
+GridSource = namedtuple('GridSource', 'name main_url sub_url snapshot_id')
+
+GRID_SIZES = (1, 4, 9, 16)
+
+
+class GridView(tk.Toplevel):
+    """宫格预览窗口"""
+    def __init__(self, parent, sources, snapshot_service=None, stream_info_cache=None, on_close=None,
+                 on_select=None):
+        tk.Toplevel.__init__(self, parent)
+        self.title("多画面预览")
+        self.geometry("1280x760")
+        self.configure(bg="#000000")
+        self.sources = list(sources)
+        self.snapshot_service = snapshot_service
+        self.stream_info_cache = stream_info_cache
+        self._on_close_cb = on_close
+        self._on_select_cb = on_select  # on_select(source)：把某路设为主画面
+        self.grid_size = 4 if len(self.sources) > 1 else 1
+        self.page = 0
+        self.focused = None  # 被放大的源序号
+        self._mapped = True
+        self._decoders = {}  # 源序号 -> TileDecoder
+        self._tiles = []  # [(frame, label, caption)]
+        self._shown = {}  # 格子序号 -> (源序号, 帧序号)
+        self._images = {}
+        self._layout_job = None
+        self._closed = False
+
+        self.size_var = tk.StringVar(value=str(self.grid_size))
+        self._create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.bind('<Unmap>', self._on_unmap)
+        self.bind('<Map>', self._on_map)
+        self.after(100, self._build_tiles)
+        self.after(40, self._pump)
+
+    def _create_widgets(self):
+        bar = tk.Frame(self, bg="#1a1a1a")
+        bar.pack(fill=tk.X)
+        tk.Label(bar, text="宫格:", bg="#1a1a1a", fg="#a0a0a0", font=('Segoe UI', 8)).pack(side=tk.LEFT, padx=(6, 2))
+        size_combo = ttk.Combobox(bar, textvariable=self.size_var, width=4, state='readonly',
+                                  values=[str(n) for n in GRID_SIZES])
+        size_combo.pack(side=tk.LEFT, pady=3)
+        size_combo.bind('<<ComboboxSelected>>', lambda e: self.set_grid_size(int(self.size_var.get())))
+        ttk.Button(bar, text="◀", width=3, command=lambda: self.set_page(self.page - 1)).pack(side=tk.LEFT, padx=(8, 1))
+        ttk.Button(bar, text="▶", width=3, command=lambda: self.set_page(self.page + 1)).pack(side=tk.LEFT, padx=1)
+        self.page_label = tk.Label(bar, text="", bg="#1a1a1a", fg="#a0a0a0", font=('Segoe UI', 8))
+        self.page_label.pack(side=tk.LEFT, padx=6)
+        self.stats_label = tk.Label(bar, text="", bg="#1a1a1a", fg="#00d4aa", font=('Segoe UI', 8))
+        self.stats_label.pack(side=tk.RIGHT, padx=6)
+        self.grid_frame = tk.Frame(self, bg="#000000")
+        self.grid_frame.pack(fill=tk.BOTH, expand=True)
+        self.grid_frame.bind('<Configure>', lambda e: self._schedule_layout())
+
+    # ---- 布局 ----
+
+    @property
+    def page_count(self):
+        return max(1, -(-len(self.sources) // self.grid_size))
+
+    def visible_sources(self):
+        """当前页显示的源序号（放大时只有一个）"""
+        if self.focused is not None:
+            return [self.focused]
+        start = self.page * self.grid_size
+        return list(range(start, min(start + self.grid_size, len(self.sources))))
+
+    def set_grid_size(self, n):
+        self.grid_size = n if n in GRID_SIZES else 4
+        self.page = min(self.page, self.page_count - 1)
+        self.focused = None
+        self._build_tiles()
+
+    def set_page(self, page):
+        if 0 <= page < self.page_count:
+            self.page = page
+            self.focused = None
+            self._build_tiles()
+
+    def toggle_focus(self, source_index):
+        """放大/还原某一格"""
+        self.focused = None if self.focused == source_index else source_index
+        self._build_tiles()
+
+    def _build_tiles(self):
+        if self._closed:
+            return
+        for frame, _, _ in self._tiles:
+            frame.destroy()
+        self._tiles, self._shown, self._images = [], {}, {}
+        visible = self.visible_sources()
+        cols = 1 if self.focused is not None else int(self.grid_size ** 0.5)
+        for i in range(cols * cols):
+            self.grid_frame.grid_rowconfigure(i // cols, weight=1, uniform='row')
+            self.grid_frame.grid_columnconfigure(i % cols, weight=1, uniform='col')
+        for r in range(cols, 4):
+            self.grid_frame.grid_rowconfigure(r, weight=0, uniform='')
+            self.grid_frame.grid_columnconfigure(r, weight=0, uniform='')
+        for slot, source_index in enumerate(visible):
+            frame = tk.Frame(self.grid_frame, bg="#000000", highlightthickness=1, highlightbackground="#333333")
+            frame.grid(row=slot // cols, column=slot % cols, sticky='nsew')
+            label = Label(frame, bg="#000000", borderwidth=0)
+            label.pack(fill=tk.BOTH, expand=True)
+            caption = tk.Label(frame, text=self.sources[source_index].name, bg="#000000", fg="#a0a0a0",
+                               font=('Segoe UI', 8))
+            caption.place(x=4, y=2)
+            for widget in (label, caption):
+                widget.bind('<Double-Button-1>', lambda e, s=source_index: self.toggle_focus(s))
+                if self._on_select_cb:
+                    widget.bind('<Button-3>', lambda e, s=source_index: self._on_select_cb(self.sources[s]))
+            self._tiles.append((frame, label, caption))
+        self.page_label.config(text=f"第 {self.page + 1}/{self.page_count} 页  共 {len(self.sources)} 路")
+        self._schedule_layout()
+
+    def _schedule_layout(self):
+        # 拖动窗口边框时会连续触发，合并后再调整解码尺寸（尺寸变化需要重启解码进程）
+        if self._layout_job is not None:
+            self.after_cancel(self._layout_job)
+        self._layout_job = self.after(300, self._apply_plan)
+
+    def _apply_plan(self):
+        """按每格当前尺寸与可见性重新配置所有解码器"""
+        self._layout_job = None
+        if self._closed:
+            return
+        self.update_idletasks()
+        visible = self.visible_sources()
+        for slot, source_index in enumerate(visible):
+            label = self._tiles[slot][1] if slot < len(self._tiles) else None
+            w = label.winfo_width() if label is not None else 0
+            h = label.winfo_height() if label is not None else 0
+            if w < 32 or h < 18:
+                w, h = 320, 180
+            self._configure(source_index, w, h, visible=self._mapped, background=False)
+        page_start = self.page * self.grid_size
+        page_sources = range(page_start, min(page_start + self.grid_size, len(self.sources)))
+        for source_index in range(len(self.sources)):
+            if source_index in visible:
+                continue
+            # 放大时同页的其它格子降为仅关键帧的缩略图（连接保持，快照持续刷新）；其余页的格子挂起
+            background = self.focused is not None and source_index in page_sources and self._mapped
+            self._configure(source_index, 0, 0, visible=background, background=background)
+
+    def _configure(self, source_index, w, h, visible, background):
+        source = self.sources[source_index]
+        width, height, use_main, policy = plan_tile(w, h, visible=visible, background=background)
+        decoder = self._decoders.get(source_index)
+        if decoder is None:
+            if policy.is_paused:
+                return
+            decoder = TileDecoder(source.name, stream_info_cache=self.stream_info_cache)
+            self._decoders[source_index] = decoder
+        url = source.main_url if use_main or not source.sub_url else source.sub_url
+        decoder.configure(url, width, height, policy)
+
+    def _on_unmap(self, event):
+        if event.widget is self and self._mapped:
+            self._mapped = False
+            self._apply_plan()
+
+    def _on_map(self, event):
+        if event.widget is self and not self._mapped:
+            self._mapped = True
+            self._apply_plan()
+
+    # ---- 显示 ----
+
+    def _pump(self):
+        if self._closed:
+            return
+        total_fps = 0.0
+        pixels = 0
+        for decoder in self._decoders.values():
+            decoder.poll()
+            total_fps += decoder.fps
+            if decoder.fps and decoder.size:
+                pixels += decoder.size[0] * decoder.size[1] * decoder.fps
+        for slot, source_index in enumerate(self.visible_sources()):
+            if slot >= len(self._tiles):
+                break
+            label = self._tiles[slot][1]
+            decoder = self._decoders.get(source_index)
+            frame, seq, size = decoder.latest() if decoder is not None else (None, 0, None)
+            if frame is not None and size and len(frame) == size[0] * size[1] * 3:
+                if self._shown.get(slot) == (source_index, seq):
+                    continue
+                self._shown[slot] = (source_index, seq)
+                img = Image.frombytes('RGB', size, frame)
+                self._tap_snapshot(source_index, img)
+            elif slot not in self._shown:
+                self._shown[slot] = (source_index, -1)
+                img = self._snapshot_image(source_index, label)
+                if img is None:
+                    continue
+            else:
+                continue
+            try:
+                self._images[slot] = ImageTk.PhotoImage(image=img)
+                label.config(image=self._images[slot])
+            except Exception as e:
+                print(f"宫格显示错误: {e}")
+        self.stats_label.config(text=f"解码 {len(self._running())} 路  {total_fps:.0f} fps  "
+                                     f"{pixels / 1e6:.1f} MP/s")
+        self.after(40, self._pump)
+
+    def _running(self):
+        return [d for d in self._decoders.values() if d.policy is not None and not d.policy.is_paused]
+
+    def _tap_snapshot(self, source_index, img):
+        """正在解码的格子顺便刷新快照缓存（未过期时立即返回），API 等读者无需再单独抓取"""
+        snapshot_id = self.sources[source_index].snapshot_id
+        if self.snapshot_service is not None and snapshot_id:
+            self.snapshot_service.tap(snapshot_id, img)
+
+    def _snapshot_image(self, source_index, label):
+        """首帧到达前显示快照缓存中的预览（只读缓存，不为此另起抓取进程）"""
+        snapshot_id = self.sources[source_index].snapshot_id
+        if self.snapshot_service is None or not snapshot_id:
+            return None
+        snap = self.snapshot_service.get(snapshot_id, refresh=False)
+        if snap is None:
+            return None
+        try:
+            img = Image.open(io.BytesIO(snap.jpeg))
+            w, h = max(label.winfo_width(), 32), max(label.winfo_height(), 18)
+            img.thumbnail((w, h))
+            return img
+        except Exception:
+            return None
+
+    def close(self):
+        self._closed = True
+        for decoder in self._decoders.values():
+            decoder.stop()
+        self._decoders = {}
+        if self._on_close_cb:
+            self._on_close_cb()
+        self.destroy()
@@ -0,0 +1,349 @@
+"""
+录像回放窗口
+打开 recordings/ 下某路摄像机的分段录像：时间轴显示录像覆盖范围与检测事件标记，
+悬停/拖动时显示关键帧缩略图，点击即按关键帧索引定位，支持 0.25x ~ 16x 变速。
+"""
+import os
+import time
+import tkinter as tk
+from tkinter import ttk, Label
+from threading import Lock, Thread
+
+from PIL import Image, ImageTk
+
+from src.rtsp.playback import Timeline, SegmentPlayer, ThumbnailCache, SPEEDS
+
+_CLASS_COLORS = {'person': '#ff5555', 'drone': '#00d4ff', 'car': '#55ff55'}
+_RANGES = (('1小时', 3600), ('6小时', 6 * 3600), ('24小时', 24 * 3600), ('全部', None))
+
+
+def list_recordings(recordings_dir):
+    """recordings_dir 下带分段索引的摄像机目录名"""
+    try:
+        names = sorted(os.listdir(recordings_dir))
+    except OSError:
+        return []
+    return [n for n in names if os.path.exists(os.path.join(recordings_dir, n, 'index.jsonl'))]
+
+
+class PlaybackWindow(tk.Toplevel):
+    """回放窗口
+
+    event_store: 检测事件库（可为 None），摄像机 ID 与录像目录名一致（safe_name(url)）
+    """
+    def __init__(self, parent, recordings_dir, event_store=None, camera=None, on_close=None):
+        tk.Toplevel.__init__(self, parent)
+        self.title("录像回放")
+        self.geometry("960x640")
+        self.configure(bg="#1a1a1a")
+        self.recordings_dir = recordings_dir
+        self.event_store = event_store
+        self._on_close_cb = on_close
+        self.timeline = None
+        self.player = None
+        self.thumbs = None
+        self.view_start = self.view_end = 0.0
+        self._frame_lock = Lock()
+        self._frame = None  # (rgb_bytes, wallclock, size)
+        self._frame_seq = 0
+        self._shown_seq = 0
+        self._imgtk = None
+        self._thumb_imgtk = None
+        self._hover_time = None
+        self._closed = False
+        # 事件标记：查询在后台线程中进行，同一时间只查一次，界面先沿用上一次的结果
+        self._marker_rows = []
+        self._marker_key = None  # 当前结果对应的 (摄像机, 起, 止)
+        self._marker_pending = None  # 最近一次请求的 (摄像机, 起, 止)
+        self._marker_busy = False
+
+        self.camera_var = tk.StringVar(value=camera or '')
+        self.speed_var = tk.StringVar(value='1x')
+        self._create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        cameras = list_recordings(recordings_dir)
+        self.camera_combo['values'] = cameras
+        if not self.camera_var.get() and cameras:
+            self.camera_var.set(cameras[0])
+        if self.camera_var.get():
+            self.after(50, self.open_camera)
+        self.after(15, self._pump_frames)
+
+    def _create_widgets(self):
+        bar = tk.Frame(self, bg="#1a1a1a")
+        bar.pack(fill=tk.X, padx=6, pady=4)
+        tk.Label(bar, text="摄像机:", bg="#1a1a1a", fg="#a0a0a0", font=('Segoe UI', 8)).pack(side=tk.LEFT)
+        self.camera_combo = ttk.Combobox(bar, textvariable=self.camera_var, width=32, state='readonly')
+        self.camera_combo.pack(side=tk.LEFT, padx=(4, 10))
+        self.camera_combo.bind('<<ComboboxSelected>>', lambda e: self.open_camera())
+        for text, seconds in _RANGES:
+            ttk.Button(bar, text=text, width=6, style='Small.TButton',
+                       command=lambda s=seconds: self.set_range(s)).pack(side=tk.LEFT, padx=1)
+        self.play_button = ttk.Button(bar, text="▶", width=3, command=self.toggle_play)
+        self.play_button.pack(side=tk.LEFT, padx=(10, 2))
+        speed_combo = ttk.Combobox(bar, textvariable=self.speed_var, width=6, state='readonly',
+                                   values=[f"{s:g}x" for s in SPEEDS])
+        speed_combo.pack(side=tk.LEFT, padx=2)
+        speed_combo.bind('<<ComboboxSelected>>', self._on_speed_selected)
+        self.time_label = tk.Label(bar, text="--", bg="#1a1a1a", fg="#00d4aa", font=('Consolas', 9, 'bold'))
+        self.time_label.pack(side=tk.LEFT, padx=10)
+        self.status_label = tk.Label(bar, text="", bg="#1a1a1a", fg="#a0a0a0", font=('Segoe UI', 8))
+        self.status_label.pack(side=tk.RIGHT)
+
+        video = tk.Frame(self, bg="#000000")
+        video.pack(fill=tk.BOTH, expand=True)
+        self.panel = Label(video, bg="#000000", relief='flat', borderwidth=0)
+        self.panel.pack(fill=tk.BOTH, expand=True)
+        self.panel.bind('<Configure>', self._on_panel_resize)
+        # 拖动/悬停时间轴时在画面左下角显示缩略图
+        self.thumb_label = Label(video, bg="#000000", borderwidth=1, relief='solid')
+
+        self.canvas = tk.Canvas(self, height=56, bg="#111111", highlightthickness=0)
+        self.canvas.pack(fill=tk.X, padx=6, pady=(2, 6))
+        self.canvas.bind('<Configure>', lambda e: self.draw_timeline())
+        self.canvas.bind('<Motion>', self._on_hover)
+        self.canvas.bind('<Leave>', lambda e: self._hide_thumb())
+        self.canvas.bind('<ButtonPress-1>', self._on_scrub)
+        self.canvas.bind('<B1-Motion>', self._on_scrub)
+        self.canvas.bind('<MouseWheel>', self._on_wheel)
+        self.canvas.bind('<Button-4>', lambda e: self._zoom(0.8, e.x))
+        self.canvas.bind('<Button-5>', lambda e: self._zoom(1.25, e.x))
+
+    # ---- 打开录像 ----
+
+    def open_camera(self):
+        name = self.camera_var.get()
+        if not name:
+            return
+        self._stop_player()
+        self._marker_rows, self._marker_key = [], None  # 不沿用上一路摄像机的标记
+        self.timeline = Timeline(os.path.join(self.recordings_dir, name))
+        span = self.timeline.span()
+        if span is None:
+            self.status_label.config(text="该目录没有已索引的分段")
+            return
+        self.thumbs = ThumbnailCache(self.timeline)
+        w, h = max(self.panel.winfo_width(), 320), max(self.panel.winfo_height(), 180)
+        self.player = SegmentPlayer(self.timeline, w // 2 * 2, h // 2 * 2, self._on_frame)
+        self.set_range(3600)
+        self.player.seek(max(span[0], span[1] - 60))
+
+    def set_range(self, seconds):
+        """时间轴显示最近 seconds 秒（None 为全部录像）"""
+        if self.timeline is None:
+            return
+        self.timeline.reload()
+        span = self.timeline.span()
+        if span is None:
+            return
+        self.view_end = span[1]
+        self.view_start = span[0] if seconds is None else max(span[0], span[1] - seconds)
+        if self.view_end - self.view_start < 60:
+            self.view_start = self.view_end - 60
+        self.draw_timeline()
+
+    # ---- 播放控制 ----
+
+    def toggle_play(self):
+        if self.player is None:
+            return
+        if self.player.playing:
+            self.player.pause()
+            self.play_button.config(text="▶")
+        else:
+            self.player.play()
+            self.play_button.config(text="⏸")
+
+    def _on_speed_selected(self, event=None):
+        if self.player is not None:
+            self.player.set_speed(float(self.speed_var.get().rstrip('x')))
+
+    def _on_panel_resize(self, event):
+        if self.player is not None and event.width > 32 and event.height > 32:
+            if abs(event.width - self.player.width) > 8 or abs(event.height - self.player.height) > 8:
+                self.player.resize(event.width, event.height)
+
+    # ---- 帧显示 ----
+
+    def _on_frame(self, data, wallclock, size):
+        """播放线程回调：只保存最新帧，由主线程定时取用"""
+        with self._frame_lock:
+            self._frame = (data, wallclock, size)
+            self._frame_seq += 1
+
+    def _pump_frames(self):
+        if self._closed:
+            return
+        with self._frame_lock:
+            frame, seq = self._frame, self._frame_seq
+        if frame is not None and seq != self._shown_seq:
+            self._shown_seq = seq
+            data, wallclock, size = frame
+            try:
+                if len(data) == size[0] * size[1] * 3:
+                    self._imgtk = ImageTk.PhotoImage(image=Image.frombytes('RGB', size, data))
+                    self.panel.config(image=self._imgtk)
+                self.time_label.config(text=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(wallclock)))
+                self._move_playhead(wallclock)
+            except Exception as e:
+                print(f"回放显示错误: {e}")
+        if self.player is not None and seq % 10 == 0:
+            self.status_label.config(text=f"定位 {self.player.seek_latency_ms:.0f}ms  丢帧 {self.player.dropped}")
+        self.after(15, self._pump_frames)
+
+    # ---- 时间轴 ----
+
+    def _x_to_time(self, x):
+        width = max(self.canvas.winfo_width(), 1)
+        return self.view_start + (self.view_end - self.view_start) * min(max(x, 0), width) / width
+
+    def _time_to_x(self, t):
+        width = max(self.canvas.winfo_width(), 1)
+        span = max(self.view_end - self.view_start, 1e-6)
+        return (t - self.view_start) / span * width
+
+    def draw_timeline(self):
+        c = self.canvas
+        c.delete('all')
+        if self.timeline is None or self.view_end <= self.view_start:
+            return
+        height = int(c.winfo_height()) or 56
+        # 录像覆盖范围
+        for s, t in self.timeline.coverage(self.view_start, self.view_end):
+            c.create_rectangle(self._time_to_x(s), 18, max(self._time_to_x(t), self._time_to_x(s) + 1),
+                               height - 14, fill="#2f4f4f", outline="")
+        # 检测事件标记（按分钟聚合，颜色区分类别）
+        self._draw_markers()
+        self._request_markers()
+        # 刻度
+        span = self.view_end - self.view_start
+        step = next((s for s in (60, 300, 900, 3600, 6 * 3600, 86400) if span / s <= 12), 86400)
+        t = (int(self.view_start) // step + 1) * step
+        while t < self.view_end:
+            x = self._time_to_x(t)
+            c.create_line(x, height - 14, x, height - 10, fill="#666666")
+            fmt = '%H:%M' if step < 86400 else '%m-%d'
+            c.create_text(x, height - 5, text=time.strftime(fmt, time.localtime(t)), fill="#888888",
+                          font=('Segoe UI', 7))
+            t += step
+        c.create_line(0, 0, 0, height, fill="#ff4444", width=2, tags='playhead')
+        if self.player is not None and self.player.position is not None:
+            self._move_playhead(self.player.position)
+
+    def _draw_markers(self):
+        self.canvas.delete('marker')
+        for minute, class_name, n, objects in self._marker_rows:
+            x = self._time_to_x(minute + 30)
+            color = _CLASS_COLORS.get(class_name, '#ffaa00')
+            self.canvas.create_line(x, 4, x, 16, fill=color, width=2, tags='marker')
+
+    def _request_markers(self):
+        """请求当前视图范围的事件标记（缩放、拖动范围时连续请求只保留最新一次）"""
+        if self.event_store is None:
+            return
+        key = (self.camera_var.get(), self.view_start, self.view_end)
+        if key == self._marker_key:
+            return
+        self._marker_pending = key
+        if self._marker_busy:
+            return
+        self._marker_busy = True
+        store = self.event_store
+
+        def _query():
+            camera, start, end = key
+            try:
+                rows = store.counts_per_minute(start, end, camera=camera)
+            except Exception as e:
+                print(f"查询事件标记失败: {e}")
+                rows = None
+            try:
+                self.after(0, self._markers_ready, key, rows)
+            except Exception:
+                pass  # 窗口已关闭
+
+        Thread(target=_query, name='playback-markers', daemon=True).start()
+
+    def _markers_ready(self, key, rows):
+        """后台查询完成（主线程）：绘制标记，期间视图又变化时再查一次"""
+        self._marker_busy = False
+        if self._closed:
+            return
+        if rows is not None:
+            self._marker_key = key
+            self._marker_rows = rows
+            self._draw_markers()
+        if self._marker_pending is not None and self._marker_pending != key:
+            self._request_markers()
+
+    def _move_playhead(self, wallclock):
+        x = self._time_to_x(wallclock)
+        self.canvas.coords('playhead', x, 0, x, int(self.canvas.winfo_height()) or 56)
+
+    def _on_scrub(self, event):
+        if self.player is None:
+            return
+        t = self._x_to_time(event.x)
+        self._move_playhead(t)
+        self._show_thumb(t)
+        self.player.seek(t)
+
+    def _on_hover(self, event):
+        if self.timeline is not None:
+            self._show_thumb(self._x_to_time(event.x))
+
+    def _show_thumb(self, t):
+        if self.thumbs is None:
+            return
+        self._hover_time = t
+        path = self.thumbs.get(t, callback=lambda p: self.after(0, self._thumb_ready, t))
+        if path is None:
+            return
+        try:
+            self._thumb_imgtk = ImageTk.PhotoImage(Image.open(path))
+            self.thumb_label.config(image=self._thumb_imgtk)
+            self.thumb_label.place(x=8, rely=1.0, y=-8, anchor='sw')
+        except Exception as e:
+            print(f"加载缩略图失败: {e}")
+
+    def _thumb_ready(self, t):
+        if self._hover_time == t and not self._closed:
+            self._show_thumb(t)
+
+    def _hide_thumb(self):
+        self._hover_time = None
+        self.thumb_label.place_forget()
+
+    def _on_wheel(self, event):
+        self._zoom(0.8 if event.delta > 0 else 1.25, event.x)
+
+    def _zoom(self, factor, x):
+        """以鼠标位置为中心缩放时间轴"""
+        if self.timeline is None:
+            return
+        span = self.timeline.span()
+        center = self._x_to_time(x)
+        width = min(max((self.view_end - self.view_start) * factor, 60), span[1] - span[0] + 60)
+        ratio = x / max(self.canvas.winfo_width(), 1)
+        self.view_start = max(span[0] - 30, center - width * ratio)
+        self.view_end = self.view_start + width
+        self.draw_timeline()
+
+    # ---- 关闭 ----
+
+    def _stop_player(self):
+        if self.player is not None:
+            self.player.close()
+            self.player = None
+        if self.thumbs is not None:
+            self.thumbs.shutdown()
+            self.thumbs = None
+        with self._frame_lock:
+            self._frame = None
+
+    def close(self):
+        self._closed = True
+        self._stop_player()
+        if self._on_close_cb:
+            self._on_close_cb()
+        self.destroy()
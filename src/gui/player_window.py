@@ -3,20 +3,36 @@ from tkinter import ttk, Label
 from threading import Thread, Lock
 import os
 import queue
+from collections import deque
+from itertools import count
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 import time
 import subprocess
 import numpy as np
-# 可选使用 OpenCV 做快速缩放/颜色转换
-try:
-    import cv2
-    CV2_AVAILABLE = True
-except Exception:
-    CV2_AVAILABLE = False
-from tkinter import messagebox
+from tkinter import messagebox, filedialog
 from tkinter.scrolledtext import ScrolledText
 from src.detection.yolo_detector import YOLODetector, YOLO_AVAILABLE
-from src.onvif.onvif_controller import ONVIFController
+from src.onvif.ptz_worker import PTZWorker
+from src.onvif.camera_manager import CameraManager
+from src.onvif.auto_tracker import AutoTracker
+from src.detection.tracker import IoUTracker
+from src.detection.event_store import EventStore
+from src.detection.pipeline import PipelineStage, ResultCoalescer
+from src.rtsp.stream_info_cache import StreamInfoCache
+from src.gui.settings import SettingsPublisher
+from src.gui.playback_window import PlaybackWindow, list_recordings
+from src.gui.grid_view import GridView, GridSource
+from src.rtsp.hot_standby import StandbyDecoder, STANDBY_SIZE
+from src.rtsp.process_utils import reap_process, suspend_process, resume_process, MAX_SUSPEND_SECONDS
+from src.rtsp.decode_policy import DecodePolicy
+from src.rtsp.frame_reader import LatestFrameReader
+from src.rtsp.recorder import SegmentRecorder, safe_name
+from src.rtsp.clip_buffer import ClipBuffer
+from src.rtsp.snapshot_service import SnapshotService
+from src.api.server import StreamServer
+from src.utils.lazy_import import optional_import, preload
+from src.utils.config import AppConfig, ConfigError, ConfigWatcher, load_config, DEFAULT_FILENAMES, VEHICLE_CLASSES
+from src.rtsp.overlay_layouts import LAYOUTS, LAYOUT_PIP, layout_capacity, build_filter_complex
 
 
 class PlayerWindow(ttk.Frame):
@@ -26,6 +42,21 @@ class PlayerWindow(ttk.Frame):
         
         # 应用深色科技主题
         self.setup_theme()
+
+        # 配置文件（TOML/YAML + 环境变量覆盖）：启动时校验，出错时提示并使用默认配置
+        self._config_error = None
+        try:
+            self._config = load_config()
+            if self._config.path:
+                print(f"已加载配置: {self._config.path}")
+        except ConfigError as e:
+            print(f"配置校验失败，使用默认配置: {e}")
+            self._config_error = e
+            self._config = AppConfig()
+        self._config_watcher = None
+        # 主画面当前使用的摄像机配置（解码尺寸、硬件解码、检测节奏/类别/置信度/ROI）
+        self._camera_profile = None
+        profile = self._config.profile_for(self._config.player.stream1)
         
         # 设置固定解码分辨率（不随窗口大小改变，避免频繁重启流）
         # 使用常见的视频分辨率，可以根据实际需求调整
@@ -36,15 +67,15 @@ class PlayerWindow(ttk.Frame):
         # 建议同时启用硬件解码或升高 submit_interval / 降低检测尺寸以保持流畅。
         # self.decode_width = 2560  # 固定解码宽度（2K）
         # self.decode_height = 1440  # 固定解码高度（2K）
-        self.decode_width = 3840  # 固定解码宽度（2K）
-        self.decode_height = 2160  # 固定解码高度（2K）
+        self.decode_width = profile.decode_width  # 固定解码宽度（默认 3840，见配置 [profile]）
+        self.decode_height = profile.decode_height  # 固定解码高度（默认 2160）
         
         # 显示面板的尺寸会随窗口大小改变（用于缩放显示），但解码分辨率保持 2K，保证画质
         self.panel_width = 320
         self.panel_height = 180
 
-        self.stream1_var = tk.StringVar(value="rtsp://172.20.4.99/live/VideoChannel1")
-        self.stream2_var = tk.StringVar(value="rtsp://172.20.4.99/live/VideoChannel2")
+        self.stream1_var = tk.StringVar(value=self._config.player.stream1)
+        self.stream2_var = tk.StringVar(value=self._config.player.stream2)
         self.connection_status = tk.StringVar(value="未连接")
         self.stream_status = tk.StringVar(value="未播放")
         
@@ -55,17 +86,69 @@ class PlayerWindow(ttk.Frame):
         self.detect_drone = tk.BooleanVar(value=True)
         self.yolo_detector = None
         self.ai_lock = Lock()  # AI检测锁
-        # 异步检测队列与线程（延迟初始化，启用智能模式时创建）
-        self._detect_queue = None
-        self._detect_thread = None
+        # 检测流水线阶段：有界队列 + 丢弃策略 + 计数器，启用智能模式/开始播放时启动，关闭智能模式/停止播放时停止
+        # 检测结果列表最多每 0.2 秒刷新一次（结果只保留最新一份）
+        self._detection_ui = ResultCoalescer(self.parent.after, self.update_detection_display, min_interval=0.2)
+        self._detect_stage = PipelineStage('detect', self._run_detection,
+                                           maxsize=self._config.player.detect_queue_size,
+                                           policy=self._config.player.detect_policy,
+                                           on_result=lambda result, item: self._detection_ui.post(*result))
+        self._detect_stats_job = None
         self._last_detections = []
+        # 自动跟踪：检测结果先经 IoU 跟踪得到稳定的目标 ID，再驱动 PTZ 控制环
+        self.auto_track_enabled = tk.BooleanVar(value=False)
+        self._tracker = IoUTracker()  # 只在检测工作线程中使用（IoUTracker 不加锁）
+        self._tracker_reset_pending = False  # 界面线程请求清空轨迹，由检测工作线程在下次更新前执行
+        self._auto_tracker = None
+        self._track_stats_time = 0
+        # 检测事件库（SQLite WAL，后台线程批量写入）
+        try:
+            self._event_store = EventStore()
+        except Exception as e:
+            print(f"打开检测事件库失败: {e}")
+            self._event_store = None
+        self._history_query_running = False  # 历史统计查询在后台线程中进行，同一时间只查一次
         
         # 画中画开关
         self.pip_enabled = tk.BooleanVar(value=True)  # 默认开启画中画
         # 是否使用 FFmpeg 在 C 层合并画中画（overlay），可以显著降低 Python 侧开销
         self.use_ffmpeg_pip = tk.BooleanVar(value=False)
+        # FFmpeg 合成布局（画中画角落 / 2x2 / 3x3 / 并排）与宫格布局中主流、画中画之外的附加输入
+        self._composite_layout = LAYOUT_PIP
+        self.extra_stream_urls = []
         # 低延迟模式：优先降低延迟而非质量
         self.low_latency_mode = tk.BooleanVar(value=False)
+        # 分段录像（每路一个 -c copy 的 FFmpeg 进程）
+        self.recording_enabled = tk.BooleanVar(value=False)
+        self._recorders = {}  # url -> SegmentRecorder
+        self.recordings_dir = os.path.abspath(self._config.recording.dir)
+        self.record_segment_seconds = self._config.recording.segment_seconds
+        self.record_retention_seconds = self._config.recording.retention_hours * 3600
+        self.record_quota_bytes = int(self._config.recording.quota_gb * 1024 ** 3)  # 每路摄像机的磁盘配额
+        # 事件片段：主流压缩包环形缓冲，检测到目标时保存事件前后的片段
+        self.event_clip_enabled = tk.BooleanVar(value=False)
+        self._clip_buffer = None
+        self.clips_dir = os.path.abspath(self._config.clips.dir)
+        self.clip_pre_seconds = self._config.clips.pre_seconds
+        self.clip_post_seconds = self._config.clips.post_seconds
+        self.clip_trigger_classes = self._config.clips.trigger_classes
+        self._playback_window = None
+        self._grid_view = None
+        # 热备模式：为主流预先建立第二路已连接的解码器，看门狗超时时直接接管
+        self.hot_standby_enabled = tk.BooleanVar(value=False)
+        # 主流的备用 URL（为空时热备连接同一 URL）
+        self.stream1_backup_var = tk.StringVar(value=self._config.player.backup)
+        self._standby_decoder = None
+        self._active_main_url = None  # 主画面实际在解码的地址（热备接管后为备用 URL），由流线程更新
+        self._restart_allow_failover = True
+        # 每路流的解码策略（全速/限帧/仅关键帧/暂停），可运行时通过 set_decode_policy 切换
+        # 画中画由独立线程读取，默认限制到 10fps 即可满足 1/3 尺寸显示
+        self._decode_policies = {'main': DecodePolicy.full(), 'pip': DecodePolicy.at_fps(self._config.player.pip_fps)}
+        self._decode_policy_version = 0
+        self._policies_before_hide = None  # 窗口最小化前的策略，恢复显示时还原
+        # 画中画独立读取线程（最新帧槽位），合成时不阻塞主流
+        self._pip_reader = None
+        self._pip_stale_threshold = self._config.player.pip_stale_threshold  # 画中画超过此秒数无新帧则显示"无信号"
         
         # 检测结果显示相关
         self.detection_results = []  # 存储当前检测结果
@@ -82,11 +165,14 @@ class PlayerWindow(ttk.Frame):
         # 高质量拉流：增加看门狗超时时间，给网络波动更长的容忍度
         self._last_frame_time = 0  # 上次成功读取帧的时间
         # 将超时时间调大（默认10秒），避免因短暂网络抖动导致频繁重启
-        self._frame_timeout = 10.0  # 如果超过此秒数没有新帧，认为卡死并重启流
+        self._frame_timeout = profile.frame_timeout  # 如果超过此秒数没有新帧，认为卡死并重启流
         
         # 下采样检测配置（可调整以提高帧率）
-        self.detect_downsample_size = 640  # 检测时的下采样尺寸，越小速度越快但精度可能降低
+        self.detect_downsample_size = profile.detect_size  # 检测时的下采样尺寸，越小速度越快但精度可能降低
         # 可选值：640（平衡）、416（快速）、320（很快）、256（最快但精度较低）
+        self.detect_submit_interval = profile.detect_interval  # 每 N 帧提交一次检测（越大检测频率越低但CPU占用更小）
+        self.detect_roi = None  # 检测区域（归一化 x1, y1, x2, y2），None 表示整帧
+        self.hw_accel_preference = 'auto'  # 硬件解码开启时尝试的方式：auto 依次尝试 CUDA/QSV/VAAPI
 
         # 初始化硬件解码开关变量和日志目录（在创建控件之前）
         self.hw_accel_var = tk.BooleanVar(value=False)
@@ -95,19 +181,72 @@ class PlayerWindow(ttk.Frame):
             os.makedirs(self.ffmpeg_log_dir, exist_ok=True)
         except Exception:
             pass
+        # 按 URL 缓存的流参数（编码、分辨率、帧率等），命中后启动/重启时跳过耗时探测
+        self._stream_info_cache = StreamInfoCache(os.path.join(os.getcwd(), 'cache', 'stream_info.json'))
+        # 预览快照缓存（预览墙与 API 共用）：主流解码时旁路写入，其余摄像机按需短进程抓取关键帧
+        self._snapshot_service = SnapshotService(stream_info_cache=self._stream_info_cache)
+        # 本地推流 / 检测结果 API（默认关闭；启用后校验来源与令牌，没有观众时几乎没有开销）
+        self.api_host = self._config.api.host
+        self.api_port = self._config.api.port
+        self._api_server = StreamServer(self.api_host, self.api_port, snapshot_service=self._snapshot_service,
+                                        token=self._config.api.token,
+                                        allowed_origins=self._config.api.allowed_origins)
+        self._api_server.add_health('player', self._api_health)
+        self._api_server.add_metrics('detect', self._detect_stage.stats)
+        if self._config.api.enabled:
+            self._api_server.start()
+        self._stream_start_times = {}  # url -> 最近一次启动 FFmpeg 的时间
+        self._stream_fast_probe = {}  # url -> 最近一次启动是否使用了缓存的探测参数
 
         # 先创建右侧控制面板，确保它先显示
         self.create_ptz_controls()
         # 再创建左侧视频区域
         self.create_widgets()
+        # 工作线程读取的设置快照：UI 通过变量 trace 更新，线程只读普通属性
+        self._settings = SettingsPublisher({
+            'stream1_url': self.stream1_var,
+            'stream2_url': self.stream2_var,
+            'stream1_backup_url': self.stream1_backup_var,
+            'pip_enabled': self.pip_enabled,
+            'use_ffmpeg_pip': self.use_ffmpeg_pip,
+            'low_latency': self.low_latency_mode,
+            'hw_accel': self.hw_accel_var,
+            'hot_standby': self.hot_standby_enabled,
+            'ai_mode': self.ai_mode_enabled,
+            'detect_person': self.detect_person,
+            'detect_car': self.detect_car,
+            'detect_drone': self.detect_drone,
+            'auto_track': self.auto_track_enabled,
+            'conf_threshold': self.conf_threshold,
+        })
         
         self.stop_flag = False
         # 绑定窗口大小改变事件，以动态调整显示分辨率（但解码分辨率保持 2560x1440）
         self.panel1.bind("<Configure>", self.on_panel_resize)
+        # 右键在画面上框选区域：摄像机一次绝对移动对准并放大该区域
+        self.panel1.bind("<ButtonPress-3>", self._on_region_press)
+        self.panel1.bind("<ButtonRelease-3>", self._on_region_release)
+        self._region_start = None
+        # 窗口最小化/恢复时暂停/恢复解码
+        self.parent.bind("<Unmap>", self._on_window_visibility, add='+')
+        self.parent.bind("<Map>", self._on_window_visibility, add='+')
         self.need_restart_stream = False
         self.onvif_controller = None
+        self._ptz_worker = None  # PTZ 命令在独立线程中合并、限速后发送
+        self._onvif_connecting = False
+        # 多摄像机发现与并发连接（第一次点击"发现"时创建）
+        self._camera_manager = None
+        self._camera_window = None
+        self._camera_tree = None
         self.send_text = None
         self.recv_text = None
+        # ONVIF 报文只保存引用（固定容量），日志窗口打开时才渲染为文本
+        self._onvif_messages = deque(maxlen=500)
+        self._onvif_message_seq = count(1)
+        self._onvif_rendered_seq = 0
+        self._onvif_render_pending = False
+        self._onvif_log_window = None
+        self._onvif_log_max_lines = self._config.player.onvif_log_max_lines  # 每个文本框最多保留的行数
         self.right_panel = None  # 保存右侧面板引用
         self.stream_thread = None  # 保存流线程引用
         self.ffmpeg_procs = []  # 保存FFmpeg进程列表，用于清理
@@ -115,7 +254,7 @@ class PlayerWindow(ttk.Frame):
         # 重启退避控制
         self._restart_attempts = 0
         self._next_restart_time = 0
-        self._max_backoff = 60  # 最大退避时间（秒）
+        self._max_backoff = self._config.player.max_backoff  # 最大退避时间（秒）
         # CUDA使用与回退追踪
         self._last_hw_accel = None
         self._cuda_failures = 0
@@ -126,7 +265,12 @@ class PlayerWindow(ttk.Frame):
         print("已强制使用软件解码（已禁用 CUDA 硬件加速）")
         # UI 更新队列：流线程将 PIL Image 放入队列，主线程消费并创建 PhotoImage
         import queue as _queue_module
-        self._ui_queue = _queue_module.Queue(maxsize=1)
+        self._ui_queue = _queue_module.Queue(maxsize=self._config.player.ui_queue_size)
+        # 应用主画面的摄像机配置并开始监视配置文件（热加载）
+        self._apply_config(self._config, initial=True)
+        self._start_config_watcher()
+        # 窗口显示后再在后台预加载 cv2 / ONVIF 协议栈等重量级依赖
+        self.parent.after(500, self._start_preload)
 
     def setup_theme(self):
         """设置 PotPlayer 风格主题"""
@@ -218,19 +362,63 @@ class PlayerWindow(ttk.Frame):
                                    font=('Segoe UI', 8))
         pip_check.pack(side=tk.LEFT)
 
+        # 画中画解码策略（画中画只显示 1/3 尺寸，无需全速解码）
+        self._pip_policy_choices = {
+            '全速': DecodePolicy.full(),
+            '10fps': DecodePolicy.at_fps(10),
+            '5fps': DecodePolicy.at_fps(5),
+            '仅关键帧': DecodePolicy.keyframes_only(),
+            '暂停': DecodePolicy.paused(),
+        }
+        self.pip_policy_var = tk.StringVar(value=self._decode_policies['pip'].label())
+        pip_policy_combo = ttk.Combobox(stream_config_frame, textvariable=self.pip_policy_var,
+                                        values=list(self._pip_policy_choices), state='readonly', width=7,
+                                        font=('Segoe UI', 8))
+        pip_policy_combo.pack(side=tk.LEFT, padx=(3, 0))
+        pip_policy_combo.bind('<<ComboboxSelected>>', self._on_pip_policy_selected)
+
         # FFmpeg PIP 合并开关（将两路流交由 FFmpeg overlay 合并，减少 Python 端像素写入）
         ffmpeg_pip_check = tk.Checkbutton(stream_config_frame, text="FFmpeg 合并 PIP", variable=self.use_ffmpeg_pip,
                                           bg="#1a1a1a", fg="#a0a0a0", selectcolor="#2a2a2a",
                                           activebackground="#1a1a1a", activeforeground="#00d4aa",
-                                          font=('Segoe UI', 8))
+                                          font=('Segoe UI', 8), command=self._on_composite_changed)
         ffmpeg_pip_check.pack(side=tk.LEFT, padx=(6, 0))
+        # FFmpeg 合成布局
+        self.composite_layout_var = tk.StringVar(value=LAYOUTS[self._composite_layout])
+        layout_combo = ttk.Combobox(stream_config_frame, textvariable=self.composite_layout_var,
+                                    values=list(LAYOUTS.values()), state='readonly', width=6,
+                                    font=('Segoe UI', 8))
+        layout_combo.pack(side=tk.LEFT, padx=(3, 0))
+        layout_combo.bind('<<ComboboxSelected>>', self._on_composite_changed)
 
         # 低延迟模式开关
         latency_check = tk.Checkbutton(stream_config_frame, text="低延迟", variable=self.low_latency_mode,
                                        bg="#1a1a1a", fg="#a0a0a0", selectcolor="#2a2a2a",
                                        activebackground="#1a1a1a", activeforeground="#00d4aa",
                                        font=('Segoe UI', 8))
-        latency_check.pack(side=tk.LEFT, padx=(6, 0))        # 中间：播放控制按钮
+        latency_check.pack(side=tk.LEFT, padx=(6, 0))
+
+        # 热备开关（关键摄像机的快速故障切换）
+        standby_check = tk.Checkbutton(stream_config_frame, text="热备", variable=self.hot_standby_enabled,
+                                       bg="#1a1a1a", fg="#a0a0a0", selectcolor="#2a2a2a",
+                                       activebackground="#1a1a1a", activeforeground="#00d4aa",
+                                       font=('Segoe UI', 8))
+        standby_check.pack(side=tk.LEFT, padx=(6, 0))
+        # 录像开关：-c copy 分段录像，不解码不编码
+        record_check = tk.Checkbutton(stream_config_frame, text="录像", variable=self.recording_enabled,
+                                      command=self.toggle_recording,
+                                      bg="#1a1a1a", fg="#a0a0a0", selectcolor="#2a2a2a",
+                                      activebackground="#1a1a1a", activeforeground="#ff6666",
+                                      font=('Segoe UI', 8))
+        record_check.pack(side=tk.LEFT, padx=(6, 0))
+        # 事件片段开关：检测到人员/无人机时保存预录 + 后录片段
+        clip_check = tk.Checkbutton(stream_config_frame, text="事件", variable=self.event_clip_enabled,
+                                    command=self.toggle_event_clips,
+                                    bg="#1a1a1a", fg="#a0a0a0", selectcolor="#2a2a2a",
+                                    activebackground="#1a1a1a", activeforeground="#ff6666",
+                                    font=('Segoe UI', 8))
+        clip_check.pack(side=tk.LEFT, padx=(6, 0))
+        # 中间：播放控制按钮
         control_frame = tk.Frame(toolbar, bg="#1a1a1a")
         control_frame.pack(side=tk.LEFT, padx=15, pady=5)
         
@@ -240,6 +428,12 @@ class PlayerWindow(ttk.Frame):
         stop_button = ttk.Button(control_frame, text="⏸", 
                                 command=self.stop_stream, style='Small.TButton', width=3)
         stop_button.pack(side=tk.LEFT, padx=2)
+        playback_button = ttk.Button(control_frame, text="回放",
+                                     command=self.open_playback, style='Small.TButton', width=4)
+        playback_button.pack(side=tk.LEFT, padx=2)
+        grid_button = ttk.Button(control_frame, text="宫格",
+                                 command=self.open_grid_view, style='Small.TButton', width=4)
+        grid_button.pack(side=tk.LEFT, padx=2)
         
         # 右侧：智能模式开关
         ai_frame = tk.Frame(toolbar, bg="#1a1a1a")
@@ -287,11 +481,17 @@ class PlayerWindow(ttk.Frame):
         self.res_label = tk.Label(video_container, text="", bg="#000000", fg="#ffffff",
                       font=('Segoe UI', 8))
         self.res_label.place(x=10, y=30)
+        # 画中画独立的帧率/无信号提示
+        self.pip_label = tk.Label(video_container, text="", bg="#000000", fg="#a0a0a0",
+                      font=('Segoe UI', 8))
+        self.pip_label.place(x=10, y=48)
 
     def stop_stream(self):
         """停止视频流"""
         self.stop_flag = True
         self.is_playing = False
+        # 停止检测阶段（丢弃未处理的帧；正在进行的一次推理结束后线程自行退出）
+        self._detect_stage.stop(timeout=0)
         self.stream_status.set("已停止")
         self.status_label.config(fg="#a0a0a0")
         # 清理所有FFmpeg进程
@@ -305,6 +505,12 @@ class PlayerWindow(ttk.Frame):
     
     def _cleanup_ffmpeg_procs(self):
         """清理所有FFmpeg进程"""
+        if self._standby_decoder is not None:
+            self._standby_decoder.stop()
+            self._standby_decoder = None
+        if self._pip_reader is not None:
+            self._pip_reader.stop()
+            self._pip_reader = None
         for proc in self.ffmpeg_procs:
             if proc and proc.poll() is None:  # 进程仍在运行
                 try:
@@ -346,8 +552,13 @@ class PlayerWindow(ttk.Frame):
             # 等待线程结束
             self.stream_thread.join(timeout=1)
         
+        # 主画面地址变化后切换到对应的摄像机配置（未变化时不覆盖界面上的手动调整）
+        self._apply_camera_profile(self.stream1_var.get().strip())
+
         self.stop_flag = False
         self.is_playing = True
+        if self.ai_mode_enabled.get() and self.yolo_detector is not None:
+            self._detect_stage.start()
         self.stream_status.set("连接中...")
         self.status_label.config(fg="#ffaa00")
         # 隐藏占位文本
@@ -358,11 +569,17 @@ class PlayerWindow(ttk.Frame):
         self.stream_thread.start()
 
     def _start_pip_stream(self):
-        def ffmpeg_stream(url, width, height, use_hw=True):
-            """创建FFmpeg进程，支持多种硬件加速（CUDA、QSV、VAAPI）和软件解码降级"""
+        # OpenCV 只用于显示缩放（可选），启动时不导入；这里通常已由后台预加载完成
+        cv2 = optional_import('cv2')
+
+        def ffmpeg_stream(url, width, height, use_hw=True, track_startup=True, policy=None):
+            """创建FFmpeg进程，支持多种硬件加速（CUDA、QSV、VAAPI）和软件解码降级
+            track_startup: 是否统计该进程的首帧耗时（热备进程不统计）
+            policy: 解码策略（DecodePolicy），None 表示全速解码
+            """
             print(f"启动FFmpeg流: {url}，分辨率: {width}x{height}，硬件解码: {use_hw}")
             # 根据低延迟模式调整参数
-            is_low_latency = self.low_latency_mode.get()
+            is_low_latency = self._settings.snapshot.low_latency
             base_cmd = [
                 'ffmpeg',
                 '-loglevel', 'warning',
@@ -371,41 +588,51 @@ class PlayerWindow(ttk.Frame):
                 '-rtsp_transport', 'tcp',  # 使用TCP传输，更稳定
                 '-use_wallclock_as_timestamps', '1',
                 # 根据模式选择配置：低延迟优先还是质量优先
-                '-fflags', '+genpts+discardcorrupt',  # 生成PTS，丢弃损坏帧
+                # 生成PTS，丢弃损坏帧；低延迟模式下同时禁用输入缓冲
+                '-fflags', '+genpts+discardcorrupt+nobuffer' if is_low_latency else '+genpts+discardcorrupt',
                 '-flags', '+low_delay',    # 低延迟但不完全禁用缓冲
                 '-strict', 'experimental',
                 '-protocol_whitelist', 'rtsp,udp,rtp,file,http,https,tcp',
-                '-i', url,
-                '-f', 'rawvideo',
-                '-pix_fmt', 'rgb24',
-                '-s', f'{width}x{height}',
-                # 移除帧率限制，让FFmpeg自动适应源流帧率，保证质量
-                # '-r', '15',  # 已移除，避免强制降帧导致卡顿
-                '-vsync', '0',  # 禁用帧同步，直接传递所有帧
             ]
-            
-            # 根据低延迟模式调整缓冲与分析参数
+
+            # 根据低延迟模式调整缓冲参数（输入选项，必须位于 -i 之前才会生效）
             if is_low_latency:
-                # 低延迟模式：减小缓冲、快速探测、降低分析时间，并尝试禁用内部缓冲
+                # 低延迟模式：减小缓冲
                 base_cmd.extend([
-                    '-fflags', 'nobuffer',
-                    '-rtsp_flags', 'nobuffer',
-                    '-flush_packets', '1',
                     '-max_delay', '50000',     # 最大延迟 50ms
                     '-reorder_queue_size', '0', # 禁用重排序队列
-                    '-analyzeduration', '500000',  # 分析时长 0.5s
-                    '-probesize', '32768',      # 探测大小 32KB（快速但可能降低兼容性）
                 ])
             else:
                 # 质量优先模式：大缓冲和长延时，优先保证质量
                 base_cmd.extend([
                     '-max_delay', '2000000',    # 最大延迟 2s
                     '-reorder_queue_size', '0', # 禁用重排序队列（实时流）
-                    '-analyzeduration', '10000000',  # 分析时长 10s
-                    '-probesize', '10000000',   # 探测大小 10MB
                 ])
-            
+            # 探测参数：命中流参数缓存时使用最小探测（数百毫秒内出图），否则按模式完整探测
+            base_cmd.extend(self._stream_info_cache.probe_args(url, is_low_latency))
+            # 解码策略：仅关键帧/跳过非参考帧等解码器参数
+            if policy is not None:
+                base_cmd.extend(policy.input_args())
+
+            base_cmd.extend([
+                '-i', url,
+                '-f', 'rawvideo',
+                '-pix_fmt', 'rgb24',
+                '-s', f'{width}x{height}',
+                # 移除帧率限制，让FFmpeg自动适应源流帧率，保证质量
+                # '-r', '15',  # 已移除，避免强制降帧导致卡顿
+                '-vsync', '0',  # 禁用帧同步，直接传递所有帧
+            ])
+            if policy is not None:
+                base_cmd.extend(policy.output_args())
+            if is_low_latency:
+                base_cmd.extend(['-flush_packets', '1'])
             base_cmd.append('-')
+            # 记录本次启动时间与是否使用了缓存参数，用于统计首帧耗时和缓存失效判断
+            if track_startup:
+                self._stream_start_times[url] = time.time()
+                self._stream_fast_probe[url] = self._stream_info_cache.get(url) is not None
+            codec = self._stream_info_cache.codec_for(url)
             # 尝试多种硬件加速方式（按优先级顺序），如果被标记为禁用则跳过
             if use_hw and not getattr(self, '_cuda_disabled', False):
                 hw_accels = [
@@ -413,25 +640,28 @@ class PlayerWindow(ttk.Frame):
                     {
                         'name': 'CUDA',
                         'cmd': ['ffmpeg', '-hwaccel', 'cuda', '-hwaccel_device', '0',
-                               '-c:v', 'h264_cuvid'] + base_cmd[1:],
+                               '-c:v', f'{codec}_cuvid'] + base_cmd[1:],
                     },
                     # Intel Quick Sync Video
                     {
                         'name': 'QSV',
-                        'cmd': ['ffmpeg', '-hwaccel', 'qsv', '-c:v', 'h264_qsv'] + base_cmd[1:],
+                        'cmd': ['ffmpeg', '-hwaccel', 'qsv', '-c:v', f'{codec}_qsv'] + base_cmd[1:],
                     },
                     # VAAPI (Linux)
                     {
                         'name': 'VAAPI',
                         'cmd': ['ffmpeg', '-hwaccel', 'vaapi', '-hwaccel_device', '/dev/dri/renderD128',
-                               '-c:v', 'h264_vaapi'] + base_cmd[1:],
+                               '-c:v', f'{codec}_vaapi'] + base_cmd[1:],
                     },
                 ]
+                # 摄像机配置指定了某一种硬件解码时只尝试该方式
+                if self.hw_accel_preference not in ('auto', 'off'):
+                    hw_accels = [h for h in hw_accels if h['name'].lower() == self.hw_accel_preference]
 
                 for hw_accel in hw_accels:
                     try:
                         proc = subprocess.Popen(hw_accel['cmd'], stdout=subprocess.PIPE,
-                                                stderr=subprocess.PIPE, bufsize=1024*1024 if self.low_latency_mode.get() else 1024*1024)
+                                                stderr=subprocess.PIPE, bufsize=1024*1024 if self._settings.snapshot.low_latency else 1024*1024)
                         # 检查进程是否正常启动
                         #time.sleep(0.1)
                         if proc.poll() is None:  # 进程仍在运行
@@ -485,7 +715,7 @@ class PlayerWindow(ttk.Frame):
                 pass
             print("使用软件解码（libx264）")
             # 根据低延迟模式选择缓冲大小
-            buffer_size = 1024*1024 if self.low_latency_mode.get() else 10*1024*1024
+            buffer_size = 1024*1024 if self._settings.snapshot.low_latency else 10*1024*1024
             proc = subprocess.Popen(base_cmd, stdout=subprocess.PIPE,
                                   stderr=subprocess.PIPE, bufsize=buffer_size)
             # 启动 stderr draining 线程
@@ -514,35 +744,51 @@ class PlayerWindow(ttk.Frame):
                 pass
             return proc
 
-        def ffmpeg_stream_overlay(main_url, pip_url, width, height, pip_w, pip_h, use_hw=True):
-            """使用 FFmpeg 在 C 层将两路流 overlay 合并后输出 rawvideo 到 stdout
-            main_url: 主流 rtsp
-            pip_url: 画中画 rtsp
-            width,height: 输出主画面尺寸
-            pip_w,pip_h: 画中画尺寸
-            返回单一 proc（stdout 为合并后 rawvideo）
+        def ffmpeg_stream_overlay(urls, width, height, layout=LAYOUT_PIP, use_hw=True):
+            """使用 FFmpeg 在 C 层将多路流按布局合成后输出 rawvideo 到 stdout
+            urls: 输入流列表（画中画布局中第一路为主画面，第二路为画中画）
+            width,height: 输出画面尺寸
+            layout: 合成布局（画中画角落 / 2x2 / 3x3 / 并排），见 overlay_layouts
+            返回单一 proc（stdout 为合成后 rawvideo）
             """
-            print(f"启动 FFmpeg overlay 合并: main={main_url}, pip={pip_url}, out={width}x{height}, pip={pip_w}x{pip_h}, hw={use_hw}")
-            # 计算 overlay 位置（右下角，10px 内边距）
-            overlay_x = max(0, width - pip_w - 10)
-            overlay_y = max(0, height - pip_h - 10)
-
-            # filter: scale second input then overlay
-            filter_complex = f"[1:v]scale={pip_w}:{pip_h}[pip];[0:v][pip]overlay={overlay_x}:{overlay_y}"
-
-            cmd = [
-                'ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'warning',
-                '-rtsp_transport', 'tcp',
-                '-i', main_url,
-                '-rtsp_transport', 'tcp',
-                '-i', pip_url,
+            urls = [u for u in urls if u][:layout_capacity(layout)]
+            is_low_latency = self._settings.snapshot.low_latency
+            hw = use_hw and not getattr(self, '_cuda_disabled', False)
+            print(f"启动 FFmpeg 合成: layout={layout}, inputs={len(urls)}, out={width}x{height}, hw={hw}")
+
+            cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'warning']
+            for url in urls:
+                # 每路输入独立的低延迟/缓冲与探测参数；合成时各路用 setpts 对齐，不使用墙钟时间戳
+                cmd += [
+                    '-rtsp_transport', 'tcp',
+                    # 套接字超时（FFmpeg 5+，微秒）：某路卡住时报错结束该输入，而不是拖住整个合成
+                    '-timeout', '5000000',
+                    '-fflags', '+genpts+discardcorrupt+nobuffer' if is_low_latency else '+genpts+discardcorrupt',
+                    '-flags', '+low_delay',
+                    '-max_delay', '50000' if is_low_latency else '2000000',
+                    '-reorder_queue_size', '0',
+                ]
+                cmd += self._stream_info_cache.probe_args(url, is_low_latency)
+                if hw:
+                    # 每路输入自动选择可用的硬件解码，不可用时 FFmpeg 自动回退到软件解码
+                    cmd += ['-hwaccel', 'auto']
+                cmd += ['-i', url]
+
+            fps = ((self._stream_info_cache.get(urls[0]) or {}).get('fps') if urls else None) or 25
+            filter_complex = build_filter_complex(layout, len(urls), width, height, fps=round(fps))
+            cmd += [
                 '-filter_complex', filter_complex,
+                '-map', '[out]',
                 '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
-                '-vsync', '0', '-an', '-'
+                '-vsync', '0', '-an',
             ]
+            if is_low_latency:
+                cmd += ['-flush_packets', '1']
+            cmd.append('-')
+            self._last_hw_accel = 'auto' if hw else None
 
             try:
-                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1024*1024 if self.low_latency_mode.get() else 10*1024*1024)
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1024*1024 if self._settings.snapshot.low_latency else 10*1024*1024)
                 # drain stderr to avoid blocking
                 def _drain(p):
                     try:
@@ -600,6 +846,57 @@ class PlayerWindow(ttk.Frame):
                 # 读取错误
                 return None
 
+        def spawn_main(url, main_url2, width, height, policy, compositing):
+            """启动主画面进程：FFmpeg 合成模式下由一个进程合成所有输入，否则只解码主流"""
+            if compositing:
+                urls = [url, main_url2] + list(self.extra_stream_urls)
+                proc = ffmpeg_stream_overlay(urls, width, height, layout=self._composite_layout,
+                                             use_hw=self._settings.snapshot.hw_accel)
+                if proc is None:
+                    raise Exception("FFmpeg 合成进程启动失败")
+                return proc
+            return ffmpeg_stream(url, width, height, use_hw=self._settings.snapshot.hw_accel, policy=policy)
+
+        def start_standby(active_url):
+            """按当前配置为主流创建热备解码器（未启用热备时返回 None）
+            配置了备用 URL 时，热备总是连接当前未在使用的那一路，以便双向切换。
+            """
+            if not self._settings.snapshot.hot_standby or self._settings.snapshot.compositing:
+                return None
+            primary_url = self._settings.snapshot.stream1_url
+            backup_url = self._settings.snapshot.stream1_backup_url
+            if backup_url:
+                target_url = backup_url if active_url == primary_url else primary_url
+            else:
+                target_url = primary_url
+            # 只解关键帧、输出极小画面（软件解码即可）：保持会话在线的开销远低于再解一路完整画面
+            w, h = STANDBY_SIZE
+            keyframes = DecodePolicy.keyframes_only()
+            standby = StandbyDecoder(lambda u: ffmpeg_stream(u, w, h, use_hw=False, track_startup=False,
+                                                             policy=keyframes),
+                                     target_url, w * h * 3)
+            if not standby.start():
+                return None
+            return standby
+
+        def start_pip_reader(proc, frame_size):
+            """为画中画进程启动独立读取线程（替换旧的读取线程）"""
+            if self._pip_reader is not None:
+                self._pip_reader.stop()
+            self._pip_reader = LatestFrameReader(proc.stdout, frame_size, name='pip').start() if proc else None
+            return self._pip_reader
+
+        def respawn_pip(old_proc, url, width, height, policy):
+            """仅重启画中画一路（策略切换或画中画卡死），返回新进程；失败时返回 None"""
+            try:
+                new_proc = ffmpeg_stream(url, width, height, use_hw=self._settings.snapshot.hw_accel, policy=policy)
+            except Exception as e:
+                print(f"重启画中画流失败: {e}")
+                return None
+            reap_process(old_proc)
+            start_pip_reader(new_proc, width * height * 3)
+            return new_proc
+
         try:
             # 使用固定的解码分辨率，不随窗口大小改变
             decode_w, decode_h = self.decode_width, self.decode_height
@@ -608,17 +905,30 @@ class PlayerWindow(ttk.Frame):
             pip_w, pip_h = display_w // 3, display_h // 3
             proc1 = None
             proc2 = None
+            url1 = self._settings.snapshot.stream1_url
+            url2 = self._settings.snapshot.stream2_url
+            # 各路进程启动时使用的解码策略与被挂起的时间（0 表示未挂起）
+            launched_policies = {}
+            suspended = {'main': 0.0, 'pip': 0.0}
+            applied_policy_version = None
+            
+            # FFmpeg 合成模式：所有输入在一个 FFmpeg 进程内按布局合成，Python 只读取一路
+            compositing = self._settings.snapshot.compositing
             
             try:
                 # 使用固定解码分辨率
-                proc1 = ffmpeg_stream(self.stream1_var.get(), decode_w, decode_h, use_hw=bool(self.hw_accel_var.get()))
+                launched_policies = dict(self._decode_policies)
+                proc1 = spawn_main(url1, url2, decode_w, decode_h, launched_policies['main'], compositing)
                 # 根据画中画开关决定是否启动Stream 2（画中画也使用固定分辨率）
-                if self.pip_enabled.get():
-                    proc2 = ffmpeg_stream(self.stream2_var.get(), decode_w // 3, decode_h // 3, use_hw=bool(self.hw_accel_var.get()))
+                if self._settings.snapshot.pip_enabled and not compositing:
+                    proc2 = ffmpeg_stream(url2, decode_w // 3, decode_h // 3, use_hw=self._settings.snapshot.hw_accel,
+                                          policy=launched_policies['pip'])
                     self.ffmpeg_procs = [proc1, proc2]
                 else:
                     proc2 = None
                     self.ffmpeg_procs = [proc1]
+                self._active_main_url = url1
+                self._standby_decoder = start_standby(url1)
                 # 初始化帧计数和FPS统计
                 self._frame_count = 0
                 self._fps_frame_times = []
@@ -642,14 +952,49 @@ class PlayerWindow(ttk.Frame):
             
             # 使用解码分辨率的帧大小
             frame_size1 = decode_w * decode_h * 3
-            frame_size2 = (decode_w // 3) * (decode_h // 3) * 3 if self.pip_enabled.get() else 0
+            frame_size2 = (decode_w // 3) * (decode_h // 3) * 3 if self._settings.snapshot.pip_enabled and not compositing else 0
+            start_pip_reader(proc2, frame_size2)
+            pip_restart_time = time.time()
 
             error_count = 0  # 新增异常计数
             # 高质量拉流：增加连续错误阈值，避免因短暂网络波动频繁重启
             max_error_count = 30  # 连续异常阈值（从10增加到30，质量优先）
 
+            # 设置快照版本与启动时的低延迟模式，用于感知运行时设置变化
+            settings_version = self._settings.snapshot.version
+            launched_low_latency = self._settings.snapshot.low_latency
+
             while not self.stop_flag:
+                # 每轮只取一次设置快照（普通属性读取，不再跨线程调用 Tcl）
+                cfg = self._settings.snapshot
+                if cfg.version != settings_version:
+                    settings_version = cfg.version
+                    # 低延迟模式影响 FFmpeg 输入参数，正在播放时按新设置重启
+                    if cfg.low_latency != launched_low_latency:
+                        launched_low_latency = cfg.low_latency
+                        self._restart_for_config_change(f"low latency {'on' if cfg.low_latency else 'off'}")
                 if self.need_restart_stream:
+                    # 热备接管：故障引起的重启且热备流就绪时，无需等待退避，立即按完整参数解码热备地址
+                    standby = self._standby_decoder
+                    if standby is not None and self._restart_allow_failover and not compositing:
+                        promoted = standby.promote(
+                            lambda u: ffmpeg_stream(u, decode_w, decode_h, use_hw=self._settings.snapshot.hw_accel,
+                                                    policy=launched_policies.get('main')))
+                        if promoted is not None:
+                            print(f"热备接管: {url1} -> {standby.url}（热备已确认 {standby.frames_discarded} 个关键帧）")
+                            reap_process(proc1)
+                            proc1 = promoted
+                            url1 = standby.url
+                            self._active_main_url = url1
+                            self.ffmpeg_procs = [proc1] if not proc2 else [proc1, proc2]
+                            self._last_frame_time = time.time()
+                            self._restart_attempts = 0
+                            self._next_restart_time = 0
+                            self.need_restart_stream = False
+                            error_count = 0
+                            # 为新的活动流重新建立热备
+                            self._standby_decoder = start_standby(url1)
+                            continue
                     # 优化重启流程：先启动新流，再关闭旧流，实现无缝切换
                     # 如果尚未到允许的下次重启时间，则跳过本次重启尝试
                     if time.time() < getattr(self, '_next_restart_time', 0):
@@ -668,58 +1013,52 @@ class PlayerWindow(ttk.Frame):
                     decode_w, decode_h = self.decode_width, self.decode_height
                     new_proc1 = None
                     new_proc2 = None
+                    url1 = self._settings.snapshot.stream1_url
+                    url2 = self._settings.snapshot.stream2_url
+                    new_policies = dict(self._decode_policies)
+                    compositing = self._settings.snapshot.compositing
                     try:
-                        new_proc1 = ffmpeg_stream(self.stream1_var.get(), decode_w, decode_h, use_hw=bool(self.hw_accel_var.get()))
+                        new_proc1 = spawn_main(url1, url2, decode_w, decode_h, new_policies['main'], compositing)
                         # 快速检查新流是否启动成功
                         time.sleep(0.001)
                         if new_proc1.poll() is not None:
                             raise Exception("新流启动失败")
                         
-                        if self.pip_enabled.get():
-                            new_proc2 = ffmpeg_stream(self.stream2_var.get(), decode_w // 3, decode_h // 3, use_hw=bool(self.hw_accel_var.get()))
+                        if self._settings.snapshot.pip_enabled and not compositing:
+                            new_proc2 = ffmpeg_stream(url2, decode_w // 3, decode_h // 3, use_hw=self._settings.snapshot.hw_accel,
+                                                      policy=new_policies['pip'])
                             time.sleep(0.05)
                             if new_proc2.poll() is not None:
                                 new_proc2 = None
                     except Exception as e:
                         print(f"启动新流失败: {e}")
-                        if new_proc1:
-                            try:
-                                new_proc1.kill()
-                            except:
-                                pass
-                        if new_proc2:
-                            try:
-                                new_proc2.kill()
-                            except:
-                                pass
+                        reap_process(new_proc1)
+                        reap_process(new_proc2)
                         # 如果新流启动失败，继续使用旧流
                         self.need_restart_stream = False
                         continue
                     
-                    # 新流启动成功后，快速关闭旧流
-                    if proc1:
-                        try:
-                            proc1.terminate()
-                            proc1.wait(timeout=0.001)  # 减少等待时间
-                        except:
-                            try:
-                                proc1.kill()
-                            except:
-                                pass
-                    if proc2:
-                        try:
-                            proc2.terminate()
-                            proc2.wait(timeout=0.001)
-                        except:
-                            try:
-                                proc2.kill()
-                            except:
-                                pass
+                    # 新流启动成功后关闭旧流：在后台线程中终止并回收，不阻塞流线程也不遗留僵尸进程
+                    reap_process(proc1)
+                    reap_process(proc2)
                     
                     # 切换到新流
                     proc1 = new_proc1
                     proc2 = new_proc2
                     self.ffmpeg_procs = [proc1] if not proc2 else [proc1, proc2]
+                    # 新进程均未挂起，强制重新应用一次解码策略（例如恢复暂停状态）
+                    launched_policies = new_policies
+                    self._active_main_url = url1
+                    suspended = {'main': 0.0, 'pip': 0.0}
+                    applied_policy_version = None
+                    # 热备已失效、配置已变化或开关已改变时重建热备
+                    standby = self._standby_decoder
+                    if (standby is None or not standby.is_ready() or not self._restart_allow_failover
+                            or not self._settings.snapshot.hot_standby):
+                        if standby is not None:
+                            standby.stop()
+                        self._standby_decoder = start_standby(url1)
+                    self._restart_allow_failover = True
                     
                     # 如果新流还没准备好，继续显示最后一帧（避免黑屏）
                     if last_frame_img:
@@ -740,13 +1079,85 @@ class PlayerWindow(ttk.Frame):
                     self._next_restart_time = 0
                     
                     frame_size1 = decode_w * decode_h * 3
-                    frame_size2 = (decode_w // 3) * (decode_h // 3) * 3 if self.pip_enabled.get() else 0
+                    frame_size2 = (decode_w // 3) * (decode_h // 3) * 3 if self._settings.snapshot.pip_enabled and not compositing else 0
+                    start_pip_reader(proc2, frame_size2)
+                    pip_restart_time = time.time()
                     self.need_restart_stream = False
                     error_count = 0
                     # 减少等待时间，快速恢复（从0.2秒减少到0.05秒）
                     time.sleep(0.001)
 
+                # 应用运行时切换的解码策略：短暂暂停通过挂起进程完成（不重连），挂起过久的一路恢复时重启，
+                # 其余变化仅重启对应的一路
+                if applied_policy_version != self._decode_policy_version:
+                    applied_policy_version = self._decode_policy_version
+                    for key in ('main', 'pip'):
+                        proc = proc1 if key == 'main' else proc2
+                        want = self._decode_policies[key]
+                        if proc is None or key not in launched_policies:
+                            continue
+                        if want.is_paused:
+                            if not suspended[key]:
+                                suspend_process(proc)
+                                suspended[key] = time.time()
+                                print(f"{key} 流解码已暂停")
+                            continue
+                        paused_for = time.time() - suspended[key] if suspended[key] else 0.0
+                        if paused_for > MAX_SUSPEND_SECONDS:
+                            # 挂起期间 RTSP 会话多半已被服务器超时断开，SIGCONT 只会读到过期数据或直接出错
+                            print(f"{key} 流已暂停 {paused_for:.0f} 秒，重新连接而不是恢复挂起的进程")
+                            if key == 'main':
+                                self._restart_allow_failover = False
+                                self._next_restart_time = 0
+                                self.need_restart_stream = True
+                                continue
+                            suspended[key] = 0.0
+                            new_proc2 = respawn_pip(proc2, url2, decode_w // 3, decode_h // 3, want)
+                            if new_proc2 is not None:
+                                proc2 = new_proc2
+                                launched_policies['pip'] = want
+                                pip_restart_time = time.time()
+                                self.ffmpeg_procs = [proc1, proc2]
+                            continue
+                        if suspended[key]:
+                            resume_process(proc)
+                            suspended[key] = 0.0
+                            print(f"{key} 流解码已恢复")
+                        if not want.requires_restart(launched_policies[key]):
+                            continue
+                        print(f"{key} 流解码策略切换为 {want.label()}，重启该路解码")
+                        if key == 'main':
+                            # 主流需要按新参数真正重启，不等待退避，也不切换到旧参数的热备
+                            self._restart_for_config_change(f"main decode policy {want.label()}")
+                        else:
+                            new_proc2 = respawn_pip(proc2, url2, decode_w // 3, decode_h // 3, want)
+                            if new_proc2 is not None:
+                                proc2 = new_proc2
+                                launched_policies['pip'] = want
+                                pip_restart_time = time.time()
+                                self.ffmpeg_procs = [proc1, proc2]
+                    if self.need_restart_stream:
+                        continue
+
+                # 主流被暂停（例如窗口最小化）：不读取管道，也不触发看门狗
+                if suspended['main'] or self._decode_policies['main'].is_paused:
+                    self._last_frame_time = time.time()
+                    time.sleep(0.05)
+                    continue
+
                 start_time = time.time()
+
+                # 画中画独立看门狗：画中画卡死只重启画中画一路，不影响主流
+                pip_reader = self._pip_reader
+                if (pip_reader is not None and proc2 is not None and not suspended['pip']
+                        and pip_reader.is_stale(self._frame_timeout)
+                        and time.time() - pip_restart_time > self._frame_timeout):
+                    print(f"画中画流超过{self._frame_timeout}秒无新帧，单独重启画中画...")
+                    pip_restart_time = time.time()
+                    new_proc2 = respawn_pip(proc2, url2, decode_w // 3, decode_h // 3, launched_policies['pip'])
+                    if new_proc2 is not None:
+                        proc2 = new_proc2
+                        self.ffmpeg_procs = [proc1, proc2]
                 
                 # 看门狗检查：如果超过5秒没有新帧，认为卡死，重启流
                 if self._last_frame_time > 0 and (time.time() - self._last_frame_time) > self._frame_timeout:
@@ -768,7 +1179,9 @@ class PlayerWindow(ttk.Frame):
                     # 高质量拉流：超时时间增加到10秒，给网络波动更长的容忍度
                     # 优先保证视频质量，允许更长的等待时间
                     # 根据低延迟模式调整读取超时，防止长超时掩盖积压
-                    read_timeout = 2.0 if self.low_latency_mode.get() else 10.0
+                    read_timeout = 2.0 if cfg.low_latency else 10.0
+                    if launched_policies.get('main') and launched_policies['main'].mode == 'keyframes':
+                        read_timeout = max(read_timeout, self._frame_timeout)  # 关键帧间隔可能长达数秒
                     raw_frame1 = read_with_timeout_threaded(proc1.stdout, frame_size1, timeout=read_timeout)
                     _read_end = time.time()
                     _read_time = (_read_end - _read_start) * 1000
@@ -791,6 +1204,8 @@ class PlayerWindow(ttk.Frame):
                     if not hasattr(self, '_frame_count'):
                         self._frame_count = 0
                     self._frame_count += 1
+                    if url1 in self._stream_start_times:
+                        self._on_first_frame(url1)
                     
                     # 诊断：统计帧间隔
                     if not hasattr(self, '_last_frame_read_time'):
@@ -805,27 +1220,21 @@ class PlayerWindow(ttk.Frame):
                     # 使用解码分辨率重塑帧（默认尽量避免拷贝）
                     _time1 = time.time()
                     frame1 = np.frombuffer(raw_frame1, np.uint8).reshape((decode_h, decode_w, 3))
-                    # 如果启用了画中画并且需要在主帧上写入画中画内容，
-                    # 必须确保 frame1 可写（从 bytes 创建的 array 可能是只读），
-                    # 所以在这种情况下做一次显式拷贝。
-                    if self.pip_enabled.get() and proc2 and frame_size2 > 0:
-                        try:
-                            # 仅在确实要修改主帧时拷贝以减少开销
-                            frame1 = frame1.copy()
-                        except Exception:
-                            # 如果拷贝失败，则继续以防止程序崩溃，后续写入会抛出异常并被捕获
-                            pass
                     
                     # 根据画中画开关决定是否叠加Stream 2
-                    # 如果启用了 FFmpeg overlay 模式（use_ffmpeg_pip），则合并在 FFmpeg 层已经完成，
-                    # Python 不再需要读取第二路并写入主帧。
-                    if self.pip_enabled.get() and (not self.use_ffmpeg_pip.get()) and proc2 and frame_size2 > 0:
+                    # 如果启用了 FFmpeg 合成模式（use_ffmpeg_pip），则合成在 FFmpeg 层已经完成，
+                    # 不会启动第二路进程，Python 不再需要读取第二路并写入主帧。
+                    if (cfg.pip_enabled and not compositing and proc2 and frame_size2 > 0
+                            and self._pip_reader is not None):
                         try:
-                            # 画中画也使用线程+队列非阻塞读取，但超时时间更短（1秒）
-                            # 画中画也使用线程+队列非阻塞读取，但超时时间稍短（8秒）
-                            # 高质量拉流：给画中画也足够的缓冲时间
-                            raw_frame2 = read_with_timeout_threaded(proc2.stdout, frame_size2, timeout= min(2.0, read_timeout) )
+                            # 画中画由独立线程读取，这里只取最新一帧，从不阻塞主流
+                            raw_frame2, _, _ = self._pip_reader.latest()
                             if raw_frame2 is not None and len(raw_frame2) == frame_size2:
+                                if url2 in self._stream_start_times:
+                                    self._on_first_frame(url2)
+                                # 需要在主帧上写入画中画内容，必须确保 frame1 可写
+                                # （从 bytes 创建的 array 是只读的），仅在确实要修改主帧时拷贝以减少开销
+                                frame1 = frame1.copy()
                                 pip_decode_w, pip_decode_h = decode_w // 3, decode_h // 3
                                 frame2 = np.frombuffer(raw_frame2, np.uint8).reshape((pip_decode_h, pip_decode_w, 3))
                                 # 计算画中画在解码分辨率中的位置
@@ -868,7 +1277,7 @@ class PlayerWindow(ttk.Frame):
                         new_w = int(decode_w * scale)
                         new_h = int(decode_h * scale)
 
-                        if CV2_AVAILABLE:
+                        if cv2 is not None:
                             try:
                                 # OpenCV 使用 (width, height) 参数顺序
                                 resized_np = cv2.resize(frame_np, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
@@ -889,6 +1298,14 @@ class PlayerWindow(ttk.Frame):
                     _time4 = time.time()
                     print(f"图像缩放时间: {(_time4 - _time3)*1000:.1f} ms")
 
+                    # 预览快照：已在解码的主流直接旁路一帧（缓存未过期时立即返回，不做编码）
+                    try:
+                        camera = self._active_camera()
+                        self._snapshot_service.tap(camera, img)
+                        self._api_server.publish_frame(camera, img)
+                    except Exception:
+                        pass
+
                     # 计算帧率
                     current_frame_time = time.time()
                     self._fps_frame_times.append(current_frame_time)
@@ -910,58 +1327,60 @@ class PlayerWindow(ttk.Frame):
                     try:
                         fps_text = f"FPS: {self._current_fps:.1f}"
                         res_text = f"{decode_w}x{decode_h} -> {self.panel_width}x{self.panel_height}"
+                        pip_text, pip_color = self._pip_status_text(suspended['pip'])
                         # 在主线程更新Label
                         try:
-                            self.panel1.after(0, lambda: (self.fps_label.config(text=fps_text), self.res_label.config(text=res_text)))
+                            self.panel1.after(0, lambda: (self.fps_label.config(text=fps_text), self.res_label.config(text=res_text),
+                                                          self.pip_label.config(text=pip_text, fg=pip_color)))
                         except Exception:
                             pass
                     except Exception:
                         pass
                     
                     # 智能模式：目标检测（改为异步检测队列，主线程不阻塞）
-                    if self.ai_mode_enabled.get() and self.yolo_detector and self.yolo_detector.is_loaded:
+                    if cfg.ai_mode and self.yolo_detector and self.yolo_detector.is_loaded:
                         try:
-                            # 获取要检测的类别
-                            target_classes = []
-                            if self.detect_person.get():
-                                target_classes.append('person')
-                            if self.detect_car.get():
-                                target_classes.extend(['car', 'truck', 'bus', 'motorcycle', 'bicycle'])
-                            if self.detect_drone.get():
-                                target_classes.append('drone')
-
-                            # 每 N 帧向检测队列提交一帧（非阻塞）
-                            submit_interval = 10  # 可以调整（越大检测频率越低但CPU占用更小）
+                            # 获取要检测的类别（快照内只计算一次）
+                            target_classes = cfg.target_classes
+
+                            # 每 N 帧向检测队列提交一帧（非阻塞），N 由摄像机配置的 detect_interval 决定
+                            submit_interval = self.detect_submit_interval
                             if (self._frame_count % submit_interval) == 0:
                                 try:
                                     target_detect_size = self.detect_downsample_size
-                                    detect_scale = target_detect_size / max(decode_w, decode_h)
-                                    detect_w = int(decode_w * detect_scale)
-                                    detect_h = int(decode_h * detect_scale)
+                                    # 配置了 ROI 时只把区域内的画面送去检测（切片为视图，不复制），同样的检测尺寸下目标更清晰
+                                    roi = self.detect_roi
+                                    if roi is not None:
+                                        roi_x = int(roi[0] * decode_w)
+                                        roi_y = int(roi[1] * decode_h)
+                                        source_np = frame1[roi_y:int(roi[3] * decode_h), roi_x:int(roi[2] * decode_w), :]
+                                    else:
+                                        roi_x = roi_y = 0
+                                        source_np = frame1
+                                    source_h, source_w = source_np.shape[0], source_np.shape[1]
+                                    detect_scale = target_detect_size / max(source_w, source_h)
+                                    detect_w = int(source_w * detect_scale)
+                                    detect_h = int(source_h * detect_scale)
                                     detect_w = detect_w if detect_w % 2 == 0 else detect_w + 1
                                     detect_h = detect_h if detect_h % 2 == 0 else detect_h + 1
 
                                     # 下采样成较小尺寸以降低推理成本
                                     if detect_scale < 0.5:
                                         step = max(1, int(1.0 / detect_scale))
-                                        detect_frame_np = frame1[::step, ::step, :]
+                                        detect_frame_np = source_np[::step, ::step, :]
                                         if detect_frame_np.shape[0] != detect_h or detect_frame_np.shape[1] != detect_w:
                                             detect_frame_np = np.array(Image.fromarray(detect_frame_np).resize((detect_w, detect_h), Image.Resampling.NEAREST))
                                     else:
-                                        detect_frame = Image.fromarray(frame1)
+                                        detect_frame = Image.fromarray(source_np)
                                         detect_frame = detect_frame.resize((detect_w, detect_h), Image.Resampling.NEAREST)
                                         detect_frame_np = np.array(detect_frame)
 
                                     # scale_back 用于将检测框从下采样坐标映射回解码分辨率
                                     scale_back = 1.0 / detect_scale if detect_scale > 0 else 1.0
 
-                                    # 非阻塞放入队列（若队列已满则丢弃最新帧）
-                                    try:
-                                        if self._detect_queue is not None:
-                                            self._detect_queue.put_nowait((detect_frame_np, target_classes if target_classes else None, float(self.conf_threshold.get()), int(target_detect_size), float(scale_back), decode_w, decode_h))
-                                    except Exception:
-                                        # 队列满或其他错误，忽略以保持主线程不阻塞
-                                        pass
+                                    # 非阻塞提交到检测阶段（队列满时按配置的丢弃策略处理，并计入丢弃数）
+                                    capture_time = time.time()
+                                    self._detect_stage.submit((detect_frame_np, target_classes if target_classes else None, cfg.conf_threshold, int(target_detect_size), float(scale_back), (roi_x, roi_y), decode_w, decode_h, capture_time), timestamp=capture_time)
                                 except Exception:
                                     pass
 
@@ -1188,6 +1607,10 @@ class PlayerWindow(ttk.Frame):
         connect_btn = ttk.Button(btn_frame, text="连接", 
                                 command=self.connect_onvif, style='Connect.TButton')
         connect_btn.pack(fill=tk.X)
+        ttk.Button(btn_frame, text="发现摄像机", command=self.discover_cameras,
+                   style='Small.TButton').pack(fill=tk.X, pady=(3, 0))
+        ttk.Button(btn_frame, text="报文日志", command=self.show_onvif_log,
+                   style='Small.TButton').pack(fill=tk.X, pady=(3, 0))
         
         # 连接状态
         status_frame = ttk.Frame(config_frame)
@@ -1262,6 +1685,19 @@ class PlayerWindow(ttk.Frame):
                   command=lambda: self.zoom_camera(-0.1),
                   style='Small.TButton').pack(side=tk.LEFT, fill=tk.X, expand=True)
 
+        # 预置位
+        preset_frame = ttk.Frame(control_frame)
+        preset_frame.pack(fill=tk.X, padx=8, pady=(0, 8))
+        ttk.Label(preset_frame, text="预置位", font=('Segoe UI', 8)).pack(anchor=tk.W, pady=(0, 3))
+        self.preset_var = tk.StringVar()
+        self.preset_combo = ttk.Combobox(preset_frame, textvariable=self.preset_var, state='readonly', width=14)
+        self.preset_combo.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(preset_frame, text="前往", command=self.goto_selected_preset,
+                   style='Small.TButton', width=4).pack(side=tk.LEFT, padx=(3, 0))
+        ttk.Button(preset_frame, text="保存", command=self.save_preset,
+                   style='Small.TButton', width=4).pack(side=tk.LEFT, padx=(3, 0))
+        self._preset_tokens = {}  # 显示名称 -> token
+
         # 合并智能识别与检测结果（位于原检测结果位置）
         ai_detect_frame = ttk.LabelFrame(right_panel, text="智能识别 / 检测结果")
         ai_detect_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 5), padx=5)
@@ -1303,6 +1739,22 @@ class PlayerWindow(ttk.Frame):
         self.conf_label.pack(side=tk.LEFT)
         conf_scale.configure(command=lambda v: self.conf_label.config(text=f"{float(v):.2f}"))
 
+        # 自动跟踪
+        track_frame = ttk.Frame(ai_top)
+        track_frame.pack(fill=tk.X, pady=(0, 6))
+        track_check = tk.Checkbutton(track_frame, text="自动跟踪", variable=self.auto_track_enabled,
+                                     command=self.toggle_auto_track,
+                                     bg="#2a2a2a", fg="#e0e0e0", selectcolor="#2a2a2a",
+                                     activebackground="#2a2a2a", activeforeground="#00d4aa",
+                                     font=('Segoe UI', 8))
+        track_check.pack(side=tk.LEFT)
+        self.track_status_label = tk.Label(track_frame, text="", bg="#2a2a2a", fg="#a0a0a0",
+                                           font=('Segoe UI', 7))
+        self.track_status_label.pack(side=tk.LEFT, padx=(6, 0))
+        # 检测负载（速率 / 单次耗时 / 延迟 / 丢弃 / 占用率）
+        self.detect_stats_label = tk.Label(ai_top, text="", bg="#2a2a2a", fg="#a0a0a0", font=('Segoe UI', 7))
+        self.detect_stats_label.pack(anchor=tk.W)
+
         # 下部：检测结果显示
         results_container = ttk.Frame(ai_detect_frame)
         results_container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -1319,6 +1771,9 @@ class PlayerWindow(ttk.Frame):
         clear_btn_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
         clear_btn = ttk.Button(clear_btn_frame, text="清空", command=self.clear_detection_results, style='Small.TButton')
         clear_btn.pack(side=tk.RIGHT)
+        history_btn = ttk.Button(clear_btn_frame, text="近1小时", command=self.show_detection_history,
+                                 style='Small.TButton')
+        history_btn.pack(side=tk.RIGHT, padx=(0, 4))
 
     def clear_detection_results(self):
         """清空检测结果显示"""
@@ -1329,6 +1784,53 @@ class PlayerWindow(ttk.Frame):
             self.detection_text_widget.config(state=tk.DISABLED)
         self.detection_results = []
     
+    def _active_camera(self):
+        """主画面当前实际解码的摄像机名（热备接管到备用地址后与 stream1 不同），用于快照、API 与事件库"""
+        return safe_name(self._active_main_url or self._settings.snapshot.stream1_url)
+
+    def show_detection_history(self, seconds=3600):
+        """在检测结果区显示事件库中最近一段时间各类别的统计（查询在后台线程中进行）"""
+        if self._event_store is None or not self.detection_text_widget or self._history_query_running:
+            return
+        self._history_query_running = True
+        store = self._event_store
+        camera = self._active_camera()
+
+        def _query():
+            lines = [f"最近 {seconds // 60} 分钟 ({camera}):\n"]
+            try:
+                store.flush(timeout=1.0)
+                counts = store.class_counts(start=time.time() - seconds, camera=camera)
+                per_minute = store.counts_per_minute(start=time.time() - seconds, camera=camera)
+            except Exception as e:
+                print(f"查询检测事件失败: {e}")
+                lines = None
+            else:
+                if not counts:
+                    lines.append("无记录\n")
+                for class_name, (n, objects) in sorted(counts.items()):
+                    lines.append(f"  {class_name}: {objects} 个目标 / {n} 次检测\n")
+                if per_minute:
+                    lines.append("\n按分钟:\n")
+                    for minute, class_name, n, objects in per_minute[-30:]:
+                        lines.append(f"  {time.strftime('%H:%M', time.localtime(minute))} {class_name} x{objects}\n")
+            try:
+                self.parent.after(0, self._show_detection_history_text, lines)
+            except Exception:
+                self._history_query_running = False
+
+        Thread(target=_query, name='event-history', daemon=True).start()
+
+    def _show_detection_history_text(self, lines):
+        """把后台查询的结果写入检测结果区（主线程）"""
+        self._history_query_running = False
+        if lines is None or not self.detection_text_widget:
+            return
+        self.detection_text_widget.config(state=tk.NORMAL)
+        self.detection_text_widget.delete('1.0', tk.END)
+        self.detection_text_widget.insert('1.0', ''.join(lines))
+        self.detection_text_widget.config(state=tk.DISABLED)
+
     def update_detection_display(self, detections, frame_width, frame_height):
         """更新检测结果显示"""
         if not self.detection_text_widget:
@@ -1396,113 +1898,377 @@ class PlayerWindow(ttk.Frame):
             traceback.print_exc()
 
     def log_onvif(self, send_content, recv_content):
-        """把ONVIF发送和接收的内容记录到界面上的两个滚动文本框。
+        """记录一次 ONVIF 交互（可由后台线程调用）
 
-        该方法可能由后台线程调用，使用 `after` 确保在主线程更新 UI。
+        只把内容的引用放进固定容量的缓冲；日志窗口打开时才在主线程渲染为文本，
+        窗口关闭时不做任何序列化。
         """
         try:
-            ts = time.strftime('%Y-%m-%d %H:%M:%S')
-            send_block = f"[{ts}] SEND:\n{send_content}\n\n" if send_content is not None else f"[{ts}] SEND: <empty>\n\n"
-            recv_block = f"[{ts}] RECV:\n{recv_content}\n\n" if recv_content is not None else f"[{ts}] RECV: <empty>\n\n"
-
-            def _append():
-                try:
-                    if hasattr(self, 'send_text') and self.send_text:
-                        try:
-                            self.send_text.config(state=tk.NORMAL)
-                            self.send_text.insert(tk.END, send_block)
-                            self.send_text.see(tk.END)
-                            self.send_text.config(state=tk.DISABLED)
-                        except Exception:
-                            pass
-                    else:
-                        print(send_block)
+            self._onvif_messages.append((next(self._onvif_message_seq), time.time(), send_content, recv_content))
+            if self._onvif_log_window is not None and not self._onvif_render_pending:
+                self._onvif_render_pending = True
+                self.parent.after(0, self._render_onvif_log)
+        except Exception as e:
+            print(f"log_onvif 失败: {e}")
 
-                    if hasattr(self, 'recv_text') and self.recv_text:
-                        try:
-                            self.recv_text.config(state=tk.NORMAL)
-                            self.recv_text.insert(tk.END, recv_block)
-                            self.recv_text.see(tk.END)
-                            self.recv_text.config(state=tk.DISABLED)
-                        except Exception:
-                            pass
-                    else:
-                        print(recv_block)
-                except Exception as e:
-                    print(f"log_onvif UI 更新失败: {e}")
+    def _append_capped(self, widget, text):
+        """追加文本并删除超出上限的最早行"""
+        widget.config(state=tk.NORMAL)
+        widget.insert(tk.END, text)
+        lines = int(widget.index('end-1c').split('.')[0])
+        if lines > self._onvif_log_max_lines:
+            widget.delete('1.0', f"{lines - self._onvif_log_max_lines + 1}.0")
+        widget.see(tk.END)
+        widget.config(state=tk.DISABLED)
+
+    def _render_onvif_log(self):
+        """把尚未显示的报文渲染到日志窗口（主线程）"""
+        self._onvif_render_pending = False
+        if self._onvif_log_window is None or not self.send_text or not self.recv_text:
+            return
+        try:
+            for seq, ts, send, recv in list(self._onvif_messages):
+                if seq <= self._onvif_rendered_seq:
+                    continue
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+                self._append_capped(self.send_text, f"[{stamp}] SEND:\n{send if send is not None else '<empty>'}\n\n")
+                self._append_capped(self.recv_text, f"[{stamp}] RECV:\n{recv if recv is not None else '<empty>'}\n\n")
+                self._onvif_rendered_seq = seq
+        except Exception as e:
+            print(f"log_onvif UI 更新失败: {e}")
 
-            try:
-                # 在主线程安全地更新UI
-                if hasattr(self, 'parent') and getattr(self, 'parent') is not None:
-                    self.parent.after(0, _append)
-                else:
-                    _append()
-            except Exception:
-                _append()
+    def show_onvif_log(self):
+        """打开 ONVIF 报文日志窗口"""
+        if self._onvif_log_window is not None:
+            self._onvif_log_window.lift()
+            return
+        win = tk.Toplevel(self.parent)
+        win.title("ONVIF 报文日志")
+        win.geometry("900x600")
+        toolbar = ttk.Frame(win)
+        toolbar.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(toolbar, text="导出", command=self.export_onvif_log).pack(side=tk.LEFT)
+        ttk.Button(toolbar, text="清空", command=self._clear_onvif_log).pack(side=tk.LEFT, padx=(5, 0))
+        panes = ttk.PanedWindow(win, orient=tk.HORIZONTAL)
+        panes.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 5))
+        self.send_text = ScrolledText(panes, wrap=tk.NONE, font=('Consolas', 8), state=tk.DISABLED)
+        self.recv_text = ScrolledText(panes, wrap=tk.NONE, font=('Consolas', 8), state=tk.DISABLED)
+        panes.add(self.send_text, weight=1)
+        panes.add(self.recv_text, weight=1)
+
+        def on_close():
+            self._onvif_log_window = None
+            self.send_text = None
+            self.recv_text = None
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", on_close)
+        self._onvif_log_window = win
+        # 只渲染缓冲中仍保留的报文
+        self._onvif_rendered_seq = 0
+        self._render_onvif_log()
+
+    def _clear_onvif_log(self):
+        self._onvif_messages.clear()
+        if self.onvif_controller is not None:
+            self.onvif_controller.message_log.clear()
+        for widget in (self.send_text, self.recv_text):
+            if widget:
+                widget.config(state=tk.NORMAL)
+                widget.delete('1.0', tk.END)
+                widget.config(state=tk.DISABLED)
+
+    def export_onvif_log(self):
+        """导出当前摄像机记录的全部 SOAP 报文（MessageLog 环形缓冲，含操作名与往返耗时）"""
+        if self.onvif_controller is None:
+            messagebox.showinfo("提示", "未连接摄像机，没有可导出的报文")
+            return
+        path = filedialog.asksaveasfilename(title="导出ONVIF报文", defaultextension=".log",
+                                            filetypes=[("日志文件", "*.log"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            n = self.onvif_controller.message_log.export(path)
+            messagebox.showinfo("成功", f"已导出 {n} 条报文")
         except Exception as e:
-            print(f"log_onvif 失败: {e}")
+            messagebox.showerror("错误", f"导出失败: {e}")
 
-    def _detect_worker(self):
-        """后台检测线程：从队列获取下采样帧并运行YOLO检测，将结果缩放回解码分辨率后写入 self._last_detections"""
+    def _run_detection(self, item):
+        """检测阶段的处理函数（在流水线工作线程中调用）：运行YOLO检测，将结果缩放回解码分辨率后写入 self._last_detections
+
+        返回 (检测结果, 解码宽, 解码高)，由检测阶段交给界面合并投递。
+        """
+        (frame_np, target_classes, conf_threshold, target_detect_size, scale_back, roi_offset, decode_w, decode_h, capture_time) = item
+        # 执行检测（这是阻塞操作，但在流水线工作线程中；异常由检测阶段计数并限频打印）
+        results = self.yolo_detector.detect(frame_np, conf_threshold=conf_threshold, target_classes=target_classes, imgsz=int(target_detect_size))
+
+        # 将检测框坐标映射回解码分辨率（ROI 检测时再加上区域左上角偏移）
+        mapped = []
         try:
-            while True:
-                try:
-                    if self._detect_queue is None:
-                        time.sleep(0.1)
-                        continue
-                    item = self._detect_queue.get()
-                    if not item:
-                        continue
-                    (frame_np, target_classes, conf_threshold, target_detect_size, scale_back, decode_w, decode_h) = item
-                    # 执行检测（这是阻塞操作，但在单独线程中）
-                    results = []
-                    try:
-                        results = self.yolo_detector.detect(frame_np, conf_threshold=conf_threshold, target_classes=target_classes, imgsz=int(target_detect_size))
-                    except Exception as e:
-                        print(f"检测线程内部检测错误: {e}")
-                        results = []
+            off_x, off_y = roi_offset
+            for det in results:
+                x1, y1, x2, y2, conf, class_id, class_name = det
+                mx1 = int(x1 * scale_back) + off_x
+                my1 = int(y1 * scale_back) + off_y
+                mx2 = int(x2 * scale_back) + off_x
+                my2 = int(y2 * scale_back) + off_y
+                # 做边界裁剪以防越界
+                mx1 = max(0, min(mx1, decode_w - 1))
+                my1 = max(0, min(my1, decode_h - 1))
+                mx2 = max(0, min(mx2, decode_w - 1))
+                my2 = max(0, min(my2, decode_h - 1))
+                mapped.append([mx1, my1, mx2, my2, conf, class_id, class_name])
+        except Exception:
+            mapped = []
 
-                    # 将检测框坐标映射回解码分辨率
-                    mapped = []
-                    try:
-                        for det in results:
-                            x1, y1, x2, y2, conf, class_id, class_name = det
-                            mx1 = int(x1 * scale_back)
-                            my1 = int(y1 * scale_back)
-                            mx2 = int(x2 * scale_back)
-                            my2 = int(y2 * scale_back)
-                            # 做边界裁剪以防越界
-                            mx1 = max(0, min(mx1, decode_w - 1))
-                            my1 = max(0, min(my1, decode_h - 1))
-                            mx2 = max(0, min(mx2, decode_w - 1))
-                            my2 = max(0, min(my2, decode_h - 1))
-                            mapped.append([mx1, my1, mx2, my2, conf, class_id, class_name])
-                    except Exception:
-                        mapped = []
+        # 更新共享检测结果
+        try:
+            with self.ai_lock:
+                self._last_detections = mapped
+        except Exception:
+            self._last_detections = mapped
 
-                    # 更新共享检测结果
-                    try:
-                        with self.ai_lock:
-                            self._last_detections = mapped
-                    except Exception:
-                        self._last_detections = mapped
+        # 事件片段：检测到触发类别时登记事件（重叠的事件在缓冲区内合并）
+        try:
+            clip_buffer = self._clip_buffer
+            if clip_buffer is not None:
+                hits = sorted({d[6] for d in mapped if d[6] in self.clip_trigger_classes})
+                if hits:
+                    clip_buffer.trigger('+'.join(hits))
+        except Exception as e:
+            print(f"事件片段触发错误: {e}")
 
-                    # 更新检测结果显示（在主线程）
-                    try:
-                        if hasattr(self, 'panel1') and getattr(self, 'panel1') is not None:
-                            # 使用解码分辨率作为参数
-                            self.panel1.after(0, self.update_detection_display, mapped, decode_w, decode_h)
-                    except Exception:
-                        pass
-                except Exception:
-                    time.sleep(0.01)
-                    continue
+        # 更新轨迹，并把带轨迹 ID 的目标写入事件库（只入队，不阻塞检测线程）
+        cfg = self._settings.snapshot
+        camera = self._active_camera()
+        tracks = []
+        try:
+            if self._tracker_reset_pending:
+                self._tracker_reset_pending = False
+                self._tracker.reset()
+            tracks = self._tracker.update(mapped, capture_time)
+            if self._event_store is not None and tracks:
+                self._event_store.add_tracks(camera, capture_time, tracks)
+            self._api_server.publish_detections(camera, capture_time, tracks,
+                                                decode_w, decode_h)
+        except Exception as e:
+            print(f"记录检测事件错误: {e}")
+
+        # 自动跟踪：驱动 PTZ 控制环（只入队，不阻塞检测线程）
+        try:
+            if cfg.auto_track and self._auto_tracker is not None:
+                self._auto_tracker.update(tracks, decode_w, decode_h, capture_time, target_classes)
+                now = time.time()
+                if now - self._track_stats_time > 1.0:
+                    self._track_stats_time = now
+                    self.panel1.after(0, self._update_track_status)
         except Exception as e:
-            print(f"检测线程退出: {e}")
+            print(f"自动跟踪错误: {e}")
+
+        # 检测结果显示按界面刷新率合并（检测再快也不会让 Tk 事件队列积压）
+        return mapped, decode_w, decode_h
 
-    def _schedule_restart(self, reason=None):
-        """计划一次重启，使用指数退避来避免频繁重启"""
+    def _update_detect_stats(self):
+        """每秒刷新检测阶段的负载：处理速率、单次耗时、端到端延迟、丢弃数与占用率"""
+        self._detect_stats_job = None
+        if not self.ai_mode_enabled.get():
+            self.detect_stats_label.config(text="")
+            return
+        st = self._detect_stage.stats()
+        self.detect_stats_label.config(
+            text=f"{st['rate']:.1f}次/s {st['busy_ms']:.0f}ms 延迟 {st['latency_ms']:.0f}ms "
+                 f"丢弃 {st['dropped']} 占用 {st['utilization'] * 100:.0f}%",
+            fg="#ffaa00" if st['utilization'] > 0.9 else "#a0a0a0")
+        self._detect_stats_job = self.after(1000, self._update_detect_stats)
+
+    def set_decode_policy(self, stream, policy):
+        """运行时切换某路流的解码策略
+
+        stream: 'main' 或 'pip'
+        policy: DecodePolicy；暂停/恢复不重连，其余变化由流线程重启对应的一路
+        """
+        if stream not in self._decode_policies:
+            raise ValueError(f"未知的流: {stream}")
+        if self._decode_policies[stream] == policy:
+            return
+        self._decode_policies = dict(self._decode_policies, **{stream: policy})
+        self._decode_policy_version += 1
+        print(f"{stream} 流解码策略: {policy.label()}")
+
+    def _on_pip_policy_selected(self, event=None):
+        """UI回调：画中画解码策略下拉框"""
+        policy = self._pip_policy_choices.get(self.pip_policy_var.get())
+        if policy is not None:
+            self.set_decode_policy('pip', policy)
+
+    def _on_window_visibility(self, event):
+        """窗口最小化时暂停所有解码，恢复显示时还原之前的策略"""
+        if event.widget is not self.parent:
+            return
+        if event.type == tk.EventType.Unmap and self._policies_before_hide is None:
+            self._policies_before_hide = dict(self._decode_policies)
+            for stream in self._policies_before_hide:
+                self.set_decode_policy(stream, DecodePolicy.paused())
+        elif event.type == tk.EventType.Map and self._policies_before_hide is not None:
+            previous, self._policies_before_hide = self._policies_before_hide, None
+            for stream, policy in previous.items():
+                self.set_decode_policy(stream, policy)
+
+    def _on_composite_changed(self, event=None):
+        """UI回调：切换 FFmpeg 合成开关或布局后，正在播放时立即按新配置重启"""
+        label = self.composite_layout_var.get()
+        for key, name in LAYOUTS.items():
+            if name == label:
+                self._composite_layout = key
+        if self.is_playing:
+            self._restart_for_config_change(f"composite layout {self._composite_layout}")
+
+    def _apply_camera_profile(self, url):
+        """按主画面地址选择摄像机配置并应用，返回需要重启流才能生效的变化列表"""
+        profile = self._config.profile_for(url)
+        if profile == self._camera_profile:
+            return []
+        previous = self._camera_profile
+        self._camera_profile = profile
+        changes = []
+        if (profile.decode_width, profile.decode_height) != (self.decode_width, self.decode_height):
+            self.decode_width, self.decode_height = profile.decode_width, profile.decode_height
+            changes.append(f"decode size {profile.decode_width}x{profile.decode_height}")
+        # 看门狗与检测参数由工作线程每次读取，直接生效
+        self._frame_timeout = profile.frame_timeout
+        self.detect_submit_interval = profile.detect_interval
+        self.detect_downsample_size = profile.detect_size
+        self.detect_roi = None if profile.full_frame else tuple(profile.roi)
+        # 类别、置信度、低延迟写入界面变量，经设置快照发布（低延迟变化由流线程自行重启）
+        classes = set(profile.classes)
+        self.detect_person.set('person' in classes)
+        self.detect_car.set(bool(classes & set(VEHICLE_CLASSES)))
+        self.detect_drone.set('drone' in classes)
+        self.conf_threshold.set(profile.conf_threshold)
+        self.low_latency_mode.set(profile.low_latency)
+        self._apply_tilt_sign()
+        hw_enabled = profile.hw_accel != 'off'
+        if previous is None or profile.hw_accel != previous.hw_accel:
+            self.hw_accel_preference = profile.hw_accel
+            self.hw_accel_var.set(hw_enabled)
+            self._cuda_disabled = not hw_enabled
+            self._cuda_failures = 0
+            if previous is not None:
+                changes.append(f"hw accel {profile.hw_accel}")
+        print(f"摄像机配置: {profile.name}（解码 {profile.decode_width}x{profile.decode_height}，"
+              f"硬件解码 {profile.hw_accel}，每 {profile.detect_interval} 帧检测，检测尺寸 {profile.detect_size}）")
+        return changes
+
+    def _apply_tilt_sign(self):
+        """把当前摄像机配置的云台方向同时用于区域定位（PTZOptics）与自动跟踪（AutoTracker）"""
+        tilt_sign = self._camera_profile.tilt_sign if self._camera_profile else 1
+        if self.onvif_controller is not None:
+            self.onvif_controller.optics.tilt_sign = tilt_sign
+        if self._auto_tracker is not None:
+            self._auto_tracker.tilt_sign = tilt_sign
+
+    def _apply_config(self, config, initial=False):
+        """应用（重新）加载的配置；在主线程调用。API 地址与队列容量只在启动时生效"""
+        previous = self._config
+        self._config = config
+        player = config.player
+        self._max_backoff = player.max_backoff
+        self._pip_stale_threshold = player.pip_stale_threshold
+        self._onvif_log_max_lines = player.onvif_log_max_lines
+        self.recordings_dir = os.path.abspath(config.recording.dir)
+        self.record_segment_seconds = config.recording.segment_seconds
+        self.record_retention_seconds = config.recording.retention_hours * 3600
+        self.record_quota_bytes = int(config.recording.quota_gb * 1024 ** 3)
+        self.clips_dir = os.path.abspath(config.clips.dir)
+        self.clip_pre_seconds = config.clips.pre_seconds
+        self.clip_post_seconds = config.clips.post_seconds
+        self.clip_trigger_classes = config.clips.trigger_classes
+        if initial:
+            self._apply_camera_profile(self.stream1_var.get().strip())
+            return
+        if previous.api != config.api or previous.player.ui_queue_size != player.ui_queue_size:
+            print("API 与界面队列容量配置需重启程序后生效")
+        if (player.detect_queue_size, player.detect_policy) != (self._detect_stage.maxsize, self._detect_stage.policy):
+            # 检测阶段按新的队列容量/丢弃策略重启（计数器保留）
+            running = self._detect_stage.is_running
+            self._detect_stage.stop(timeout=0)
+            self._detect_stage.maxsize, self._detect_stage.policy = player.detect_queue_size, player.detect_policy
+            if running:
+                self._detect_stage.start()
+            print(f"检测队列: 容量 {player.detect_queue_size}，策略 {player.detect_policy}")
+        if player.pip_fps != previous.player.pip_fps:
+            policy = DecodePolicy.at_fps(player.pip_fps)
+            self.set_decode_policy('pip', policy)
+            self.pip_policy_var.set(policy.label())
+        # 只有配置文件中的地址本身变化时才改写界面（不覆盖用户在界面上临时输入的地址）
+        changes = []
+        for var, key in ((self.stream1_var, 'stream1'), (self.stream2_var, 'stream2'),
+                         (self.stream1_backup_var, 'backup')):
+            value = getattr(player, key)
+            if value != getattr(previous.player, key) and value != var.get().strip():
+                var.set(value)
+                changes.append(f"stream url {key}")
+        changes += self._apply_camera_profile(self.stream1_var.get().strip())
+        if changes and self.is_playing:
+            self._restart_for_config_change(', '.join(changes))
+
+    def _start_config_watcher(self):
+        """后台轮询配置文件；启动时没有配置文件则监视当前目录下的 config.toml，创建后即生效"""
+        if self._config_error is not None:
+            error = self._config_error
+            self.parent.after(500, lambda: messagebox.showwarning(
+                "配置错误", "配置校验失败，已使用默认配置：\n" + "\n".join(error.errors)))
+        interval = self._config.player.reload_interval
+        if interval <= 0:
+            return
+        path = self._config.path or (self._config_error.path if self._config_error else None) \
+            or os.path.join(os.getcwd(), DEFAULT_FILENAMES[0])
+        self._config_watcher = ConfigWatcher(
+            path, on_change=lambda config: self.parent.after(0, self._apply_config, config),
+            interval=interval).start()
+
+    def _start_preload(self):
+        """后台预加载配置 [player] preload 中列出的依赖，第一次使用时不必再等待导入"""
+        names = self._config.player.preload
+        if names:
+            preload(names)
+
+    def _restart_for_config_change(self, reason):
+        """配置变化引起的重启：不等待退避，也不切换到旧配置的热备"""
+        print(f"配置变化，重启流（原因: {reason}）")
+        self._restart_allow_failover = False
+        self._next_restart_time = 0
+        self.need_restart_stream = True
+
+    def _pip_status_text(self, paused=False):
+        """返回画中画状态标签的 (文本, 颜色)"""
+        reader = self._pip_reader
+        if reader is None:
+            return "", "#a0a0a0"
+        if paused:
+            return "PiP: 已暂停", "#a0a0a0"
+        if reader.is_stale(self._pip_stale_threshold):
+            return f"PiP: 无信号 ({reader.age():.1f}s)", "#ff6666"
+        return f"PiP FPS: {reader.fps:.1f}", "#00d4aa"
+
+    def _on_first_frame(self, url):
+        """某路流启动后的首帧到达：统计首帧耗时，并在未缓存时后台学习该 URL 的流参数"""
+        start = self._stream_start_times.pop(url, None)
+        if start is not None:
+            hit = '命中' if self._stream_fast_probe.get(url) else '未命中'
+            print(f"[诊断] 首帧耗时: {(time.time() - start) * 1000:.0f} ms（探测缓存: {hit}）: {url}")
+        self._stream_info_cache.learn_async(url)
+
+    def _schedule_restart(self, reason=None, allow_failover=True):
+        """计划一次重启，使用指数退避来避免频繁重启
+        allow_failover: 是否允许由热备流接管（配置变化引起的重启必须真正重启，不能切到旧配置的热备）
+        """
         try:
+            self._restart_allow_failover = allow_failover
+            # 使用缓存探测参数启动后始终未出首帧：缓存可能已过时（摄像机改了编码/分辨率），使其失效
+            for url in list(self._stream_start_times):
+                if self._stream_fast_probe.get(url):
+                    self._stream_info_cache.invalidate(url)
             self._restart_attempts = getattr(self, '_restart_attempts', 0) + 1
             backoff = min(self._max_backoff, 2 ** (self._restart_attempts - 1))
             self._next_restart_time = time.time() + backoff
@@ -1533,7 +2299,7 @@ class PlayerWindow(ttk.Frame):
             print(f"用户切换硬件解码: {'启用' if enabled else '禁用'}")
             # 如果正在播放，计划重启使设置生效；否则下次启动生效
             if self.is_playing:
-                self._schedule_restart(reason='user toggle hw accel')
+                self._schedule_restart(reason='user toggle hw accel', allow_failover=False)
         except Exception as e:
             print(f"切换硬件解码失败: {e}")
 
@@ -1547,7 +2313,7 @@ class PlayerWindow(ttk.Frame):
             return 0.01
 
     def connect_onvif(self):
-        """连接ONVIF摄像机"""
+        """连接ONVIF摄像机（在后台线程中连接，界面不会卡住）"""
         try:
             ip = self.ip_entry.get()
             port = int(self.port_entry.get())
@@ -1557,32 +2323,427 @@ class PlayerWindow(ttk.Frame):
             # 空值校验
             if not all([ip, port, username, password]):
                 raise ValueError("请填写所有必填项")
-            
+        except Exception as e:
+            self.connection_status.set("连接失败")
+            self.status_indicator.config(fg="#ff6666")
+            messagebox.showerror("错误", f"连接失败: {str(e)}")
+            return
+
+        if self._onvif_connecting:
+            return
+        self._onvif_connecting = True
+        self.connection_status.set("连接中...")
+        self.status_indicator.config(fg="#ffaa00")
+
+        def on_status(state, payload):
+            # 由连接线程调用，切回主线程更新界面
+            try:
+                self.parent.after(0, lambda: self._on_onvif_status(state, payload))
+            except Exception:
+                pass
+
+        def _connect():
+            # ONVIF 协议栈（zeep / lxml / onvif-zeep）在连接线程中导入，后台预加载未完成时也不阻塞界面
+            on_status('connecting', None)
+            try:
+                from src.onvif.onvif_controller import ONVIFController
+                controller = ONVIFController(ip, port, username, password)
+            except Exception as e:
+                on_status('failed', e)
+                return
+            on_status('connected', controller)
+
+        Thread(target=_connect, name=f"onvif-connect-{ip}", daemon=True).start()
+
+    def _on_onvif_status(self, state, payload):
+        """连接状态回调（主线程）"""
+        if state == 'connecting':
             self.connection_status.set("连接中...")
             self.status_indicator.config(fg="#ffaa00")
-            self.parent.update()
-                
-            self.onvif_controller = ONVIFController(ip, port, username, password)
-            self.connection_status.set("已连接")
-            self.status_indicator.config(fg="#00d4aa")
-            messagebox.showinfo("成功", "摄像机连接成功！")
-        except Exception as e:
+            return
+        self._onvif_connecting = False
+        if state == 'failed':
             self.connection_status.set("连接失败")
             self.status_indicator.config(fg="#ff6666")
-            messagebox.showerror("错误", f"连接失败: {str(e)}")    
+            messagebox.showerror("错误", f"连接失败: {str(payload)}")
+            return
+        self.onvif_controller = payload
+        self.shutdown_ptz_worker()
+        self._ptz_worker = PTZWorker(self.onvif_controller, on_log=self.log_onvif)
+        self._auto_tracker = AutoTracker(self._ptz_worker)
+        self._apply_tilt_sign()
+        self.refresh_presets()
+        try:
+            stats = self.onvif_controller.transport_stats()
+            print(f"ONVIF连接耗时 {self.onvif_controller.connect_time * 1000:.0f}ms, "
+                  f"SOAP请求 {stats['requests']} 次, 平均 {stats['avg_ms']:.0f}ms, "
+                  f"累计TCP连接 {stats['connections_opened']} 个")
+        except Exception:
+            pass
+        self.connection_status.set("已连接")
+        self.status_indicator.config(fg="#00d4aa")
+        messagebox.showinfo("成功", "摄像机连接成功！")
+
+    def discover_cameras(self):
+        """WS-Discovery 发现摄像机，并发连接后列出每台摄像机的流地址和 PTZ 能力"""
+        username = self.user_entry.get()
+        password = self.pwd_entry.get()
+        if self._camera_manager is None:
+            self._camera_manager = CameraManager(username, password)
+        manager = self._camera_manager
+        manager.username, manager.password = username, password
+        # 手工填写的摄像机也一并登记（组播被网络隔离时仍可使用）
+        try:
+            manager.add(self.ip_entry.get(), int(self.port_entry.get()))
+        except Exception:
+            pass
+        self._show_camera_window()
+
+        def on_status(info):
+            try:
+                self.parent.after(0, self._refresh_camera_list)
+            except Exception:
+                pass
+
+        def run():
+            found = manager.discover()
+            print(f"WS-Discovery 发现 {len(found)} 台设备")
+            self.parent.after(0, self._refresh_camera_list)
+            manager.connect_all(on_status=on_status, on_done=lambda cams: on_status(None))
+
+        Thread(target=run, name="onvif-discovery", daemon=True).start()
+
+    def _show_camera_window(self):
+        if self._camera_window is not None:
+            self._camera_window.lift()
+            self._refresh_camera_list()
+            return
+        win = tk.Toplevel(self.parent)
+        win.title("摄像机列表")
+        win.geometry("820x360")
+        columns = ('name', 'address', 'status', 'ptz', 'position', 'uri')
+        tree = ttk.Treeview(win, columns=columns, show='headings', selectmode='browse')
+        for col, text, width in (('name', '名称', 140), ('address', '地址', 140), ('status', '状态', 80),
+                                 ('ptz', 'PTZ', 50), ('position', 'PTZ 位置', 150), ('uri', '主码流', 300)):
+            tree.heading(col, text=text)
+            tree.column(col, width=width, anchor=tk.W)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        buttons = ttk.Frame(win)
+        buttons.pack(fill=tk.X, padx=5, pady=(0, 5))
+        ttk.Button(buttons, text="设为主画面", command=lambda: self._use_camera_stream(self.stream1_var, 0)).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="设为画中画", command=lambda: self._use_camera_stream(self.stream2_var, 1)).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(buttons, text="控制此摄像机", command=self._use_camera_ptz).pack(side=tk.LEFT, padx=(5, 0))
+
+        def on_close():
+            self._camera_window = None
+            self._camera_tree = None
+            if self._camera_manager is not None:
+                self._camera_manager.stop_status_polling()
+            win.destroy()
+
+        def on_status_polled():
+            try:
+                self.parent.after(0, self._refresh_camera_list)
+            except Exception:
+                pass
+
+        win.protocol("WM_DELETE_WINDOW", on_close)
+        self._camera_window = win
+        self._camera_tree = tree
+        self._refresh_camera_list()
+        # 窗口打开期间在一个异步事件循环里并发轮询所有 PTZ 摄像机的位置
+        if self._camera_manager is not None:
+            self._camera_manager.start_status_polling(on_update=on_status_polled)
+
+    def _refresh_camera_list(self):
+        tree = self._camera_tree
+        if tree is None or self._camera_manager is None:
+            return
+        status_text = {'pending': '等待', 'connecting': '连接中', 'connected': '已连接', 'failed': '失败'}
+        selected = tree.selection()
+        tree.delete(*tree.get_children())
+        for info in self._camera_manager.list_cameras():
+            status = status_text.get(info.status, info.status)
+            if info.status == 'failed' and info.error:
+                status = f"失败: {info.error[:40]}"
+            position = ''
+            if info.ptz_error:
+                position = f"错误: {info.ptz_error[:30]}"
+            elif info.ptz_status and info.ptz_status.get('pan') is not None:
+                st = info.ptz_status
+                position = f"{st['pan']:.2f} / {st['tilt']:.2f} / {st['zoom'] or 0:.2f}"
+                if st.get('pan_tilt_status') == 'MOVING':
+                    position += " 移动中"
+            tree.insert('', tk.END, iid=info.key, values=(
+                info.name or info.host, info.key, status, '是' if info.has_ptz else '否', position,
+                info.uri(0) or ''))
+        for iid in selected:
+            if tree.exists(iid):
+                tree.selection_set(iid)
+
+    def _selected_camera(self):
+        if self._camera_tree is None or self._camera_manager is None:
+            return None
+        selection = self._camera_tree.selection()
+        if not selection:
+            messagebox.showinfo("提示", "请先选择一台摄像机")
+            return None
+        return self._camera_manager.cameras.get(selection[0])
+
+    def _use_camera_stream(self, var, index):
+        """把选中摄像机的流地址填入主画面/画中画，正在播放时立即切换"""
+        info = self._selected_camera()
+        if info is None:
+            return
+        url = self._camera_manager.stream_url(info, index)
+        if not url:
+            messagebox.showerror("错误", "该摄像机尚未获取到流地址")
+            return
+        var.set(url)
+        if self.is_playing:
+            self._restart_for_config_change(f"stream url {info.key}")
+
+    def _use_camera_ptz(self):
+        """PTZ 控制切换到选中的摄像机（复用已建立的连接）"""
+        info = self._selected_camera()
+        if info is None:
+            return
+        if info.controller is None:
+            messagebox.showerror("错误", "该摄像机尚未连接成功")
+            return
+        self.ip_entry.delete(0, tk.END)
+        self.ip_entry.insert(0, info.host)
+        self.port_entry.delete(0, tk.END)
+        self.port_entry.insert(0, str(info.port))
+        self._on_onvif_status('connected', info.controller)
+
+    def _ptz_call(self, func, *args, on_done=None):
+        """在 PTZ 线程执行控制器方法；on_done(result) 在主线程调用，出错时弹窗"""
+        if self._ptz_worker is None:
+            messagebox.showerror("错误", "请先连接ONVIF摄像机")
+            return None
+        future = self._ptz_worker.call(func, *args)
+
+        def done(f):
+            if f.cancelled():
+                return
+            error = f.exception()
+            if error is not None:
+                self.parent.after(0, lambda: messagebox.showerror("错误", f"PTZ操作失败: {error}"))
+            elif on_done is not None:
+                self.parent.after(0, lambda: on_done(f.result()))
+
+        future.add_done_callback(done)
+        return future
+
+    def refresh_presets(self):
+        """后台读取预置位表并刷新下拉框"""
+        if self.onvif_controller is None or self._ptz_worker is None:
+            return
+
+        def update(presets):
+            self._preset_tokens = {f"{name} ({token})": token for token, (name, _) in presets.items()}
+            self.preset_combo.config(values=list(self._preset_tokens))
+
+        self._ptz_call(self.onvif_controller.get_presets, True, on_done=update)
+
+    def goto_selected_preset(self):
+        token = self._preset_tokens.get(self.preset_var.get())
+        if token is None:
+            messagebox.showinfo("提示", "请先选择预置位")
+            return
+        self._ptz_call(self.onvif_controller.goto_preset, token)
+
+    def save_preset(self):
+        """把当前位置保存为新的预置位"""
+        if self.onvif_controller is None:
+            messagebox.showerror("错误", "请先连接ONVIF摄像机")
+            return
+        name = time.strftime('P%m%d-%H%M%S')
+        self._ptz_call(self.onvif_controller.set_preset, name, on_done=lambda _: self.refresh_presets())
+
+    def _on_region_press(self, event):
+        self._region_start = (event.x, event.y)
+
+    def _on_region_release(self, event):
+        """右键框选结束：把面板坐标换算为画面内的归一化坐标后执行区域定位"""
+        start, self._region_start = self._region_start, None
+        imgtk = getattr(self.panel1, 'imgtk', None)
+        if start is None or imgtk is None or self.onvif_controller is None:
+            return
+        if self._settings.snapshot.compositing and self._composite_layout != LAYOUT_PIP:
+            messagebox.showinfo("提示", "宫格/并排布局下不支持框选定位")
+            return
+        img_w, img_h = imgtk.width(), imgtk.height()
+        # 图像在 Label 中居中显示
+        off_x = (self.panel1.winfo_width() - img_w) / 2.0
+        off_y = (self.panel1.winfo_height() - img_h) / 2.0
+        x1, y1 = (start[0] - off_x) / img_w, (start[1] - off_y) / img_h
+        x2, y2 = (event.x - off_x) / img_w, (event.y - off_y) / img_h
+        rect = [max(0.0, min(1.0, v)) for v in (x1, y1, x2, y2)]
+        # 单击（没有拖动）只对准该点，不改变变焦
+        zoom_to_fit = abs(rect[2] - rect[0]) > 0.02 and abs(rect[3] - rect[1]) > 0.02
+        self._ptz_call(self.onvif_controller.go_to_region, *rect, zoom_to_fit)
+
+    def shutdown_ptz_worker(self):
+        """关闭 PTZ 命令队列（重新连接或退出时调用）"""
+        if self._auto_tracker is not None:
+            self._auto_tracker.reset(stop=False)
+            self._auto_tracker = None
+        if self._ptz_worker is not None:
+            self._ptz_worker.shutdown()
+            self._ptz_worker = None
 
     def move_camera(self, pan, tilt):
-        """移动摄像机"""
-        if self.onvif_controller:
-            send, recv = self.onvif_controller.relative_move_with_log(pan, tilt, 0)
-            self.log_onvif(send, recv)
+        """移动摄像机（入队后立即返回，连续点击会合并为一次移动）"""
+        if self._ptz_worker:
+            return self._ptz_worker.relative(pan, tilt, 0)
     
     def zoom_camera(self, zoom):
         """变焦控制"""
-        if self.onvif_controller:
-            send, recv = self.onvif_controller.relative_move_with_log(0, 0, zoom)
-            self.log_onvif(send, recv)
+        if self._ptz_worker:
+            return self._ptz_worker.relative(0, 0, zoom)
     
+    def toggle_recording(self):
+        """开始/停止主画面（以及开启画中画时的第二路）的分段录像"""
+        if self.recording_enabled.get():
+            cfg = self._settings.snapshot
+            urls = [cfg.stream1_url] + ([cfg.stream2_url] if cfg.pip_enabled and cfg.stream2_url else [])
+            for url in urls:
+                if not url or url in self._recorders:
+                    continue
+                name = safe_name(url)
+                recorder = SegmentRecorder(url, os.path.join(self.recordings_dir, name), name=name,
+                                           segment_seconds=self.record_segment_seconds,
+                                           retention_seconds=self.record_retention_seconds,
+                                           quota_bytes=self.record_quota_bytes)
+                self._recorders[url] = recorder.start()
+                print(f"开始录像: {name}")
+        else:
+            self.stop_recording()
+
+    def stop_recording(self):
+        recorders, self._recorders = self._recorders, {}
+        for recorder in recorders.values():
+            recorder.stop()
+            print(f"停止录像: {recorder.name}")
+
+    def toggle_event_clips(self):
+        """开始/停止主流的事件片段缓冲"""
+        if self.event_clip_enabled.get():
+            url = self._settings.snapshot.stream1_url
+            if not url:
+                messagebox.showerror("错误", "请先设置主画面地址")
+                self.event_clip_enabled.set(False)
+                return
+            if self._clip_buffer is not None:
+                return
+            self._clip_buffer = ClipBuffer(url, self.clips_dir, pre_seconds=self.clip_pre_seconds,
+                                           post_seconds=self.clip_post_seconds).start()
+            print(f"事件片段缓冲已启动: {self._clip_buffer.name}")
+        else:
+            self.stop_event_clips()
+
+    def stop_event_clips(self):
+        clip_buffer, self._clip_buffer = self._clip_buffer, None
+        if clip_buffer is not None:
+            clip_buffer.stop()
+            print("事件片段缓冲已停止")
+
+    def open_playback(self):
+        """打开录像回放窗口（默认选中当前主画面的录像）"""
+        if self._playback_window is not None:
+            self._playback_window.lift()
+            return
+        camera = safe_name(self._settings.snapshot.stream1_url)
+        if camera not in list_recordings(self.recordings_dir):
+            camera = None
+
+        def on_close():
+            self._playback_window = None
+
+        self._playback_window = PlaybackWindow(self.parent, self.recordings_dir, self._event_store,
+                                               camera=camera, on_close=on_close)
+
+    def _grid_sources(self):
+        """宫格预览的摄像机列表：已发现的摄像机（主/子码流），没有时使用主画面与画中画地址"""
+        sources = []
+        if self._camera_manager is not None:
+            for info in self._camera_manager.list_cameras():
+                main_url = self._camera_manager.stream_url(info, 0)
+                if not main_url:
+                    continue
+                sub_url = self._camera_manager.stream_url(info, 1)
+                sources.append(GridSource(info.name or info.host, main_url,
+                                          sub_url if sub_url != main_url else None, safe_name(main_url)))
+        if not sources:
+            cfg = self._settings.snapshot
+            for name, url in (("主画面", cfg.stream1_url), ("画中画", cfg.stream2_url)):
+                if url:
+                    sources.append(GridSource(name, url, None, safe_name(url)))
+        return sources
+
+    def _api_health(self):
+        """/health 中的播放器状态（在 API 线程中调用，只读普通属性，不访问 Tk 变量）"""
+        return {
+            'playing': self.is_playing,
+            'fps': round(getattr(self, '_current_fps', 0.0), 1),
+            'recording': [r.status() for r in list(self._recorders.values())],
+            'event_clips': self._clip_buffer.status() if self._clip_buffer is not None else None,
+            'event_store': self._event_store.stats() if self._event_store is not None else None,
+            'detection': self._detect_stage.stats(),
+        }
+
+    def open_grid_view(self):
+        """打开多画面宫格预览（右键某格设为主画面）"""
+        if self._grid_view is not None:
+            self._grid_view.lift()
+            return
+        sources = self._grid_sources()
+        if not sources:
+            messagebox.showerror("错误", "没有可预览的摄像机，请先设置地址或发现摄像机")
+            return
+
+        def on_close():
+            self._grid_view = None
+
+        def on_select(source):
+            self.stream1_var.set(source.main_url)
+            if self.is_playing:
+                self._restart_for_config_change(f"grid select {source.name}")
+
+        self._grid_view = GridView(self.parent, sources, snapshot_service=self._snapshot_service,
+                                   stream_info_cache=self._stream_info_cache, on_close=on_close,
+                                   on_select=on_select)
+
+    def toggle_auto_track(self):
+        """切换自动跟踪（需要已连接摄像机并启用智能模式）"""
+        if self.auto_track_enabled.get():
+            if self._auto_tracker is None:
+                messagebox.showerror("错误", "请先连接ONVIF摄像机")
+                self.auto_track_enabled.set(False)
+                return
+            if not self.ai_mode_enabled.get():
+                messagebox.showerror("错误", "请先启用智能模式")
+                self.auto_track_enabled.set(False)
+                return
+            self._tracker_reset_pending = True
+            print("自动跟踪已启用")
+        else:
+            if self._auto_tracker is not None:
+                self._auto_tracker.reset(stop=True)
+            self.track_status_label.config(text="")
+            print("自动跟踪已禁用")
+
+    def _update_track_status(self):
+        """显示控制环延迟预算（检测滞后 + 命令往返 / 预算）"""
+        if self._auto_tracker is None or not self.auto_track_enabled.get():
+            return
+        st = self._auto_tracker.stats()
+        self.track_status_label.config(
+            text=f"{st['loop_hz']:.1f}Hz 延迟 {st['total_latency_ms']:.0f}/{st['budget_ms']:.0f}ms",
+            fg="#00d4aa" if st['gain_scale'] >= 1.0 else "#ffaa00")
+
     def toggle_ai_mode(self):
         """切换智能模式"""
         if self.ai_mode_enabled.get():
@@ -1601,20 +2762,21 @@ class PlayerWindow(ttk.Frame):
                         self.ai_mode_enabled.set(False)
                         self.yolo_detector = None
                         return
-                    # 初始化异步检测队列与后台线程（如果尚未启动）
-                    try:
-                        if self._detect_queue is None:
-                            self._detect_queue = queue.Queue(maxsize=1)
-                        if self._detect_thread is None or not getattr(self._detect_thread, 'is_alive', lambda: False)():
-                            self._detect_thread = Thread(target=self._detect_worker, daemon=True)
-                            self._detect_thread.start()
-                    except Exception:
-                        pass
                 except Exception as e:
                     messagebox.showerror("错误", f"初始化YOLO失败: {str(e)}")
                     self.ai_mode_enabled.set(False)
                     self.yolo_detector = None
                     return
+            # 启动检测阶段（关闭后再次启用时重新启动）
+            self._detect_stage.start()
+            if self._detect_stats_job is None:
+                self._update_detect_stats()
             print("智能模式已启用")
         else:
-            print("智能模式已禁用")
\ No newline at end of file
+            if self.auto_track_enabled.get():
+                self.auto_track_enabled.set(False)
+                self.toggle_auto_track()
+            self._detect_stage.stop(timeout=0)
+            with self.ai_lock:
+                self._last_detections = []
+            print(f"智能模式已禁用（检测统计: {self._detect_stage.stats()}）")
\ No newline at end of file
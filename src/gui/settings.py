@@ -0,0 +1,88 @@
+"""
+播放器设置快照
+UI 线程通过 Tk 变量的 trace 维护一个不可变设置快照，并以整体替换的方式发布；
+流线程、检测线程只读取普通 Python 属性，不再每帧跨线程调用 Tcl 解释器。
+"""
+import dataclasses
+from dataclasses import dataclass
+from functools import cached_property
+import tkinter as tk
+
+
+@dataclass(frozen=True)
+class PlayerSettings:
+    """不可变的设置快照（version 每次变化加一，工作线程可据此感知变化）"""
+    stream1_url: str = ''
+    stream2_url: str = ''
+    stream1_backup_url: str = ''
+    pip_enabled: bool = True
+    use_ffmpeg_pip: bool = False
+    low_latency: bool = False
+    hw_accel: bool = False
+    hot_standby: bool = False
+    ai_mode: bool = False
+    detect_person: bool = True
+    detect_car: bool = True
+    detect_drone: bool = True
+    auto_track: bool = False
+    conf_threshold: float = 0.25
+    version: int = 0
+
+    @property
+    def compositing(self):
+        """是否由 FFmpeg 在 C 层合成所有输入"""
+        return self.use_ffmpeg_pip and self.pip_enabled
+
+    @cached_property
+    def target_classes(self):
+        """要检测的类别列表（每个快照只计算一次），为空时返回 None 表示检测所有类别"""
+        classes = []
+        if self.detect_person:
+            classes.append('person')
+        if self.detect_car:
+            classes.extend(['car', 'truck', 'bus', 'motorcycle', 'bicycle'])
+        if self.detect_drone:
+            classes.append('drone')
+        return classes or None
+
+
+class SettingsPublisher:
+    """把一组 Tk 变量绑定到 PlayerSettings 字段
+
+    bindings: {字段名: tk.Variable}
+    变量被写入时（只会发生在主线程）读取新值并原子替换 snapshot；
+    其他线程直接读取 `snapshot` 属性即可得到一致的设置。
+    """
+    def __init__(self, bindings):
+        self._bindings = dict(bindings)
+        values = {}
+        for field, var in self._bindings.items():
+            value = self._read(field, var)
+            if value is not None:
+                values[field] = value
+        self._snapshot = PlayerSettings(**values)
+        for field, var in self._bindings.items():
+            var.trace_add('write', lambda *_, f=field: self._on_write(f))
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @staticmethod
+    def _read(field, var):
+        try:
+            value = var.get()
+        except (tk.TclError, ValueError):
+            return None  # 输入过程中的非法中间值，保持旧值
+        if isinstance(value, str):
+            value = value.strip()
+        if field == 'conf_threshold':
+            value = float(value)
+        return value
+
+    def _on_write(self, field):
+        value = self._read(field, self._bindings[field])
+        current = self._snapshot
+        if value is None or getattr(current, field) == value:
+            return
+        self._snapshot = dataclasses.replace(current, **{field: value, 'version': current.version + 1})
@@ -3,6 +3,9 @@ RTSP视频播放器主程序入口
 """
 import sys
 import os
+import time
+
+_START_TIME = time.perf_counter()
 
 # 将项目根目录添加到Python路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -30,6 +33,13 @@ def main():
     
     player_window = PlayerWindow(root)
     player_window.pack(fill=tk.BOTH, expand=True)
+
+    # 首个窗口绘制完成的耗时（重量级依赖均已延迟导入）；基准测试模式下报告后立即退出
+    def report_first_window():
+        print(f"[诊断] 启动到首个窗口: {(time.perf_counter() - _START_TIME) * 1000:.0f} ms", flush=True)
+        if os.environ.get('RTSP_PLAYER_STARTUP_BENCHMARK'):
+            on_closing()
+    root.after_idle(report_first_window)
     
     # 确保右侧面板始终可见
     def ensure_right_panel_visible(event=None):
@@ -48,6 +58,25 @@ def main():
                 player_window.stream_thread.join(timeout=2)
         # 清理所有FFmpeg进程
         player_window._cleanup_ffmpeg_procs()
+        # 停止检测阶段
+        player_window._detect_stage.stop(timeout=0)
+        # 关闭PTZ命令队列
+        player_window.shutdown_ptz_worker()
+        # 停止录像（FFmpeg 会写完当前分段）
+        player_window.stop_recording()
+        player_window.stop_event_clips()
+        if player_window._config_watcher is not None:
+            player_window._config_watcher.stop()
+        player_window._snapshot_service.shutdown()
+        player_window._api_server.stop()
+        if player_window._grid_view is not None:
+            player_window._grid_view.close()
+        if player_window._playback_window is not None:
+            player_window._playback_window.close()
+        if player_window._event_store is not None:
+            player_window._event_store.close()
+        if player_window._camera_manager is not None:
+            player_window._camera_manager.shutdown()
         # 关闭窗口
         root.destroy()
     
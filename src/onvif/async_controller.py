@@ -0,0 +1,334 @@
+"""
+异步 ONVIF 控制模块（asyncio）
+只实现项目用到的少数 PTZ / Media 操作，直接拼装 SOAP 报文、用 asyncio 流收发 HTTP，
+不依赖 zeep；一个事件循环即可并发轮询/控制数百台摄像机，每次调用有独立超时。
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from xml.sax.saxutils import escape
+
+NS = {
+    'soap': 'http://www.w3.org/2003/05/soap-envelope',
+    'tds': 'http://www.onvif.org/ver10/device/wsdl',
+    'trt': 'http://www.onvif.org/ver10/media/wsdl',
+    'tptz': 'http://www.onvif.org/ver20/ptz/wsdl',
+    'tt': 'http://www.onvif.org/ver10/schema',
+    'wsse': 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd',
+    'wsu': 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd',
+}
+
+_PASSWORD_DIGEST = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-username-token-profile-1.0#PasswordDigest'
+_NONCE_ENCODING = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-soap-message-security-1.0#Base64Binary'
+
+
+class SoapFault(Exception):
+    """设备返回的 SOAP Fault 或非 200 响应"""
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _find(element, name):
+    """按本地名查找第一个子孙节点（ONVIF 设备返回的命名空间前缀各不相同）"""
+    for node in element.iter():
+        if _local(node.tag) == name:
+            return node
+    return None
+
+
+def _security_header(username, password, time_offset=0.0):
+    """WS-Security UsernameToken（PasswordDigest），created 使用与设备对齐后的时间"""
+    nonce = os.urandom(16)
+    created = datetime.fromtimestamp(time.time() + time_offset, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    digest = base64.b64encode(hashlib.sha1(nonce + created.encode() + password.encode()).digest()).decode()
+    return (
+        f'<wsse:Security xmlns:wsse="{NS["wsse"]}" xmlns:wsu="{NS["wsu"]}">'
+        f'<wsse:UsernameToken><wsse:Username>{escape(username)}</wsse:Username>'
+        f'<wsse:Password Type="{_PASSWORD_DIGEST}">{digest}</wsse:Password>'
+        f'<wsse:Nonce EncodingType="{_NONCE_ENCODING}">{base64.b64encode(nonce).decode()}</wsse:Nonce>'
+        f'<wsu:Created>{created}</wsu:Created></wsse:UsernameToken></wsse:Security>'
+    )
+
+
+def build_envelope(body, username=None, password=None, time_offset=0.0):
+    header = _security_header(username, password, time_offset) if username else ''
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<s:Envelope xmlns:s="{NS["soap"]}" xmlns:tds="{NS["tds"]}" xmlns:trt="{NS["trt"]}" '
+        f'xmlns:tptz="{NS["tptz"]}" xmlns:tt="{NS["tt"]}">'
+        f'<s:Header>{header}</s:Header><s:Body>{body}</s:Body></s:Envelope>'
+    )
+
+
+def _vector(tag, pan, tilt, zoom):
+    return (f'<tptz:{tag}><tt:PanTilt x="{pan:.6f}" y="{tilt:.6f}"/>'
+            f'<tt:Zoom x="{zoom:.6f}"/></tptz:{tag}>')
+
+
+class _HTTPConnection:
+    """单台主机的 HTTP/1.1 keep-alive 连接（同一时刻只有一个请求在途）"""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.lock = asyncio.Lock()
+        self.reader = None
+        self.writer = None
+
+    async def _open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        self.reader = self.writer = None
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("连接已被对端关闭")
+        parts = status_line.decode('latin-1').split(None, 2)
+        status = int(parts[1]) if len(parts) > 1 else 0
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body
+
+    async def post(self, path, payload):
+        data = payload.encode('utf-8')
+        request = (
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Content-Type: application/soap+xml; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n"
+        ).encode('latin-1') + data
+        async with self.lock:
+            # 复用的空闲连接可能已被摄像机关闭：失败时重连重试一次
+            for attempt in range(2):
+                reused = self.writer is not None
+                try:
+                    if self.writer is None:
+                        await self._open()
+                    self.writer.write(request)
+                    await self.writer.drain()
+                    return await self._read_response()
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    self.close()
+                    if not reused or attempt:
+                        raise
+                except BaseException:
+                    # 超时取消等情况下连接状态未知，丢弃
+                    self.close()
+                    raise
+
+
+class AsyncONVIFController:
+    """asyncio 版 ONVIF 控制器（只覆盖 PTZ / Media 的常用操作）"""
+    def __init__(self, host, port, username, password, timeout=5.0):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.device_url = f"http://{host}:{self.port}/onvif/device_service"
+        self.media_url = None
+        self.ptz_url = None
+        self.profile_token = None
+        self.time_offset = 0.0  # 设备时间 - 本地时间（秒），用于 WS-Security 的 created
+        self._connections = {}
+
+    @property
+    def key(self):
+        return f"{self.host}:{self.port}"
+
+    def _connection(self, url):
+        parsed = urlparse(url)
+        host, port = parsed.hostname or self.host, parsed.port or 80
+        conn = self._connections.get((host, port))
+        if conn is None:
+            conn = _HTTPConnection(host, port)
+            self._connections[(host, port)] = conn
+        return conn, parsed.path or '/'
+
+    async def call(self, url, body, auth=True, timeout=None):
+        """发送一次 SOAP 请求，返回响应 Body 元素；超时抛出 asyncio.TimeoutError"""
+        envelope = build_envelope(body, self.username if auth else None, self.password, self.time_offset)
+        conn, path = self._connection(url)
+        status, data = await asyncio.wait_for(conn.post(path, envelope), timeout or self.timeout)
+        try:
+            root = ET.fromstring(data)
+        except ET.ParseError as e:
+            raise SoapFault(f"HTTP {status}: 无法解析响应 ({e})")
+        body_el = _find(root, 'Body')
+        fault = _find(body_el, 'Fault') if body_el is not None else None
+        if fault is not None or status != 200:
+            reason = _find(fault, 'Text') if fault is not None else None
+            raise SoapFault(f"HTTP {status}: {reason.text if reason is not None else '请求失败'}")
+        return body_el
+
+    async def _sync_time(self):
+        """GetSystemDateAndTime 不需要认证，用它对齐时间，避免时钟偏差导致认证失败"""
+        try:
+            body = await self.call(self.device_url, '<tds:GetSystemDateAndTime/>', auth=False)
+            utc = _find(body, 'UTCDateTime')
+            if utc is None:
+                return
+            d, t = _find(utc, 'Date'), _find(utc, 'Time')
+            device = datetime(int(_find(d, 'Year').text), int(_find(d, 'Month').text), int(_find(d, 'Day').text),
+                              int(_find(t, 'Hour').text), int(_find(t, 'Minute').text), int(_find(t, 'Second').text),
+                              tzinfo=timezone.utc)
+            self.time_offset = device.timestamp() - time.time()
+        except Exception as e:
+            print(f"[{self.key}] 同步设备时间失败: {e}")
+
+    async def connect(self):
+        """获取服务地址与第一个配置集的 token"""
+        await self._sync_time()
+        body = await self.call(self.device_url,
+                               '<tds:GetCapabilities><tds:Category>All</tds:Category></tds:GetCapabilities>')
+        for name in ('Media', 'PTZ'):
+            node = _find(body, name)
+            xaddr = _find(node, 'XAddr') if node is not None else None
+            if xaddr is not None and xaddr.text:
+                if name == 'Media':
+                    self.media_url = xaddr.text.strip()
+                else:
+                    self.ptz_url = xaddr.text.strip()
+        if not self.media_url:
+            raise SoapFault("设备未提供 Media 服务")
+        body = await self.call(self.media_url, '<trt:GetProfiles/>')
+        profile = _find(body, 'Profiles')
+        if profile is None:
+            raise SoapFault("未找到可用的配置集")
+        self.profile_token = profile.get('token')
+        return self
+
+    def _require_ptz(self):
+        if not self.ptz_url or not self.profile_token:
+            raise SoapFault("摄像机未连接或不支持 PTZ")
+
+    async def get_status(self, timeout=None):
+        """返回 {'pan', 'tilt', 'zoom', 'pan_tilt_status', 'zoom_status'}"""
+        self._require_ptz()
+        body = await self.call(self.ptz_url, f'<tptz:GetStatus><tptz:ProfileToken>{escape(self.profile_token)}'
+                                             f'</tptz:ProfileToken></tptz:GetStatus>', timeout=timeout)
+        status = {'pan': None, 'tilt': None, 'zoom': None, 'pan_tilt_status': None, 'zoom_status': None}
+        position = _find(body, 'Position')
+        if position is not None:
+            pt, zm = _find(position, 'PanTilt'), _find(position, 'Zoom')
+            if pt is not None:
+                status['pan'], status['tilt'] = float(pt.get('x', 0)), float(pt.get('y', 0))
+            if zm is not None:
+                status['zoom'] = float(zm.get('x', 0))
+        move = _find(body, 'MoveStatus')
+        if move is not None:
+            pt, zm = _find(move, 'PanTilt'), _find(move, 'Zoom')
+            status['pan_tilt_status'] = pt.text if pt is not None else None
+            status['zoom_status'] = zm.text if zm is not None else None
+        return status
+
+    async def continuous_move(self, pan, tilt, zoom=0.0, timeout=None):
+        self._require_ptz()
+        await self.call(self.ptz_url, f'<tptz:ContinuousMove><tptz:ProfileToken>{escape(self.profile_token)}</tptz:ProfileToken>'
+                                      f'{_vector("Velocity", pan, tilt, zoom)}</tptz:ContinuousMove>', timeout=timeout)
+
+    async def relative_move(self, pan, tilt, zoom=0.0, timeout=None):
+        self._require_ptz()
+        await self.call(self.ptz_url, f'<tptz:RelativeMove><tptz:ProfileToken>{escape(self.profile_token)}</tptz:ProfileToken>'
+                                      f'{_vector("Translation", pan, tilt, zoom)}</tptz:RelativeMove>', timeout=timeout)
+
+    async def absolute_move(self, pan, tilt, zoom, timeout=None):
+        self._require_ptz()
+        await self.call(self.ptz_url, f'<tptz:AbsoluteMove><tptz:ProfileToken>{escape(self.profile_token)}</tptz:ProfileToken>'
+                                      f'{_vector("Position", pan, tilt, zoom)}</tptz:AbsoluteMove>', timeout=timeout)
+
+    async def stop(self, timeout=None):
+        self._require_ptz()
+        await self.call(self.ptz_url, f'<tptz:Stop><tptz:ProfileToken>{escape(self.profile_token)}</tptz:ProfileToken>'
+                                      f'<tptz:PanTilt>true</tptz:PanTilt><tptz:Zoom>true</tptz:Zoom></tptz:Stop>',
+                        timeout=timeout)
+
+    async def get_stream_uri(self, timeout=None):
+        body = await self.call(self.media_url, (
+            '<trt:GetStreamUri><trt:StreamSetup><tt:Stream>RTP-Unicast</tt:Stream>'
+            '<tt:Transport><tt:Protocol>RTSP</tt:Protocol></tt:Transport></trt:StreamSetup>'
+            f'<trt:ProfileToken>{escape(self.profile_token)}</trt:ProfileToken></trt:GetStreamUri>'), timeout=timeout)
+        uri = _find(body, 'Uri')
+        return uri.text.strip() if uri is not None and uri.text else None
+
+    def close(self):
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+
+class AsyncCameraGroup:
+    """一组异步控制器：并发连接、并发轮询、批量移动
+
+    concurrency 限制同时在途的请求数；每个结果字典的值要么是返回值，要么是异常对象，
+    单台摄像机超时或出错不会影响其他摄像机。
+    """
+    def __init__(self, controllers, concurrency=64):
+        self.controllers = {c.key: c for c in controllers}
+        self.concurrency = concurrency
+        self._semaphore = None
+
+    async def _run(self, controller, func, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await getattr(controller, func)(*args, **kwargs)
+
+    async def _gather(self, func, *args, keys=None, **kwargs):
+        targets = [self.controllers[k] for k in keys] if keys is not None else list(self.controllers.values())
+        results = await asyncio.gather(*(self._run(c, func, *args, **kwargs) for c in targets),
+                                       return_exceptions=True)
+        return {c.key: r for c, r in zip(targets, results)}
+
+    async def connect_all(self, keys=None):
+        return await self._gather('connect', keys=keys)
+
+    async def poll_status(self, timeout=2.0, keys=None):
+        return await self._gather('get_status', keys=keys, timeout=timeout)
+
+    async def continuous_move(self, pan, tilt, zoom=0.0, timeout=2.0, keys=None):
+        return await self._gather('continuous_move', pan, tilt, zoom, keys=keys, timeout=timeout)
+
+    async def relative_move(self, pan, tilt, zoom=0.0, timeout=2.0, keys=None):
+        return await self._gather('relative_move', pan, tilt, zoom, keys=keys, timeout=timeout)
+
+    async def stop(self, timeout=2.0, keys=None):
+        return await self._gather('stop', keys=keys, timeout=timeout)
+
+    def close(self):
+        for c in self.controllers.values():
+            c.close()
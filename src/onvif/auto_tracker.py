@@ -0,0 +1,202 @@
+"""
+自动跟踪模块
+根据检测结果选择一个目标轨迹，计算其中心相对画面中心的误差，
+经 PID 速度控制器生成持续移动命令（死区、限速、按目标大小自动变焦），通过 PTZWorker 发送。
+
+检测频率只有 3~10 Hz，且检测结果本身滞后于画面，控制环路里有明显的纯延迟；
+这里测量"采集 -> 检测完成"和"命令提交 -> 摄像机确认"两段延迟，
+用目标速度把误差外推到命令生效的时刻，并在总延迟超过预算时按比例降低增益，避免来回振荡。
+"""
+import time
+from threading import Lock
+
+
+def _clamp(value, limit):
+    return max(-limit, min(limit, value))
+
+
+class AxisPID:
+    """单轴 PID（积分限幅 + 微分一阶滤波）"""
+    def __init__(self, kp, ki, kd, limit=1.0, integral_limit=0.5, derivative_smoothing=0.5):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limit = limit
+        self.integral_limit = integral_limit
+        self.derivative_smoothing = derivative_smoothing
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.prev_error = None
+
+    def step(self, error, dt):
+        if error == 0:
+            # 进入死区后清空积分，防止积分项把目标推出死区再拉回来
+            self.integral = 0.0
+        else:
+            self.integral = _clamp(self.integral + error * dt, self.integral_limit)
+        if self.prev_error is not None and dt > 0:
+            raw = (error - self.prev_error) / dt
+            a = self.derivative_smoothing
+            self.derivative = a * raw + (1 - a) * self.derivative
+        self.prev_error = error
+        return _clamp(self.kp * error + self.ki * self.integral + self.kd * self.derivative, self.limit)
+
+
+class AutoTracker:
+    """检测驱动的自动跟踪控制环
+
+    ptz_worker: PTZWorker（持续移动采用最新值覆盖，命令自带到期停止）
+    pan_sign / tilt_sign: 画面坐标方向与摄像机速度方向的对应关系，
+        默认与界面方向按钮一致（目标偏右 -> pan 为正，目标偏下 -> tilt 为正）
+    latency_budget: 控制环允许的总延迟（秒），超出时按比例降低增益
+    """
+    def __init__(self, ptz_worker, kp=0.8, ki=0.05, kd=0.1, max_speed=0.6, deadband=0.06,
+                 target_fill=0.35, zoom_gain=0.6, zoom_deadband=0.1, max_zoom_speed=0.3,
+                 min_command_interval=0.15, latency_budget=0.4, pan_sign=1, tilt_sign=1):
+        self.ptz_worker = ptz_worker
+        self.pan_pid = AxisPID(kp, ki, kd, limit=max_speed)
+        self.tilt_pid = AxisPID(kp, ki, kd, limit=max_speed)
+        self.deadband = deadband
+        self.target_fill = target_fill
+        self.zoom_gain = zoom_gain
+        self.zoom_deadband = zoom_deadband
+        self.max_zoom_speed = max_zoom_speed
+        self.min_command_interval = min_command_interval
+        self.latency_budget = latency_budget
+        self.pan_sign = pan_sign
+        self.tilt_sign = tilt_sign
+        self.lock = Lock()
+        self.locked_id = None
+        self._moving = False
+        self._last_update = None
+        self._last_command_time = 0
+        self._last_velocity = (0.0, 0.0, 0.0)
+        # 延迟与频率统计（指数平均）
+        self.detection_latency = 0.0
+        self.command_latency = 0.0
+        self.loop_interval = 0.0
+
+    def reset(self, stop=True):
+        """放弃当前目标；stop 为 True 时同时停止摄像机"""
+        with self.lock:
+            self.locked_id = None
+            self.pan_pid.reset()
+            self.tilt_pid.reset()
+            self._last_update = None
+            self._last_velocity = (0.0, 0.0, 0.0)
+            was_moving, self._moving = self._moving, False
+        if stop and was_moving and self.ptz_worker is not None:
+            self.ptz_worker.stop()
+
+    @staticmethod
+    def _ema(old, new, alpha=0.3):
+        return new if old == 0 else alpha * new + (1 - alpha) * old
+
+    def select_target(self, tracks, preferred_classes=None):
+        """优先保持已锁定的目标；否则在首选类别中选面积最大的"""
+        if self.locked_id is not None:
+            for t in tracks:
+                if t.track_id == self.locked_id:
+                    return t
+        candidates = tracks
+        if preferred_classes:
+            preferred = [t for t in tracks if t.class_name in preferred_classes]
+            candidates = preferred or tracks
+        if not candidates:
+            return None
+        return max(candidates, key=lambda t: t.area)
+
+    def _on_command_done(self, submitted_at, future):
+        if future.cancelled():
+            return
+        with self.lock:
+            self.command_latency = self._ema(self.command_latency, time.time() - submitted_at)
+
+    def update(self, tracks, frame_w, frame_h, capture_time=None, preferred_classes=None):
+        """用一次检测后的轨迹更新控制环（在检测线程中调用，不会阻塞）"""
+        now = time.time()
+        with self.lock:
+            if capture_time:
+                self.detection_latency = self._ema(self.detection_latency, max(0.0, now - capture_time))
+            dt = now - self._last_update if self._last_update else 0.0
+            if dt > 0:
+                self.loop_interval = self._ema(self.loop_interval, dt)
+            self._last_update = now
+            dt = min(max(dt, 0.05), 1.0) if dt else 0.1
+
+            target = self.select_target(tracks, preferred_classes)
+            if target is None or frame_w <= 0 or frame_h <= 0:
+                lost = self.locked_id is not None or self._moving
+            else:
+                lost = False
+        if target is None or frame_w <= 0 or frame_h <= 0:
+            if lost:
+                self.reset(stop=True)
+            return None
+
+        with self.lock:
+            self.locked_id = target.track_id
+            # 总延迟：检测滞后 + 命令生效时间；按目标速度把中心外推到命令生效时刻
+            latency = self.detection_latency + self.command_latency
+            cx, cy = target.center
+            cx += target.velocity[0] * latency
+            cy += target.velocity[1] * latency
+            ex = _clamp((cx - frame_w / 2.0) / (frame_w / 2.0), 1.0)
+            ey = _clamp((cy - frame_h / 2.0) / (frame_h / 2.0), 1.0)
+            if abs(ex) < self.deadband:
+                ex = 0.0
+            if abs(ey) < self.deadband:
+                ey = 0.0
+            scale = min(1.0, self.latency_budget / latency) if latency > 0 else 1.0
+            vx = self.pan_pid.step(ex, dt) * scale
+            vy = self.tilt_pid.step(ey, dt) * scale
+
+            # 目标基本居中后再按目标高度占比变焦，避免变焦时把目标推出画面
+            vz = 0.0
+            if abs(ex) < 0.2 and abs(ey) < 0.2:
+                fill = (target.box[3] - target.box[1]) / float(frame_h)
+                if abs(self.target_fill - fill) > self.zoom_deadband:
+                    vz = _clamp(self.zoom_gain * (self.target_fill - fill), self.max_zoom_speed)
+
+            velocity = (self.pan_sign * vx, self.tilt_sign * vy, vz)
+            if velocity == (0.0, 0.0, 0.0):
+                was_moving, self._moving = self._moving, False
+                self._last_velocity = velocity
+                send_stop = was_moving
+                send_move = False
+            else:
+                send_stop = False
+                changed = max(abs(a - b) for a, b in zip(velocity, self._last_velocity)) > 0.02
+                send_move = changed or now - self._last_command_time >= self.min_command_interval * 3
+                if now - self._last_command_time < self.min_command_interval:
+                    send_move = False
+            # 命令在下一次检测之前到期：检测中断时摄像机会自己停下
+            duration = min(max(2.5 * dt, 0.3), 1.5)
+
+        if send_stop and self.ptz_worker is not None:
+            self.ptz_worker.stop()
+        elif send_move and self.ptz_worker is not None:
+            submitted_at = time.time()
+            future = self.ptz_worker.continuous(velocity[0], velocity[1], velocity[2], duration)
+            future.add_done_callback(lambda f: self._on_command_done(submitted_at, f))
+            with self.lock:
+                self._moving = True
+                self._last_command_time = submitted_at
+                self._last_velocity = velocity
+        return target
+
+    def stats(self):
+        """控制环延迟预算：检测滞后、命令往返、检测间隔（毫秒）"""
+        with self.lock:
+            total = self.detection_latency + self.command_latency
+            return {
+                'detection_latency_ms': self.detection_latency * 1000,
+                'command_latency_ms': self.command_latency * 1000,
+                'loop_hz': 1.0 / self.loop_interval if self.loop_interval > 0 else 0.0,
+                'total_latency_ms': total * 1000,
+                'budget_ms': self.latency_budget * 1000,
+                'gain_scale': min(1.0, self.latency_budget / total) if total > 0 else 1.0,
+            }
@@ -0,0 +1,257 @@
+"""
+多摄像机管理模块
+WS-Discovery 发现设备后，用有界线程池并发连接，缓存每台摄像机的 RTSP 地址（GetStreamUri）
+与 PTZ 能力，播放端可以直接选用，不再手工输入 RTSP 地址。
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Lock, Thread, Event
+from urllib.parse import quote, urlparse, urlunparse
+
+from .async_controller import AsyncONVIFController, AsyncCameraGroup
+from .discovery import discover
+
+
+def uri_with_credentials(uri, username, password):
+    """把用户名密码写入 RTSP 地址（地址中已带认证信息时原样返回）"""
+    parsed = urlparse(uri)
+    if not username or parsed.username or not parsed.hostname:
+        return uri
+    netloc = f"{quote(username, safe='')}:{quote(password or '', safe='')}@{parsed.hostname}"
+    if parsed.port:
+        netloc += f":{parsed.port}"
+    return urlunparse(parsed._replace(netloc=netloc))
+
+
+@dataclass
+class CameraInfo:
+    """一台摄像机的连接状态与缓存的能力信息"""
+    host: str
+    port: int
+    name: str = ''
+    stream_uris: list = field(default_factory=list)  # [(profile_token, profile_name, uri), ...]
+    has_ptz: bool = False
+    status: str = 'pending'  # pending / connecting / connected / failed
+    error: str = ''
+    updated_at: float = 0.0
+    controller: object = field(default=None, repr=False, compare=False)
+    ptz_status: dict = field(default=None, compare=False)  # 最近一次轮询到的 PTZ 位置与运动状态
+    ptz_error: str = ''
+
+    @property
+    def key(self):
+        return f"{self.host}:{self.port}"
+
+    @property
+    def label(self):
+        return f"{self.name or self.host} ({self.key})"
+
+    def uri(self, index=0):
+        """第 index 个配置集的 RTSP 地址（通常 0 为主码流、1 为子码流）"""
+        if not self.stream_uris:
+            return None
+        return self.stream_uris[min(index, len(self.stream_uris) - 1)][2]
+
+
+class CameraManager:
+    """摄像机发现与并发连接
+
+    max_workers 限制同时进行的连接数：WSDL 解析已在进程内共享，
+    连接耗时主要是网络往返，过多并发只会挤占摄像机和界面的带宽。
+    """
+    def __init__(self, username='', password='', max_workers=8, cache_path=None):
+        self.username = username
+        self.password = password
+        self.cache_path = cache_path or os.path.join(os.getcwd(), 'cache', 'cameras.json')
+        self.lock = Lock()
+        self.cameras = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='onvif-connect')
+        self._poll_thread = None
+        self._poll_stop = Event()
+        self._load()
+
+    def _load(self):
+        """加载上次缓存的流地址和 PTZ 能力（不含密码）"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for entry in data:
+            try:
+                info = CameraInfo(entry['host'], int(entry['port']), entry.get('name', ''),
+                                  [tuple(u) for u in entry.get('stream_uris', [])],
+                                  bool(entry.get('has_ptz', False)), 'pending', '',
+                                  float(entry.get('updated_at', 0)))
+                self.cameras[info.key] = info
+            except (KeyError, TypeError, ValueError):
+                continue
+
+    def _save(self):
+        with self.lock:
+            data = [{'host': c.host, 'port': c.port, 'name': c.name, 'stream_uris': c.stream_uris,
+                     'has_ptz': c.has_ptz, 'updated_at': c.updated_at}
+                    for c in self.cameras.values() if c.stream_uris]
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp = self.cache_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.cache_path)
+        except Exception as e:
+            print(f"保存摄像机缓存失败: {e}")
+
+    def add(self, host, port, name=''):
+        """登记一台摄像机（已存在时返回已有记录）"""
+        with self.lock:
+            key = f"{host}:{port}"
+            info = self.cameras.get(key)
+            if info is None:
+                info = CameraInfo(host, int(port), name)
+                self.cameras[key] = info
+            elif name and not info.name:
+                info.name = name
+            return info
+
+    def discover(self, timeout=2.0, **kwargs):
+        """WS-Discovery 发现设备并登记，返回本次发现的摄像机列表"""
+        found = []
+        for device in discover(timeout=timeout, **kwargs):
+            if device.host:
+                found.append(self.add(device.host, device.port, device.name))
+        return found
+
+    def list_cameras(self):
+        with self.lock:
+            return sorted(self.cameras.values(), key=lambda c: c.key)
+
+    def stream_url(self, info, index=0):
+        """可直接交给 FFmpeg 的 RTSP 地址（带认证信息；缓存文件中只保存不带密码的地址）"""
+        uri = info.uri(index)
+        return uri_with_credentials(uri, self.username, self.password) if uri else None
+
+    def _connect(self, info, on_status):
+        info.status, info.error = 'connecting', ''
+        if on_status:
+            on_status(info)
+        try:
+            from .onvif_controller import ONVIFController
+            from .transport import ensure_pool_hosts
+            ensure_pool_hosts(len(self.cameras))  # 每台摄像机一个连接池，避免互相淘汰 keep-alive 连接
+            controller = ONVIFController(info.host, info.port, self.username, self.password)
+            info.controller = controller
+            info.stream_uris = controller.get_stream_uris()
+            info.has_ptz = controller.has_ptz
+            info.status = 'connected'
+            info.updated_at = time.time()
+        except Exception as e:
+            info.status, info.error = 'failed', str(e)
+        if on_status:
+            on_status(info)
+        return info
+
+    def connect(self, info, on_status=None):
+        """提交一次连接，返回 Future（结果为 CameraInfo）"""
+        return self._executor.submit(self._connect, info, on_status)
+
+    def connect_all(self, cameras=None, on_status=None, on_done=None):
+        """并发连接多台摄像机
+
+        on_status(info) 在连接线程中调用（每台摄像机状态变化时）；
+        on_done(cameras) 在全部完成后调用，此时流地址缓存已写盘。
+        """
+        cameras = list(cameras) if cameras is not None else self.list_cameras()
+        futures = [self.connect(c, on_status) for c in cameras]
+        if not futures:
+            if on_done:
+                on_done([])
+            return futures
+        remaining = [len(futures)]
+        remaining_lock = Lock()
+
+        def _finished(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._save()
+                if on_done:
+                    on_done(cameras)
+
+        for f in futures:
+            f.add_done_callback(_finished)
+        return futures
+
+    # ---- PTZ 状态轮询（asyncio，一个线程并发轮询所有摄像机） ----
+
+    def start_status_polling(self, interval=2.0, timeout=2.0, on_update=None):
+        """在后台事件循环中定时轮询所有已连接 PTZ 摄像机的位置
+
+        结果写入 CameraInfo.ptz_status / ptz_error；每轮结束后在轮询线程中调用 on_update()。
+        单台摄像机超时或出错只影响它自己的记录。
+        """
+        if self._poll_thread is not None and self._poll_thread.is_alive():
+            return
+        self._poll_stop = Event()
+        self._poll_thread = Thread(target=lambda: asyncio.run(self._poll_loop(interval, timeout, on_update, self._poll_stop)),
+                                   name='ptz-status', daemon=True)
+        self._poll_thread.start()
+
+    def stop_status_polling(self):
+        self._poll_stop.set()
+
+    async def _poll_loop(self, interval, timeout, on_update, stop):
+        controllers = {}
+        retry_at = {}  # 连接失败的摄像机在此时间之前不再重连
+        loop = asyncio.get_running_loop()
+        try:
+            while not stop.is_set():
+                await self.poll_status_once(controllers, retry_at, timeout)
+                if on_update:
+                    try:
+                        on_update()
+                    except Exception as e:
+                        print(f"PTZ 状态回调错误: {e}")
+                await loop.run_in_executor(None, stop.wait, interval)
+        finally:
+            for c in controllers.values():
+                c.close()
+
+    async def poll_status_once(self, controllers, retry_at=None, timeout=2.0):
+        """轮询一轮：为新摄像机建立异步控制器并连接，再并发获取所有摄像机的 PTZ 状态
+
+        controllers: 跨轮复用的 {key: AsyncONVIFController}（保持 keep-alive 连接）
+        """
+        retry_at = retry_at if retry_at is not None else {}
+        targets = [c for c in self.list_cameras() if c.status == 'connected' and c.has_ptz]
+        for info in targets:
+            if info.key not in controllers:
+                controllers[info.key] = AsyncONVIFController(info.host, info.port, self.username, self.password,
+                                                             timeout=timeout)
+        group = AsyncCameraGroup([controllers[c.key] for c in targets])
+        now = time.time()
+        pending = [k for k, c in group.controllers.items() if c.ptz_url is None and retry_at.get(k, 0) <= now]
+        results = await group.connect_all(keys=pending) if pending else {}
+        for key, result in results.items():
+            if isinstance(result, BaseException):
+                retry_at[key] = now + 30.0
+        ready = [k for k, c in group.controllers.items() if c.ptz_url is not None]
+        if ready:
+            results.update(await group.poll_status(timeout=timeout, keys=ready))
+        for key, result in results.items():
+            info = self.cameras.get(key)
+            if info is None:
+                continue
+            if isinstance(result, BaseException):
+                info.ptz_error = str(result) or type(result).__name__
+            elif isinstance(result, dict):
+                info.ptz_status, info.ptz_error = result, ''
+        return results
+
+    def shutdown(self):
+        self.stop_status_polling()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,126 @@
+"""
+WS-Discovery 设备发现模块
+向组播地址发送 Probe，收集局域网内 ONVIF 设备的 ProbeMatch 响应（只依赖标准库）。
+目标地址可配置，便于对本地 UDP 应答程序进行测试。
+"""
+import socket
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from urllib.parse import urlparse
+
+WS_DISCOVERY_ADDRESS = ('239.255.255.250', 3702)
+
+_PROBE_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<e:Envelope xmlns:e="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:w="http://schemas.xmlsoap.org/ws/2004/08/addressing" '
+    'xmlns:d="http://schemas.xmlsoap.org/ws/2005/04/discovery" '
+    'xmlns:dn="http://www.onvif.org/ver10/network/wsdl">'
+    '<e:Header>'
+    '<w:MessageID>uuid:{message_id}</w:MessageID>'
+    '<w:To e:mustUnderstand="true">urn:schemas-xmlsoap-org:ws:2005:04:discovery</w:To>'
+    '<w:Action e:mustUnderstand="true">http://schemas.xmlsoap.org/ws/2005/04/discovery/Probe</w:Action>'
+    '</e:Header>'
+    '<e:Body><d:Probe><d:Types>dn:NetworkVideoTransmitter</d:Types></d:Probe></e:Body>'
+    '</e:Envelope>'
+)
+
+
+class DiscoveredDevice:
+    """一台被发现的设备"""
+    def __init__(self, endpoint, xaddrs, scopes=None, types=None):
+        self.endpoint = endpoint  # 设备唯一标识（EndpointReference Address）
+        self.xaddrs = xaddrs      # 设备服务地址列表
+        self.scopes = scopes or []
+        self.types = types or []
+
+    @property
+    def host(self):
+        for addr in self.xaddrs:
+            parsed = urlparse(addr)
+            if parsed.hostname:
+                return parsed.hostname
+        return None
+
+    @property
+    def port(self):
+        for addr in self.xaddrs:
+            parsed = urlparse(addr)
+            if parsed.hostname:
+                return parsed.port or (443 if parsed.scheme == 'https' else 80)
+        return None
+
+    @property
+    def name(self):
+        """从 scopes 中取 onvif://www.onvif.org/name/xxx"""
+        for scope in self.scopes:
+            if '/name/' in scope:
+                return scope.rsplit('/name/', 1)[-1]
+        return self.host or self.endpoint
+
+    def __repr__(self):
+        return f"DiscoveredDevice({self.name!r}, {self.xaddrs!r})"
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_probe_matches(data):
+    """解析 ProbeMatches 响应，返回 DiscoveredDevice 列表（无法解析时返回空列表）"""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError:
+        return []
+    devices = []
+    for match in root.iter():
+        if _local_name(match.tag) != 'ProbeMatch':
+            continue
+        fields = {}
+        for child in match.iter():
+            name = _local_name(child.tag)
+            if name in ('Address', 'XAddrs', 'Scopes', 'Types') and child.text:
+                fields[name] = child.text.strip()
+        xaddrs = fields.get('XAddrs', '').split()
+        if not xaddrs:
+            continue
+        devices.append(DiscoveredDevice(fields.get('Address', xaddrs[0]), xaddrs,
+                                        fields.get('Scopes', '').split(), fields.get('Types', '').split()))
+    return devices
+
+
+def discover(timeout=2.0, address=WS_DISCOVERY_ADDRESS, interface_ip=None, retries=2):
+    """发送 Probe 并在 timeout 秒内收集响应，按设备标识去重
+
+    address: 默认是标准组播地址；测试时可指向本地 UDP 应答程序
+    interface_ip: 多网卡时指定发送组播的本地地址
+    retries: UDP 不可靠，Probe 重复发送的次数
+    """
+    message_id = uuid.uuid4()
+    probe = _PROBE_TEMPLATE.format(message_id=message_id).encode('utf-8')
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    devices = {}
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        if interface_ip:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface_ip))
+        for _ in range(max(1, retries)):
+            sock.sendto(probe, address)
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, _ = sock.recvfrom(65535)
+            except socket.timeout:
+                break
+            for device in parse_probe_matches(data):
+                devices.setdefault(device.endpoint, device)
+    except OSError as e:
+        print(f"WS-Discovery 发现失败: {e}")
+    finally:
+        sock.close()
+    return list(devices.values())
@@ -0,0 +1,102 @@
+"""
+ONVIF 报文记录模块
+zeep 插件只保存请求/响应信封的引用、时间戳和往返耗时，放在固定容量的环形缓冲中；
+只有在日志窗口可见或导出时才序列化为文本，长时间的 PTZ 操作不会带来内存增长和额外的 CPU 开销。
+"""
+import time
+from collections import deque
+from itertools import count
+from threading import Lock, local
+
+from lxml import etree
+from zeep import Plugin
+
+
+class LazyEnvelope:
+    """信封的延迟文本表示：第一次 str() 时才 pretty print，结果缓存"""
+    __slots__ = ('_element', '_text')
+
+    def __init__(self, element):
+        self._element = element
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            if self._element is None:
+                self._text = "<empty>"
+            else:
+                try:
+                    self._text = etree.tostring(self._element, pretty_print=True, encoding='unicode')
+                except Exception as e:
+                    self._text = f"解析报文失败: {e}"
+        return self._text
+
+
+class MessageRecord:
+    """一次 SOAP 调用：操作名、发送时间、往返耗时以及两个信封的引用"""
+    __slots__ = ('seq', 'operation', 'address', 'sent_at', 'rtt', 'sent', 'received')
+
+    def __init__(self, seq, operation, address, envelope):
+        self.seq = seq
+        self.operation = operation
+        self.address = address
+        self.sent_at = time.time()
+        self.rtt = None  # 收到响应前为 None（请求失败时保持 None）
+        self.sent = LazyEnvelope(envelope)
+        self.received = LazyEnvelope(None)
+
+    def summary(self):
+        rtt = f"{self.rtt * 1000:.0f}ms" if self.rtt is not None else "无响应"
+        ts = time.strftime('%H:%M:%S', time.localtime(self.sent_at))
+        return f"[{ts}] #{self.seq} {self.operation} {rtt}"
+
+
+class MessageLog(Plugin):
+    """固定容量的 SOAP 报文环形缓冲（zeep 插件）
+
+    同一个实例可以挂到多个服务上；每个线程的最近一次调用可通过 last() 取得，
+    PTZ 工作线程和其他查询线程互不串扰。
+    """
+    def __init__(self, capacity=200):
+        self._records = deque(maxlen=capacity)
+        self._lock = Lock()
+        self._seq = count(1)
+        self._local = local()
+
+    def egress(self, envelope, http_headers, operation, binding_options):
+        name = getattr(operation, 'name', str(operation))
+        address = (binding_options or {}).get('address') if isinstance(binding_options, dict) else None
+        record = MessageRecord(next(self._seq), name, address, envelope)
+        self._local.record = record
+        self._local.started = time.perf_counter()
+        with self._lock:
+            self._records.append(record)
+        return envelope, http_headers
+
+    def ingress(self, envelope, http_headers, operation):
+        record = getattr(self._local, 'record', None)
+        if record is not None and record.rtt is None:
+            record.rtt = time.perf_counter() - self._local.started
+            record.received = LazyEnvelope(envelope)
+        return envelope, http_headers
+
+    def last(self):
+        """当前线程最近一次调用的记录（没有则为 None）"""
+        return getattr(self._local, 'record', None)
+
+    def records(self, since_seq=0):
+        """返回序号大于 since_seq 的记录列表（按时间顺序）"""
+        with self._lock:
+            return [r for r in self._records if r.seq > since_seq]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def export(self, path):
+        """把缓冲中的全部报文渲染为文本写入文件，返回写入的条数"""
+        records = self.records()
+        with open(path, 'w', encoding='utf-8') as f:
+            for r in records:
+                f.write(f"{r.summary()}\nSEND:\n{r.sent}\nRECV:\n{r.received}\n\n")
+        return len(records)
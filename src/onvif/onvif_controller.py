@@ -4,18 +4,23 @@ ONVIF摄像机控制模块
 """
 import time
 import importlib, sys, os
-from zeep import helpers
-from lxml import etree
-from zeep.plugins import HistoryPlugin
+from threading import Lock
+from .message_log import MessageLog
+from .position_cache import PTZPositionCache, PTZOptics, plan_region_move
+from .transport import get_shared_transport, transport_stats, install_document_cache
 
 ONVIFCamera = None
 _onvif_import_error = None
+_onvif_lock = Lock()
 
-try:
+
+def _import_onvif_camera():
+    """导入已安装的 onvif-zeep 包中的 ONVIFCamera"""
     # 临时从 sys.path 中移除项目内的 src 路径，避免本地 src/onvif 覆盖已安装包
     this_dir = os.path.abspath(os.path.dirname(__file__))
     project_src_dir = os.path.abspath(os.path.join(this_dir, '..'))  # src/
     removed_entries = []
+    camera_cls = None
     for p in list(sys.path):
         try:
             if p and os.path.abspath(p).startswith(project_src_dir):
@@ -28,15 +33,15 @@ try:
         onvif_mod = importlib.import_module('onvif')
         # 常见位置： onvif.ONVIFCamera 或 onvif.client.ONVIFCamera
         if hasattr(onvif_mod, 'ONVIFCamera'):
-            ONVIFCamera = onvif_mod.ONVIFCamera
+            camera_cls = onvif_mod.ONVIFCamera
         elif hasattr(onvif_mod, 'client') and hasattr(onvif_mod.client, 'ONVIFCamera'):
-            ONVIFCamera = onvif_mod.client.ONVIFCamera
+            camera_cls = onvif_mod.client.ONVIFCamera
         else:
             # 再尝试 explicit submodule
             try:
                 mod_client = importlib.import_module('onvif.client')
                 if hasattr(mod_client, 'ONVIFCamera'):
-                    ONVIFCamera = mod_client.ONVIFCamera
+                    camera_cls = mod_client.ONVIFCamera
             except Exception:
                 pass
     finally:
@@ -48,86 +53,330 @@ try:
                 if p not in sys.path:
                     sys.path.append(p)
 
-    if ONVIFCamera is None:
+    if camera_cls is None:
         raise ImportError("已安装的 onvif 包中未找到 ONVIFCamera")
 
-except Exception as e:
-    _onvif_import_error = e
-    # 降级：定义占位控制器，确保程序能启动并在 UI 提示
-    class ONVIFController:
-        def __init__(self, *args, **kwargs):
-            self.available = False
-            self.history = None
+    # 已解析的 WSDL 文档在进程内共享，第二台及之后的摄像机连接不再重复解析
+    try:
+        install_document_cache(sys.modules.get(camera_cls.__module__) or importlib.import_module('onvif.client'))
+    except Exception as e:
+        print(f"启用WSDL解析缓存失败: {e}")
+    return camera_cls
 
-        def get_profiles(self):
-            return []
 
-        def relative_move_with_log(self, pan, tilt, zoom, speed=0.5):
-            send = "onvif-zeep 未正确导入或被本地 src/onvif 覆盖。请确认已安装：pip install --upgrade onvif-zeep；或将项目内的 src/onvif 重命名。"
-            recv = "未执行"
-            return send, recv
+def load_onvif_camera():
+    """第一次连接摄像机（或后台预加载）时才导入 onvif-zeep，失败时抛出带安装提示的 ImportError
 
-        def relative_move(self, pan, tilt, zoom, speed=0.5):
-            return
+    导入过程会临时修改 sys.path，放在模块导入时执行会与其它线程的导入互相干扰，因此加锁并只做一次。
+    """
+    global ONVIFCamera, _onvif_import_error
+    if ONVIFCamera is not None:
+        return ONVIFCamera
+    with _onvif_lock:
+        if ONVIFCamera is None and _onvif_import_error is None:
+            try:
+                ONVIFCamera = _import_onvif_camera()
+            except Exception as e:
+                _onvif_import_error = e
+                print("警告：未能导入第三方 onvif 包，ONVIF 控制不可用。错误：", e)
+    if ONVIFCamera is None:
+        raise ImportError("onvif-zeep 未正确导入或被本地 src/onvif 覆盖。请确认已安装：pip install --upgrade onvif-zeep；"
+                          f"或将项目内的 src/onvif 重命名。（{_onvif_import_error}）")
+    return ONVIFCamera
 
-        def absolute_move(self, pan, tilt, zoom, speed=0.5):
-            return
+class PTZSession:
+    """连接时一次性解析的 PTZ 会话信息（profile token、PTZ 配置、坐标空间与范围）及预构建的请求模板
 
-        def continuous_move(self, pan, tilt, zoom, timeout=1):
-            return
+    模板是普通 dict（onvif-zeep 的服务方法直接接受 dict 参数），每次命令只需复制模板并填入向量，
+    既不需要 GetProfiles 往返，也不需要 ptz.create_type 构造 zeep 类型。
+    """
+    def __init__(self, profiles, ptz_configuration=None, options=None):
+        self.profiles = profiles
+        self.profile = profiles[0]
+        self.token = self.profile.token
+        self.ptz_configuration = ptz_configuration
+        self.options = options
+        self.limits = _parse_space_limits(options)
+        self.templates = {
+            'AbsoluteMove': {'ProfileToken': self.token},
+            'RelativeMove': {'ProfileToken': self.token},
+            'ContinuousMove': {'ProfileToken': self.token},
+            'Stop': {'ProfileToken': self.token, 'PanTilt': True, 'Zoom': True},
+        }
 
-    print("警告：未能导入第三方 onvif 包，已启用占位 ONVIFController。错误：", _onvif_import_error)
+    def clamp(self, space, axis, value):
+        """把数值限制在摄像机声明的范围内（未声明时原样返回）"""
+        rng = self.limits.get(space, {}).get(axis)
+        if rng is None:
+            return value
+        return max(rng[0], min(rng[1], value))
 
-class ONVIFController:
-    """ONVIF摄像机控制器"""
-    def __init__(self, ip, port, username, password):
-        self.history = HistoryPlugin()
-        self.cam = ONVIFCamera(ip, port, username, password)
-        self.ptz = self.cam.create_ptz_service()
-        self.media = self.cam.create_media_service()
-        self.imaging = self.cam.create_imaging_service()
-        # 兼容主流onvif-py，插件加到_client.plugins
-        try:
-            self.ptz._client.plugins.append(self.history)
-        except AttributeError:
-            pass
+    def build(self, operation, vector_field, pan, tilt, zoom, speed=None, space=None):
+        """按模板生成请求 dict"""
+        req = dict(self.templates[operation])
+        if space:
+            pan = self.clamp(space, 'x', pan)
+            tilt = self.clamp(space, 'y', tilt)
+            zoom = self.clamp(space, 'zoom', zoom)
+        req[vector_field] = {'PanTilt': {'x': pan, 'y': tilt}, 'Zoom': {'x': zoom}}
+        if speed is not None:
+            req['Speed'] = {'PanTilt': {'x': speed, 'y': speed}, 'Zoom': {'x': speed}}
+        return req
+
+
+def _parse_space_limits(options):
+    """从 GetConfigurationOptions 的 Spaces 中提取各坐标空间的范围
+
+    返回 {空间名: {'x': (min, max), 'y': (min, max), 'zoom': (min, max)}}，
+    空间名为 'absolute' / 'relative' / 'continuous'。
+    """
+    limits = {}
+    spaces = getattr(options, 'Spaces', None) if options is not None else None
+    if spaces is None:
+        return limits
+    mapping = {
+        'absolute': ('AbsolutePanTiltPositionSpace', 'AbsoluteZoomPositionSpace'),
+        'relative': ('RelativePanTiltTranslationSpace', 'RelativeZoomTranslationSpace'),
+        'continuous': ('ContinuousPanTiltVelocitySpace', 'ContinuousZoomVelocitySpace'),
+    }
+    for name, (pt_field, zoom_field) in mapping.items():
+        entry = {}
         try:
-            self.media._client.plugins.append(self.history)
-        except AttributeError:
+            pt = (getattr(spaces, pt_field, None) or [None])[0]
+            if pt is not None:
+                entry['x'] = (float(pt.XRange.Min), float(pt.XRange.Max))
+                entry['y'] = (float(pt.YRange.Min), float(pt.YRange.Max))
+        except Exception:
             pass
         try:
-            self.imaging._client.plugins.append(self.history)
-        except AttributeError:
+            zs = (getattr(spaces, zoom_field, None) or [None])[0]
+            if zs is not None:
+                entry['zoom'] = (float(zs.XRange.Min), float(zs.XRange.Max))
+        except Exception:
             pass
-        
-    def get_profiles(self):
-        """获取摄像机配置集"""
+        if entry:
+            limits[name] = entry
+    return limits
+
+
+class ONVIFController:
+    """ONVIF摄像机控制器"""
+    def __init__(self, ip, port, username, password, transport=None):
+        start = time.perf_counter()
+        camera_cls = load_onvif_camera()
+        # 报文只保存引用到固定容量的环形缓冲，需要查看时才渲染
+        self.message_log = MessageLog()
+        self.history = self.message_log
+        # 所有实例、所有服务共用带连接池的传输层，SOAP 命令复用 keep-alive 连接
+        self.transport = transport if transport is not None else get_shared_transport()
+        self.cam = camera_cls(ip, port, username, password, transport=self.transport)
+        # 服务在第一次使用时才创建（只用到 PTZ/Media 时不必加载 Imaging 的 WSDL）
+        self._services = {}
+        self._services_lock = Lock()
+        self._session_lock = Lock()
+        self.session = None
+        self.position = PTZPositionCache()
+        self.optics = PTZOptics()  # 画面与 PTZ 坐标的换算参数，可按机型调整
+        self._presets = None  # {token: (name, (pan, tilt, zoom) 或 None)}
+        # 连接时一次性解析 profile、PTZ 配置与坐标范围，之后每条 PTZ 命令只需一次 SOAP 调用
+        self.refresh_session()
+        self.connect_time = time.perf_counter() - start
+
+    def _service(self, name):
+        """按需创建服务并挂上请求/响应记录插件"""
+        service = self._services.get(name)
+        if service is not None:
+            return service
+        with self._services_lock:
+            service = self._services.get(name)
+            if service is None:
+                service = getattr(self.cam, f'create_{name}_service')()
+                # 兼容主流onvif-py，插件加到_client.plugins
+                try:
+                    service._client.plugins.append(self.message_log)
+                except AttributeError:
+                    pass
+                self._services[name] = service
+        return service
+
+    @property
+    def ptz(self):
+        return self._service('ptz')
+
+    @property
+    def media(self):
+        return self._service('media')
+
+    @property
+    def imaging(self):
+        return self._service('imaging')
+
+    def transport_stats(self):
+        """共享传输层统计：请求数、平均/最大耗时(ms)、累计新建连接数"""
+        return transport_stats()
+
+    def refresh_session(self):
+        """重新解析并缓存 PTZ 会话（摄像机配置变化后可手动刷新）"""
+        profiles = self.media.GetProfiles()
+        if not profiles:
+            raise ValueError("未找到可用的配置集")
+        ptz_configuration = getattr(profiles[0], 'PTZConfiguration', None)
+        options = None
+        if ptz_configuration is not None:
+            try:
+                options = self.ptz.GetConfigurationOptions({'ConfigurationToken': ptz_configuration.token})
+            except Exception as e:
+                # 部分摄像机不支持该接口，缺少范围信息时不做限幅
+                print(f"获取PTZ配置选项失败: {e}")
+        session = PTZSession(profiles, ptz_configuration, options)
+        with self._session_lock:
+            self.session = session
+            self.position = PTZPositionCache(session.limits.get('absolute'))
+            self._presets = None
+        return session
+
+    def _get_session(self):
+        session = self.session
+        if session is None:
+            session = self.refresh_session()
+        return session
+
+    def get_profiles(self, refresh=False):
+        """获取摄像机配置集（默认返回连接时缓存的结果）"""
         try:
-            profiles = self.media.GetProfiles()
-            if not profiles:
-                raise ValueError("未找到可用的配置集")
-            return profiles
+            if refresh or self.session is None:
+                self.refresh_session()
+            return self.session.profiles
         except Exception as e:
             print(f"获取配置集失败: {e}")
             raise
     
+    @property
+    def has_ptz(self):
+        """第一个配置集是否带 PTZ 配置"""
+        return self._get_session().ptz_configuration is not None
+
+    def get_stream_uris(self):
+        """返回每个配置集的 RTSP 地址列表 [(profile_token, profile_name, uri), ...]"""
+        uris = []
+        for profile in self.get_profiles():
+            try:
+                resp = self.media.GetStreamUri({
+                    'StreamSetup': {'Stream': 'RTP-Unicast', 'Transport': {'Protocol': 'RTSP'}},
+                    'ProfileToken': profile.token,
+                })
+                uris.append((profile.token, getattr(profile, 'Name', profile.token), resp.Uri))
+            except Exception as e:
+                print(f"获取配置集 {profile.token} 的流地址失败: {e}")
+        return uris
+
+    def get_status(self):
+        """GetStatus 查询当前位置并校准位置缓存，返回 (pan, tilt, zoom)"""
+        try:
+            status = self.ptz.GetStatus({'ProfileToken': self._get_session().token})
+            position = getattr(status, 'Position', None)
+            pan_tilt = getattr(position, 'PanTilt', None)
+            zoom = getattr(position, 'Zoom', None)
+            pan = float(pan_tilt.x) if pan_tilt is not None else None
+            tilt = float(pan_tilt.y) if pan_tilt is not None else None
+            zoom = float(zoom.x) if zoom is not None else None
+            move_status = getattr(status, 'MoveStatus', None)
+            moving = any(str(getattr(move_status, axis, 'IDLE')).upper() == 'MOVING' for axis in ('PanTilt', 'Zoom'))
+            self.position.update_from_status(pan, tilt, zoom, moving)
+            return pan, tilt, zoom
+        except Exception as e:
+            print(f"查询PTZ状态失败: {e}")
+            raise
+
+    def get_position(self, max_age=None):
+        """返回当前位置：缓存未过期（或运动中可外推）时不发请求，否则 GetStatus"""
+        if max_age is not None:
+            self.position.max_age = max_age
+        estimate = self.position.estimate()
+        if estimate is not None:
+            return estimate
+        return self.get_status()
+
+    def get_presets(self, refresh=False):
+        """预置位表 {token: (name, (pan, tilt, zoom) 或 None)}，默认使用缓存"""
+        if self._presets is not None and not refresh:
+            return self._presets
+        try:
+            presets = {}
+            for preset in self.ptz.GetPresets({'ProfileToken': self._get_session().token}) or []:
+                position = None
+                ptz_position = getattr(preset, 'PTZPosition', None)
+                if ptz_position is not None and getattr(ptz_position, 'PanTilt', None) is not None:
+                    zoom = getattr(ptz_position, 'Zoom', None)
+                    position = (float(ptz_position.PanTilt.x), float(ptz_position.PanTilt.y),
+                                float(zoom.x) if zoom is not None else 0.0)
+                presets[preset.token] = (getattr(preset, 'Name', None) or preset.token, position)
+            self._presets = presets
+            return presets
+        except Exception as e:
+            print(f"获取预置位失败: {e}")
+            raise
+
+    def goto_preset(self, token, speed=None):
+        """转到预置位；预置位坐标已知时同步更新位置缓存"""
+        try:
+            req = {'ProfileToken': self._get_session().token, 'PresetToken': token}
+            if speed is not None:
+                req['Speed'] = {'PanTilt': {'x': speed, 'y': speed}, 'Zoom': {'x': speed}}
+            self.ptz.GotoPreset(req)
+            position = (self._presets or {}).get(token, (None, None))[1]
+            if position is not None:
+                self.position.note_absolute(*position)
+            else:
+                self.position.invalidate()
+        except Exception as e:
+            print(f"转到预置位失败: {e}")
+            raise
+
+    def set_preset(self, name, token=None):
+        """把当前位置保存为预置位，返回预置位 token"""
+        try:
+            req = {'ProfileToken': self._get_session().token, 'PresetName': name}
+            if token:
+                req['PresetToken'] = token
+            new_token = self.ptz.SetPreset(req)
+            presets = dict(self._presets or {})
+            presets[new_token] = (name, self.position.estimate())
+            self._presets = presets
+            return new_token
+        except Exception as e:
+            print(f"保存预置位失败: {e}")
+            raise
+
+    def remove_preset(self, token):
+        try:
+            self.ptz.RemovePreset({'ProfileToken': self._get_session().token, 'PresetToken': token})
+            presets = dict(self._presets or {})
+            presets.pop(token, None)
+            self._presets = presets
+        except Exception as e:
+            print(f"删除预置位失败: {e}")
+            raise
+
+    def go_to_region(self, x1, y1, x2, y2, zoom_to_fit=True, speed=0.5):
+        """把画面上的区域（归一化到 0~1 的坐标）换算为一次绝对移动
+
+        当前位置优先取缓存（运动中按命令外推），只有缓存过期时才多一次 GetStatus。
+        返回目标 (pan, tilt, zoom)。
+        """
+        current = self.get_position()
+        if current is None or current[0] is None:
+            raise ValueError("无法获取当前PTZ位置")
+        target = plan_region_move(current, (x1, y1, x2, y2), self.optics, zoom_to_fit)
+        self.absolute_move(*target, speed=speed)
+        return target
+
     def absolute_move(self, pan, tilt, zoom, speed=0.5):
         """绝对移动"""
         try:
-            profiles = self.get_profiles()
-            if not profiles:
-                raise ValueError("未找到可用的配置集")
-            req = self.ptz.create_type('AbsoluteMove')
-            req.ProfileToken = profiles[0].token
-            req.Position = {
-                'PanTilt': {'x': pan, 'y': tilt},
-                'Zoom': {'x': zoom}
-            }
-            req.Speed = {
-                'PanTilt': {'x': speed, 'y': speed},
-                'Zoom': {'x': speed}
-            }
+            req = self._get_session().build('AbsoluteMove', 'Position', pan, tilt, zoom, speed, space='absolute')
             self.ptz.AbsoluteMove(req)
+            self.position.note_absolute(pan, tilt, zoom)
         except Exception as e:
             print(f"绝对移动失败: {e}")
             raise
@@ -135,20 +384,9 @@ class ONVIFController:
     def relative_move(self, pan, tilt, zoom, speed=0.5):
         """相对移动"""
         try:
-            profiles = self.get_profiles()
-            if not profiles:
-                raise ValueError("未找到可用的配置集")
-            req = self.ptz.create_type('RelativeMove')
-            req.ProfileToken = profiles[0].token
-            req.Translation = {
-                'PanTilt': {'x': pan, 'y': tilt},
-                'Zoom': {'x': zoom}
-            }
-            req.Speed = {
-                'PanTilt': {'x': speed, 'y': speed},
-                'Zoom': {'x': speed}
-            }
+            req = self._get_session().build('RelativeMove', 'Translation', pan, tilt, zoom, speed, space='relative')
             self.ptz.RelativeMove(req)
+            self.position.note_relative(pan, tilt, zoom)
         except Exception as e:
             print(f"相对移动失败: {e}")
             raise
@@ -156,63 +394,48 @@ class ONVIFController:
     def continuous_move(self, pan, tilt, zoom, timeout=1):
         """持续移动"""
         try:
-            profiles = self.get_profiles()
-            if not profiles:
-                raise ValueError("未找到可用的配置集")
-            req = self.ptz.create_type('ContinuousMove')
-            req.ProfileToken = profiles[0].token
-            req.Velocity = {
-                'PanTilt': {'x': pan, 'y': tilt},
-                'Zoom': {'x': zoom}
-            }
-            self.ptz.ContinuousMove(req)
+            self.start_continuous_move(pan, tilt, zoom, timeout)
             time.sleep(timeout)
-            self.ptz.Stop({'ProfileToken': req.ProfileToken})
+            self.stop()
         except Exception as e:
             print(f"持续移动失败: {e}")
             raise
 
-    def relative_move_with_log(self, pan, tilt, zoom, speed=0.5):
-        """相对移动并记录日志"""
+    def start_continuous_move(self, pan, tilt, zoom, duration=None):
+        """开始持续移动并立即返回（由调用方负责之后发送 stop）
+
+        duration 为预计的持续时间，只用于位置外推；未知时按 10 秒外推，直到 stop。
+        """
         try:
-            profiles = self.get_profiles()
-            if not profiles:
-                raise ValueError("未找到可用的配置集")
-            req = self.ptz.create_type('RelativeMove')
-            req.ProfileToken = profiles[0].token
-            req.Translation = {
-                'PanTilt': {'x': pan, 'y': tilt},
-                'Zoom': {'x': zoom}
-            }
-            req.Speed = {
-                'PanTilt': {'x': speed, 'y': speed},
-                'Zoom': {'x': speed}
-            }
-            send_content = "未捕获到发送内容"
-            recv_content = "未捕获到返回内容"
-            try:
-                self.ptz.RelativeMove(req)
-                # 捕获最近一次请求和响应
-                if hasattr(self.history, 'last_sent') and self.history.last_sent is not None:
-                    try:
-                        send_content = etree.tostring(self.history.last_sent["envelope"], pretty_print=True, encoding='unicode')
-                    except (AttributeError, KeyError, etree.Error) as e:
-                        send_content = f"解析发送内容失败: {e}"
-                if hasattr(self.history, 'last_received') and self.history.last_received is not None:
-                    try:
-                        recv_content = etree.tostring(self.history.last_received["envelope"], pretty_print=True, encoding='unicode')
-                    except (AttributeError, KeyError, etree.Error) as e:
-                        recv_content = f"解析返回内容失败: {e}"
-            except Exception as e:
-                recv_content = f"Error: {e}"
-                raise
-            print("发送内容：", send_content)
-            print("返回内容：", recv_content)
-            print("history.last_sent:", getattr(self.history, 'last_sent', None))
-            print("history.last_received:", getattr(self.history, 'last_received', None))
-            return send_content, recv_content
+            req = self._get_session().build('ContinuousMove', 'Velocity', pan, tilt, zoom, space='continuous')
+            self.ptz.ContinuousMove(req)
+            self.position.note_continuous(pan, tilt, zoom, duration if duration is not None else 10.0)
         except Exception as e:
-            print(f"相对移动失败: {e}")
+            print(f"持续移动失败: {e}")
+            raise
+
+    def stop(self):
+        """停止所有 PTZ 运动"""
+        try:
+            self.ptz.Stop(self._get_session().templates['Stop'])
+            self.position.note_stop()
+        except Exception as e:
+            print(f"停止移动失败: {e}")
             raise
 
+    def relative_move_with_log(self, pan, tilt, zoom, speed=0.5):
+        """相对移动并记录日志
 
+        返回 (发送内容, 返回内容)，二者是延迟渲染的对象，str() 时才生成文本。
+        """
+        try:
+            req = self._get_session().build('RelativeMove', 'Translation', pan, tilt, zoom, speed, space='relative')
+            self.ptz.RelativeMove(req)
+            self.position.note_relative(pan, tilt, zoom)
+            record = self.message_log.last()
+            if record is None:
+                return "未捕获到发送内容", "未捕获到返回内容"
+            return record.sent, record.received
+        except Exception as e:
+            print(f"相对移动失败: {e}")
+            raise
@@ -0,0 +1,185 @@
+"""
+PTZ 位置缓存与移动规划模块
+缓存最近一次 GetStatus 得到的位置，运动期间按已发送的命令外推，
+大多数情况下不需要再发一次 GetStatus 就能知道摄像机朝向；
+并把画面上框选的区域换算为一次绝对移动（平移/俯仰对准区域中心，变焦使区域充满画面）。
+"""
+import math
+import time
+from threading import Lock
+
+
+def _clamp(value, lo, hi):
+    return max(lo, min(hi, value))
+
+
+class PTZPositionCache:
+    """位置缓存（绝对坐标空间，通常 pan/tilt 为 [-1, 1]，zoom 为 [0, 1]）
+
+    持续移动时位置按 速度 × speed_scale 外推；speed_scale（速度 1.0 时每秒移动的坐标量）
+    会在每次 GetStatus 校准时根据实际位移自动学习。
+    """
+    def __init__(self, limits=None, speed_scale=0.5, max_age=5.0):
+        limits = limits or {}
+        self.ranges = {
+            'x': limits.get('x', (-1.0, 1.0)),
+            'y': limits.get('y', (-1.0, 1.0)),
+            'zoom': limits.get('zoom', (0.0, 1.0)),
+        }
+        self.speed_scale = speed_scale
+        self.max_age = max_age  # 超过该时间未校准的缓存视为过期
+        self.lock = Lock()
+        self._position = None  # (pan, tilt, zoom)
+        self._time = 0.0
+        self._velocity = (0.0, 0.0, 0.0)
+        self._move_until = 0.0
+        self._target = None  # 绝对/相对移动的目标位置
+
+    def _limit(self, pan, tilt, zoom):
+        return (_clamp(pan, *self.ranges['x']), _clamp(tilt, *self.ranges['y']),
+                _clamp(zoom, *self.ranges['zoom']))
+
+    def _estimate_locked(self, now):
+        if self._position is None:
+            return None
+        if self._target is not None:
+            return self._target
+        moving_for = max(0.0, min(now, self._move_until) - self._time)
+        if moving_for <= 0:
+            return self._position
+        pan, tilt, zoom = self._position
+        vx, vy, vz = self._velocity
+        k = self.speed_scale * moving_for
+        return self._limit(pan + vx * k, tilt + vy * k, zoom + vz * k)
+
+    def update_from_status(self, pan, tilt, zoom, moving=False):
+        """用 GetStatus 的真实位置校准；根据外推误差修正 speed_scale"""
+        now = time.time()
+        with self.lock:
+            predicted = self._estimate_locked(now)
+            if (predicted is not None and self._target is None and any(self._velocity)
+                    and self._position is not None and pan is not None):
+                moved_for = max(0.0, min(now, self._move_until) - self._time)
+                commanded = math.hypot(self._velocity[0], self._velocity[1]) * moved_for
+                actual = math.hypot(pan - self._position[0], tilt - self._position[1])
+                if commanded > 0.05:
+                    self.speed_scale = 0.7 * self.speed_scale + 0.3 * (actual / commanded)
+            if pan is None:
+                return
+            self._position = (pan, tilt, zoom if zoom is not None else (self._position or (0, 0, 0))[2])
+            self._time = now
+            # 仍在运动时保留速度/目标，从新位置继续外推
+            if not moving:
+                self._velocity = (0.0, 0.0, 0.0)
+                self._move_until = now
+                self._target = None
+
+    def note_continuous(self, vx, vy, vz, duration):
+        with self.lock:
+            now = time.time()
+            current = self._estimate_locked(now)
+            if current is None:
+                return
+            self._position, self._time = current, now
+            self._velocity = (vx, vy, vz)
+            self._move_until = now + duration
+            self._target = None
+
+    def note_stop(self):
+        with self.lock:
+            now = time.time()
+            current = self._estimate_locked(now)
+            if current is None:
+                return
+            self._position, self._time = current, now
+            self._velocity = (0.0, 0.0, 0.0)
+            self._move_until = now
+
+    def note_absolute(self, pan, tilt, zoom):
+        with self.lock:
+            self._target = self._limit(pan, tilt, zoom)
+            self._time = time.time()
+            if self._position is None:
+                self._position = self._target
+            self._velocity = (0.0, 0.0, 0.0)
+
+    def note_relative(self, dpan, dtilt, dzoom):
+        with self.lock:
+            current = self._estimate_locked(time.time())
+            if current is None:
+                return
+            self._target = self._limit(current[0] + dpan, current[1] + dtilt, current[2] + dzoom)
+            self._time = time.time()
+            self._velocity = (0.0, 0.0, 0.0)
+
+    def estimate(self):
+        """返回 (pan, tilt, zoom) 或 None（从未校准或已过期）"""
+        now = time.time()
+        with self.lock:
+            if self._position is None or (now - self._time > self.max_age and not self._moving_locked(now)):
+                return None
+            return self._estimate_locked(now)
+
+    def _moving_locked(self, now):
+        return now < self._move_until
+
+    def invalidate(self):
+        with self.lock:
+            self._position = None
+            self._target = None
+
+
+class PTZOptics:
+    """画面与 PTZ 坐标的换算参数
+
+    hfov_wide / vfov_wide: 最广角时的水平/垂直视场角（度）
+    max_zoom: 最大光学变焦倍数（zoom 坐标 0~1 线性对应 1x~max_zoom）
+    pan_range_deg / tilt_range_deg: 绝对坐标 [-1, 1] 对应的角度范围
+    tilt_sign: 画面向下对应 tilt 坐标变化的方向；默认 1，与界面方向按钮（▼ 为 tilt 正向）
+        及 AutoTracker 一致，由配置项 [profile] tilt_sign 统一设置
+    """
+    def __init__(self, hfov_wide=60.0, vfov_wide=34.0, max_zoom=20.0, pan_range_deg=360.0,
+                 tilt_range_deg=180.0, tilt_sign=1):
+        self.hfov_wide = hfov_wide
+        self.vfov_wide = vfov_wide
+        self.max_zoom = max_zoom
+        self.pan_range_deg = pan_range_deg
+        self.tilt_range_deg = tilt_range_deg
+        self.tilt_sign = tilt_sign
+
+    def magnification(self, zoom):
+        return 1.0 + _clamp(zoom, 0.0, 1.0) * (self.max_zoom - 1.0)
+
+    def zoom_for(self, magnification):
+        return _clamp((magnification - 1.0) / (self.max_zoom - 1.0), 0.0, 1.0) if self.max_zoom > 1 else 0.0
+
+    def fov(self, zoom):
+        m = self.magnification(zoom)
+        return self.hfov_wide / m, self.vfov_wide / m
+
+
+def plan_region_move(position, rect, optics, zoom_to_fit=True, fill=0.9):
+    """把画面上的区域换算为一次绝对移动的目标 (pan, tilt, zoom)
+
+    position: 当前 (pan, tilt, zoom)
+    rect: 归一化到 [0, 1] 的 (x1, y1, x2, y2)，相对整个画面
+    fill: 区域变焦后占画面的比例（留一点边距）
+    """
+    pan, tilt, zoom = position
+    x1, y1, x2, y2 = rect
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    hfov, vfov = optics.fov(zoom)
+    dx_deg = ((x1 + x2) / 2.0 - 0.5) * hfov
+    dy_deg = ((y1 + y2) / 2.0 - 0.5) * vfov
+    new_pan = pan + dx_deg * 2.0 / optics.pan_range_deg
+    if optics.pan_range_deg >= 360.0:
+        # 可连续旋转的云台：越过边界时回绕
+        new_pan = (new_pan + 1.0) % 2.0 - 1.0
+    new_tilt = _clamp(tilt + optics.tilt_sign * dy_deg * 2.0 / optics.tilt_range_deg, -1.0, 1.0)
+    new_zoom = zoom
+    if zoom_to_fit:
+        w, h = max(x2 - x1, 1e-3), max(y2 - y1, 1e-3)
+        factor = fill / max(w, h)
+        new_zoom = optics.zoom_for(optics.magnification(zoom) * factor)
+    return new_pan, new_tilt, new_zoom
@@ -0,0 +1,192 @@
+"""
+PTZ 命令队列模块
+所有 PTZ 命令由独立工作线程发送，界面按钮回调只负责入队并立即返回 Future，
+Tk 主线程与视频线程都不会再等待 SOAP 往返。
+"""
+import time
+from concurrent.futures import Future
+from threading import Thread, Condition
+
+
+class PTZWorker:
+    """合并 + 限速的 PTZ 命令队列
+
+    - 相对移动：尚未发送的相对移动向量逐项累加，合并为一次 RelativeMove，
+      合并期间所有调用方拿到的 Future 得到同一个结果
+    - 持续移动：最新的速度覆盖尚未发送的旧速度（被覆盖的 Future 被取消），
+      到期后由工作线程自动发送 Stop，不再在调用线程中 sleep
+    - 停止：丢弃所有未发送的移动，优先发送
+    - 其他调用（预置位、区域定位等）：call() 按提交顺序在同一线程执行
+    - 两条命令之间至少间隔 min_interval 秒，避免超过摄像机的处理能力
+
+    on_log(send_content, recv_content) 在工作线程中调用，PlayerWindow.log_onvif 可直接使用。
+    """
+    def __init__(self, controller, min_interval=0.2, on_log=None):
+        self.controller = controller
+        self.min_interval = min_interval
+        self.on_log = on_log
+        self._cond = Condition()
+        self._relative = None      # [pan, tilt, zoom, speed, [futures]]
+        self._continuous = None    # (pan, tilt, zoom, duration, future)
+        self._stop_futures = []    # 待发送的显式停止
+        self._calls = []           # [(func, args, future)]，按顺序执行
+        self._stop_deadline = None  # 持续移动到期后自动停止的时间
+        self._last_send = 0
+        self._running = True
+        self._thread = Thread(target=self._run, name="ptz-worker", daemon=True)
+        self._thread.start()
+
+    def relative(self, pan, tilt, zoom=0, speed=0.5):
+        """相对移动（与尚未发送的相对移动合并）"""
+        future = Future()
+        with self._cond:
+            if not self._running:
+                future.set_exception(RuntimeError("PTZ队列已关闭"))
+                return future
+            if self._relative is None:
+                self._relative = [pan, tilt, zoom, speed, [future]]
+            else:
+                self._relative[0] += pan
+                self._relative[1] += tilt
+                self._relative[2] += zoom
+                self._relative[3] = speed
+                self._relative[4].append(future)
+            self._cond.notify()
+        return future
+
+    def continuous(self, pan, tilt, zoom=0, duration=1.0):
+        """持续移动 duration 秒后自动停止（最新的速度生效）"""
+        future = Future()
+        with self._cond:
+            if not self._running:
+                future.set_exception(RuntimeError("PTZ队列已关闭"))
+                return future
+            if self._continuous is not None:
+                self._continuous[4].cancel()  # 被新的速度覆盖，未发送
+            self._continuous = (pan, tilt, zoom, duration, future)
+            self._cond.notify()
+        return future
+
+    def call(self, func, *args):
+        """在 PTZ 线程中执行 func(*args)（例如 controller.goto_preset），返回 Future"""
+        future = Future()
+        with self._cond:
+            if not self._running:
+                future.set_exception(RuntimeError("PTZ队列已关闭"))
+                return future
+            self._calls.append((func, args, future))
+            self._cond.notify()
+        return future
+
+    def stop(self):
+        """停止运动，丢弃所有尚未发送的移动"""
+        future = Future()
+        with self._cond:
+            if not self._running:
+                future.set_exception(RuntimeError("PTZ队列已关闭"))
+                return future
+            self._discard_pending()
+            self._stop_deadline = None
+            self._stop_futures.append(future)
+            self._cond.notify()
+        return future
+
+    def shutdown(self, timeout=2.0):
+        """关闭队列，未发送的命令全部取消"""
+        with self._cond:
+            self._running = False
+            self._discard_pending()
+            for f in self._stop_futures:
+                f.cancel()
+            self._stop_futures = []
+            for _, _, f in self._calls:
+                f.cancel()
+            self._calls = []
+            self._cond.notify()
+        self._thread.join(timeout=timeout)
+
+    def _discard_pending(self):
+        if self._relative is not None:
+            for f in self._relative[4]:
+                f.cancel()
+            self._relative = None
+        if self._continuous is not None:
+            self._continuous[4].cancel()
+            self._continuous = None
+
+    def _next_command(self):
+        """在锁内取出下一条待发送的命令，没有则返回 None 和需要等待的秒数"""
+        now = time.time()
+        has_work = self._stop_futures or self._calls or self._continuous or self._relative
+        due_stop = self._stop_deadline is not None and now >= self._stop_deadline
+        if not has_work and not due_stop:
+            wait = None if self._stop_deadline is None else self._stop_deadline - now
+            return None, wait
+        gap = self._last_send + self.min_interval - now
+        if gap > 0:
+            return None, gap
+        if self._stop_futures:
+            futures, self._stop_futures = self._stop_futures, []
+            return ('stop', None, futures), 0
+        if self._calls:
+            func, args, future = self._calls.pop(0)
+            return ('call', (func, args), [future]), 0
+        if self._continuous is not None:
+            cmd, self._continuous = self._continuous, None
+            pan, tilt, zoom, duration, future = cmd
+            self._stop_deadline = now + duration
+            return ('continuous', (pan, tilt, zoom, duration), [future]), 0
+        if self._relative is not None:
+            cmd, self._relative = self._relative, None
+            return ('relative', tuple(cmd[:4]), cmd[4]), 0
+        self._stop_deadline = None
+        return ('stop', None, []), 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    cmd, wait = self._next_command()
+                    if cmd is not None:
+                        break
+                    self._cond.wait(timeout=wait)
+                if not self._running:
+                    return
+                self._last_send = time.time()
+            kind, args, futures = cmd
+            self._execute(kind, args, futures)
+
+    def _execute(self, kind, args, futures):
+        send, recv, result, error = None, None, None, None
+        try:
+            if kind == 'relative':
+                result = self.controller.relative_move_with_log(*args)
+                send, recv = result
+            elif kind == 'call':
+                func, call_args = args
+                result = func(*call_args)
+                send = f"{getattr(func, '__name__', func)}{call_args}"
+                recv = repr(result)[:500]
+            elif kind == 'continuous':
+                self.controller.start_continuous_move(*args)
+                send, recv = f"ContinuousMove pan={args[0]:.4f} tilt={args[1]:.4f} zoom={args[2]:.4f}", "OK"
+            else:
+                self.controller.stop()
+                send, recv = "Stop", "OK"
+        except Exception as e:
+            error = e
+            if send is None:
+                send = f"{kind} {args}" if args else kind
+            recv = f"Error: {e}"
+        for f in futures:
+            if not f.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                f.set_exception(error)
+            else:
+                f.set_result(result)
+        if self.on_log:
+            try:
+                self.on_log(send, recv)
+            except Exception as e:
+                print(f"记录PTZ日志失败: {e}")
@@ -0,0 +1,215 @@
+"""
+ONVIF SOAP 传输层
+所有 ONVIFController 实例、所有服务（PTZ / Media / Imaging）共用一个带连接池的 requests.Session，
+HTTP keep-alive 复用 TCP 连接，避免每条命令都重新建连。
+WSDL/XSD 文档的下载结果与解析结果也在进程内共享，第二台及之后的摄像机连接不再重复解析。
+"""
+import os
+import time
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from zeep import Client
+from zeep.cache import InMemoryCache, SqliteCache
+from zeep.transports import Transport
+from zeep.wsdl import Document
+
+
+class TransportStats:
+    """SOAP 请求统计：请求数、累计耗时、新建的 TCP 连接数"""
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed, ok=True):
+        with self.lock:
+            self.requests += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            if not ok:
+                self.errors += 1
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.total_time = 0.0
+            self.max_time = 0.0
+
+
+class PooledTransport(Transport):
+    """统计每次 SOAP POST 耗时的 zeep Transport"""
+    def __init__(self, session, stats, timeout=5, operation_timeout=5, cache=None):
+        super().__init__(session=session, timeout=timeout, operation_timeout=operation_timeout, cache=cache)
+        self.stats = stats
+
+    def post(self, address, message, headers):
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = super().post(address, message, headers)
+            ok = True
+            return response
+        finally:
+            self.stats.record(time.perf_counter() - start, ok)
+
+
+def _build_session(pool_connections, pool_maxsize, max_retries):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          max_retries=max_retries, pool_block=False)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+
+def _build_cache(path):
+    """远程 XSD 下载缓存：优先使用磁盘上的 SQLite（跨进程重启有效），失败时退回内存缓存"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SqliteCache(path=path, timeout=30 * 24 * 3600)
+    except Exception as e:
+        print(f"创建WSDL磁盘缓存失败，使用内存缓存: {e}")
+        return InMemoryCache(timeout=24 * 3600)
+
+
+# 默认缓存连接池的主机数：覆盖 50 台摄像机的管理规模并留有余量；
+# 超过时 requests 会按最近使用淘汰其他摄像机的池，keep-alive 连接被反复关闭重建
+DEFAULT_POOL_HOSTS = 64
+
+_shared_lock = Lock()
+_shared_transport = None
+_shared_stats = TransportStats()
+_pool_hosts = DEFAULT_POOL_HOSTS
+_pool_settings = (4, 0)  # (pool_maxsize, max_retries)
+
+
+def get_shared_transport(timeout=5, operation_timeout=5, pool_connections=DEFAULT_POOL_HOSTS, pool_maxsize=4,
+                         max_retries=0, cache_path=None):
+    """返回进程内共享的 Transport（第一次调用时创建，之后的参数被忽略）
+
+    pool_connections: 缓存连接池的主机数（每台摄像机一个池），摄像机更多时由 ensure_pool_hosts 扩容
+    pool_maxsize: 每台主机保持的空闲连接数（PTZ 队列 + 媒体查询并发很少超过 2-3 条）
+    timeout: 加载 WSDL/XSD 的超时；operation_timeout: 每条 SOAP 命令的超时
+    """
+    global _shared_transport, _pool_hosts, _pool_settings
+    with _shared_lock:
+        if _shared_transport is None:
+            _pool_hosts = max(_pool_hosts, pool_connections)
+            _pool_settings = (pool_maxsize, max_retries)
+            session = _build_session(_pool_hosts, pool_maxsize, max_retries)
+            cache = _build_cache(cache_path or os.path.join(os.getcwd(), 'cache', 'zeep.sqlite'))
+            _shared_transport = PooledTransport(session, _shared_stats, timeout=timeout,
+                                                operation_timeout=operation_timeout, cache=cache)
+        return _shared_transport
+
+
+def ensure_pool_hosts(n_hosts):
+    """保证共享连接池至少能容纳 n_hosts 台主机
+
+    传输层尚未创建时只记录，创建时按此大小建池；已创建时换用更大的连接池（原有空闲连接随旧池释放，只发生一次）。
+    """
+    global _pool_hosts
+    with _shared_lock:
+        if n_hosts <= _pool_hosts:
+            return
+        _pool_hosts = (n_hosts + 15) // 16 * 16
+        if _shared_transport is not None:
+            pool_maxsize, max_retries = _pool_settings
+            adapter = HTTPAdapter(pool_connections=_pool_hosts, pool_maxsize=pool_maxsize,
+                                  max_retries=max_retries, pool_block=False)
+            _shared_transport.session.mount('http://', adapter)
+            _shared_transport.session.mount('https://', adapter)
+        print(f"ONVIF连接池扩容到 {_pool_hosts} 台主机")
+
+
+_documents_lock = Lock()
+_documents = {}  # (WSDL 路径, strict, xml_huge_tree) -> 已解析的 zeep Document
+
+
+def get_wsdl_document(location, transport, settings):
+    """返回进程内共享的已解析 WSDL 文档
+
+    解析 ONVIF 的 WSDL/XSD 是连接过程中最耗时的部分，而文档内容与摄像机无关
+    （服务地址在 create_service 时单独绑定），因此同一文件只解析一次。
+    """
+    key = (os.path.abspath(location) if os.path.exists(location) else location,
+           getattr(settings, 'strict', True), getattr(settings, 'xml_huge_tree', False))
+    with _documents_lock:
+        doc = _documents.get(key)
+        if doc is None:
+            start = time.perf_counter()
+            doc = Document(location, transport, settings=settings)
+            _documents[key] = doc
+            print(f"解析WSDL {os.path.basename(str(location))} 耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+        return doc
+
+
+class CachedDocumentClient(Client):
+    """WSDL 文档复用的 zeep Client（认证信息、传输层、插件仍然是每个客户端独立的）"""
+    def __init__(self, wsdl, wsse=None, transport=None, service_name=None, port_name=None,
+                 plugins=None, settings=None):
+        transport = transport if transport is not None else get_shared_transport()
+        if not isinstance(wsdl, Document):
+            wsdl = get_wsdl_document(wsdl, transport, settings)
+        super().__init__(wsdl, wsse=wsse, transport=transport, service_name=service_name,
+                         port_name=port_name, plugins=plugins, settings=settings)
+
+
+def install_document_cache(onvif_client_module):
+    """让 onvif-zeep 创建服务时使用 CachedDocumentClient
+
+    onvif-zeep 的 ONVIFService 通过模块级的 Client / CachingClient 名称创建 zeep 客户端，
+    这里只替换这两个名称；库版本不兼容（没有这两个名称）时保持原样。
+    """
+    patched = False
+    for name in ('Client', 'CachingClient'):
+        if hasattr(onvif_client_module, name):
+            setattr(onvif_client_module, name, CachedDocumentClient)
+            patched = True
+    if not patched:
+        print("警告：onvif.client 中未找到 Client/CachingClient，WSDL 解析缓存未启用")
+    return patched
+
+
+def _count_connections(session):
+    """统计连接池中累计新建的 TCP 连接数（urllib3 每个主机池的 num_connections）"""
+    opened = 0
+    hosts = 0
+    seen = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        try:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    hosts += 1
+                    opened += getattr(pool, 'num_connections', 0)
+        except Exception:
+            continue
+    return opened, hosts
+
+
+def transport_stats():
+    """返回共享传输层的统计信息，用于对比连接复用前后的延迟与连接数"""
+    with _shared_stats.lock:
+        stats = {
+            'requests': _shared_stats.requests,
+            'errors': _shared_stats.errors,
+            'avg_ms': _shared_stats.total_time / _shared_stats.requests * 1000 if _shared_stats.requests else 0.0,
+            'max_ms': _shared_stats.max_time * 1000,
+        }
+    transport = _shared_transport
+    if transport is not None:
+        stats['connections_opened'], stats['hosts'] = _count_connections(transport.session)
+    else:
+        stats['connections_opened'], stats['hosts'] = 0, 0
+    return stats
@@ -0,0 +1,6 @@
+"""
+RTSP流处理模块
+"""
+from .stream_info_cache import StreamInfoCache
+
+__all__ = ['StreamInfoCache']
@@ -0,0 +1,371 @@
+"""
+事件片段缓存模块
+每路摄像机一个 `-c copy` 输出 MPEG-TS 的 FFmpeg 进程，把压缩后的 TS 包（而不是解码后的帧）
+保存在按秒数和字节数双重限制的环形缓冲区中。检测或移动侦测触发时，
+把事件前（预录）的数据连同之后若干秒（后录）直接写入文件，不解码也不编码。
+内存占用只取决于 码率 × 秒数，与分辨率无关；时间上重叠的事件合并到同一个片段。
+"""
+import os
+import subprocess
+import time
+from collections import deque
+from threading import Thread, Event, Lock
+
+from .process_utils import reap_process
+from .recorder import safe_name
+
+TS_PACKET_SIZE = 188
+_SYNC_BYTE = 0x47
+
+
+class _Chunk:
+    """一次读取得到的一段 TS 包（长度为 188 的整数倍）"""
+    __slots__ = ('time', 'data', 'key_offset')
+
+    def __init__(self, time_, data, key_offset):
+        self.time = time_
+        self.data = data
+        self.key_offset = key_offset  # 第一个随机访问点（关键帧）包的偏移，没有时为 -1
+
+
+class _Clip:
+    """正在写入的事件片段"""
+    __slots__ = ('path', 'file', 'reasons', 'start', 'end', 'hard_end', 'pending', 'bytes', 'events')
+
+    def __init__(self, path, reason, start, end, hard_end, pending):
+        self.path = path
+        self.file = None
+        self.reasons = [reason] if reason else []
+        self.start = start
+        self.end = end
+        self.hard_end = hard_end
+        self.pending = pending  # 尚未写入文件的预录数据
+        self.bytes = 0
+        self.events = 1
+
+
+def scan_packets(data, pmt_pid=None):
+    """扫描一段对齐的 TS 数据
+
+    返回 (第一个带随机访问标志的包偏移或 -1, PAT 包, PMT 包, 从 PAT 解析出的 PMT PID)。
+    FFmpeg 的 mpegts 封装器会在视频关键帧所在的包上设置 random_access_indicator。
+    """
+    key_offset = -1
+    pat = pmt = None
+    for i in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        flags = data[i + 3]
+        pid = ((data[i + 1] & 0x1F) << 8) | data[i + 2]
+        if key_offset < 0 and flags & 0x20 and data[i + 4] > 0 and data[i + 5] & 0x40:
+            key_offset = i
+        if pid == 0:
+            pat = bytes(data[i:i + TS_PACKET_SIZE])
+            pmt_pid = _pmt_pid_from_pat(pat) or pmt_pid
+        elif pmt_pid is not None and pid == pmt_pid:
+            pmt = bytes(data[i:i + TS_PACKET_SIZE])
+    return key_offset, pat, pmt, pmt_pid
+
+
+def _pmt_pid_from_pat(packet):
+    try:
+        offset = 4
+        if packet[3] & 0x20:
+            offset += 1 + packet[4]
+        offset += 1 + packet[offset]  # pointer_field
+        section_length = ((packet[offset + 1] & 0x0F) << 8) | packet[offset + 2]
+        end = min(offset + 3 + section_length - 4, TS_PACKET_SIZE)
+        i = offset + 8
+        while i + 4 <= end:
+            program = (packet[i] << 8) | packet[i + 1]
+            if program != 0:
+                return ((packet[i + 2] & 0x1F) << 8) | packet[i + 3]
+            i += 4
+    except IndexError:
+        pass
+    return None
+
+
+class ClipBuffer:
+    """单路摄像机的预录/后录事件片段
+
+    url: RTSP 地址
+    directory: 片段输出目录
+    pre_seconds / post_seconds: 事件前保留的秒数、最后一次事件后继续录制的秒数
+    max_clip_seconds: 连续触发时单个片段的最长时长，超过后开始新片段
+    max_bitrate: 预估的最大码率（bit/s），与 pre_seconds 一起决定缓冲区的字节上限
+    container: 'ts'（直接写出）或 'mp4'（写完后再 -c copy 转封装一次）
+    on_clip(path, info): 片段完成后在后台线程中调用
+    """
+    def __init__(self, url, directory, pre_seconds=10.0, post_seconds=10.0, max_clip_seconds=120.0,
+                 max_bitrate=16e6, container='mp4', name=None, ffmpeg='ffmpeg', on_clip=None):
+        self.url = url
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_clip_seconds = max_clip_seconds
+        # 多保留 2 秒余量，保证预录起点之前总有一个关键帧
+        self.max_bytes = int(max_bitrate / 8 * (pre_seconds + 2.0))
+        self.container = container
+        self.name = name or safe_name(url)
+        self.ffmpeg = ffmpeg
+        self.on_clip = on_clip
+        self.lock = Lock()
+        self.proc = None
+        self.restarts = 0
+        self.clips = 0
+        self.merged_events = 0
+        self.last_error = None
+        self._chunks = deque()
+        self._keys = deque()  # 含关键帧的块，与 _chunks 中的对象相同
+        self._bytes = 0
+        self._psi = (None, None, None)  # (PAT, PMT, PMT PID)
+        self._clip = None
+        self._last_clip_end = 0.0
+        self._rate_bytes = 0
+        self._rate_start = time.time()
+        self.bitrate = 0.0
+        self._stop = Event()
+        self._thread = None
+
+    def _command(self):
+        # 只保留视频：G.711 等摄像机常见的音频编码无法直接封装进 MPEG-TS
+        return [self.ffmpeg, '-hide_banner', '-loglevel', 'error',
+                '-rtsp_transport', 'tcp', '-timeout', '5000000',
+                '-fflags', '+genpts',
+                '-i', self.url,
+                '-map', '0:v:0', '-c', 'copy',
+                '-f', 'mpegts', 'pipe:1']
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name=f"clip-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        proc, self.proc = self.proc, None
+        reap_process(proc)
+        with self.lock:
+            self._finish_clip_locked()
+            self._chunks.clear()
+            self._keys.clear()
+            self._bytes = 0
+
+    @property
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                self.proc = subprocess.Popen(self._command(), stdin=subprocess.DEVNULL,
+                                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                started = time.time()
+                self._read_loop(self.proc)
+                if time.time() - started > 30:
+                    backoff = 1.0
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[事件片段 {self.name}] 错误: {e}")
+            proc, self.proc = self.proc, None
+            reap_process(proc)
+            with self.lock:
+                # 断流后缓冲区中的数据与新连接不连续，不能拼进同一个片段
+                self._finish_clip_locked()
+                self._chunks.clear()
+                self._keys.clear()
+                self._bytes = 0
+            if self._stop.is_set():
+                break
+            self.restarts += 1
+            print(f"[事件片段 {self.name}] FFmpeg 退出，{backoff:.0f}s 后重启")
+            if self._stop.wait(backoff):
+                break
+            backoff = min(backoff * 2, 60.0)
+
+    def _read_loop(self, proc):
+        fd = proc.stdout.fileno()
+        remainder = b''
+        while not self._stop.is_set():
+            data = os.read(fd, 256 * 1024)
+            if not data:
+                return
+            data = remainder + data
+            start = 0
+            if data[0] != _SYNC_BYTE:
+                start = self._resync(data)
+                if start < 0:
+                    remainder = data[-TS_PACKET_SIZE:]
+                    continue
+            usable = start + (len(data) - start) // TS_PACKET_SIZE * TS_PACKET_SIZE
+            remainder = data[usable:]
+            if usable > start:
+                self._append(data[start:usable])
+
+    @staticmethod
+    def _resync(data):
+        """找到连续三个包都以同步字节开头的位置"""
+        for i in range(min(len(data), TS_PACKET_SIZE)):
+            if all(i + k * TS_PACKET_SIZE < len(data) and data[i + k * TS_PACKET_SIZE] == _SYNC_BYTE
+                   for k in range(3)):
+                return i
+        return -1
+
+    def _append(self, data):
+        now = time.time()
+        key_offset, pat, pmt, pmt_pid = scan_packets(data, self._psi[2])
+        chunk = _Chunk(now, data, key_offset)
+        with self.lock:
+            if pat is not None or pmt is not None:
+                self._psi = (pat or self._psi[0], pmt or self._psi[1], pmt_pid)
+            self._chunks.append(chunk)
+            if key_offset >= 0:
+                self._keys.append(chunk)
+            self._bytes += len(data)
+            self._trim_locked(now)
+            self._rate_bytes += len(data)
+            if now - self._rate_start >= 5.0:
+                self.bitrate = self._rate_bytes * 8 / (now - self._rate_start)
+                self._rate_bytes, self._rate_start = 0, now
+            clip = self._clip
+            if clip is not None:
+                self._write_clip_locked(clip, [chunk])
+                if now >= clip.end:
+                    self._finish_clip_locked()
+
+    def _trim_locked(self, now):
+        cutoff = now - self.pre_seconds
+        # 只保留预录起点之前的最后一个关键帧
+        while len(self._keys) > 1 and self._keys[1].time <= cutoff:
+            self._keys.popleft()
+        while len(self._chunks) > 1:
+            head = self._chunks[0]
+            if self._bytes > self.max_bytes:
+                pass
+            elif self._keys:
+                if head is self._keys[0] or head.time >= self._keys[0].time:
+                    break
+            elif head.time >= cutoff:
+                break
+            self._chunks.popleft()
+            self._bytes -= len(head.data)
+            if self._keys and self._keys[0] is head:
+                self._keys.popleft()
+
+    def trigger(self, reason=''):
+        """登记一次事件：没有进行中的片段时从预录起点开始新片段，否则延长当前片段的后录"""
+        now = time.time()
+        with self.lock:
+            clip = self._clip
+            if clip is not None and now < clip.hard_end:
+                clip.end = min(max(clip.end, now + self.post_seconds), clip.hard_end)
+                clip.events += 1
+                if reason and reason not in clip.reasons:
+                    clip.reasons.append(reason)
+                self.merged_events += 1
+                return clip.path
+            if clip is not None:
+                self._finish_clip_locked()
+            pending = self._preroll_locked(now)
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now))
+            label = safe_name(reason)[:20] if reason else 'event'
+            path = os.path.join(self.directory, f"{self.name}_{stamp}_{label}.ts")
+            self._clip = _Clip(path, reason, pending[0].time if pending else now, now + self.post_seconds,
+                               now + self.max_clip_seconds, pending)
+            return path
+
+    def _preroll_locked(self, now):
+        """从预录起点之前最近的关键帧开始的数据块；不与上一个片段重复（上一个片段刚结束时从其结尾接上）"""
+        cutoff = max(now - self.pre_seconds, self._last_clip_end)
+        start = None
+        for chunk in reversed(self._keys):
+            if chunk.time <= cutoff:
+                start = chunk
+                break
+        if start is None and self._keys:
+            start = self._keys[0]
+        if start is None:
+            return []
+        chunks = []
+        found = False
+        for chunk in self._chunks:
+            if chunk is start:
+                found = True
+                chunks.append(_Chunk(chunk.time, chunk.data[chunk.key_offset:], 0))
+            elif found:
+                chunks.append(chunk)
+        return chunks
+
+    def _write_clip_locked(self, clip, chunks):
+        try:
+            if clip.file is None:
+                clip.file = open(clip.path, 'wb')
+                pat, pmt, _ = self._psi
+                # 片段开头先写 PAT/PMT，播放器不必等到下一次重发就能识别节目
+                for table in (pat, pmt):
+                    if table is not None:
+                        clip.file.write(table)
+                chunks = clip.pending + chunks
+                clip.pending = []
+            for chunk in chunks:
+                clip.file.write(chunk.data)
+                clip.bytes += len(chunk.data)
+        except OSError as e:
+            self.last_error = str(e)
+            print(f"[事件片段 {self.name}] 写入失败: {e}")
+
+    def _finish_clip_locked(self):
+        clip, self._clip = self._clip, None
+        if clip is None:
+            return
+        if clip.file is None and clip.pending:
+            self._write_clip_locked(clip, [])
+        if clip.file is None:
+            return
+        try:
+            clip.file.close()
+        except OSError:
+            pass
+        self._last_clip_end = time.time()
+        self.clips += 1
+        info = {'reasons': clip.reasons, 'events': clip.events, 'start': clip.start,
+                'end': self._last_clip_end, 'bytes': clip.bytes}
+        print(f"[事件片段 {self.name}] 保存 {os.path.basename(clip.path)} "
+              f"({self._last_clip_end - clip.start:.0f}s, {clip.bytes / 1e6:.1f}MB, {clip.events} 次事件)")
+        Thread(target=self._finalize, args=(clip.path, info), daemon=True).start()
+
+    def _finalize(self, path, info):
+        if self.container == 'mp4':
+            target = os.path.splitext(path)[0] + '.mp4'
+            try:
+                result = subprocess.run([self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+                                         '-i', path, '-c', 'copy', '-movflags', '+faststart', target],
+                                        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL, timeout=120)
+                if result.returncode == 0:
+                    os.remove(path)
+                    path = target
+            except Exception as e:
+                print(f"[事件片段 {self.name}] 转封装失败，保留 TS 文件: {e}")
+        if self.on_clip:
+            try:
+                self.on_clip(path, info)
+            except Exception as e:
+                print(f"[事件片段 {self.name}] 回调错误: {e}")
+
+    def status(self):
+        with self.lock:
+            span = self._chunks[-1].time - self._chunks[0].time if self._chunks else 0.0
+            return {
+                'running': self.running,
+                'buffered_bytes': self._bytes,
+                'buffered_seconds': span,
+                'bitrate': self.bitrate,
+                'recording': self._clip is not None,
+                'clips': self.clips,
+                'merged_events': self.merged_events,
+                'restarts': self.restarts,
+                'last_error': self.last_error,
+            }
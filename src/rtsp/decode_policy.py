@@ -0,0 +1,97 @@
+"""
+解码策略模块
+为每路流指定解码方式：全速、限定帧率、仅关键帧或暂停，可在运行时切换。
+画中画、隐藏或后台的摄像机只需很小一部分解码 CPU。
+"""
+
+FULL = 'full'
+FPS = 'fps'
+KEYFRAMES = 'keyframes'
+PAUSED = 'paused'
+
+_MODES = (FULL, FPS, KEYFRAMES, PAUSED)
+
+
+class DecodePolicy:
+    """不可变的解码策略
+
+    - full: 按源帧率完整解码
+    - fps: 跳过非参考帧解码（-skip_frame nonref），并用 fps 滤镜把输出限制到 N fps
+    - keyframes: 仅解码关键帧（-skip_frame nokey），CPU 开销最低
+    - paused: 暂停该路解码（挂起 FFmpeg 进程）；短暂暂停恢复后沿用原进程，
+      挂起超过 MAX_SUSPEND_SECONDS 时 RTSP 会话可能已被服务器断开，恢复时重启进程
+    """
+    __slots__ = ('mode', 'fps')
+
+    def __init__(self, mode=FULL, fps=None):
+        if mode not in _MODES:
+            raise ValueError(f"未知的解码策略: {mode}")
+        if mode == FPS and (not fps or fps <= 0):
+            raise ValueError("限帧解码策略需要指定大于 0 的 fps")
+        object.__setattr__(self, 'mode', mode)
+        object.__setattr__(self, 'fps', float(fps) if mode == FPS else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DecodePolicy 是不可变对象")
+
+    @classmethod
+    def full(cls):
+        return cls(FULL)
+
+    @classmethod
+    def at_fps(cls, fps):
+        return cls(FPS, fps)
+
+    @classmethod
+    def keyframes_only(cls):
+        return cls(KEYFRAMES)
+
+    @classmethod
+    def paused(cls):
+        return cls(PAUSED)
+
+    @property
+    def is_paused(self):
+        return self.mode == PAUSED
+
+    def input_args(self):
+        """放在 -i 之前的解码器参数"""
+        if self.mode == KEYFRAMES:
+            return ['-skip_frame', 'nokey']
+        if self.mode == FPS:
+            return ['-skip_frame', 'nonref']
+        return []
+
+    def output_args(self):
+        """放在输出端的参数"""
+        if self.mode == FPS:
+            return ['-vf', f'fps={self.fps:g}']
+        return []
+
+    def ffmpeg_args(self):
+        """用于判断切换策略是否需要重新拉起 FFmpeg（暂停不改变进程参数）"""
+        return tuple(self.input_args() + self.output_args())
+
+    def requires_restart(self, launched):
+        """从以 launched 策略启动的进程切换到本策略是否需要重启进程
+
+        暂停/恢复通过挂起进程完成，无需重连；其他参数变化需要重启该路 FFmpeg。
+        """
+        if self.is_paused:
+            return False
+        return self.ffmpeg_args() != launched.ffmpeg_args()
+
+    def label(self):
+        """界面显示用的名称"""
+        if self.mode == FPS:
+            return f"{self.fps:g}fps"
+        return {FULL: '全速', KEYFRAMES: '仅关键帧', PAUSED: '暂停'}[self.mode]
+
+    def __eq__(self, other):
+        return isinstance(other, DecodePolicy) and (self.mode, self.fps) == (other.mode, other.fps)
+
+    def __hash__(self):
+        return hash((self.mode, self.fps))
+
+    def __repr__(self):
+        return f"DecodePolicy({self.mode!r}, fps={self.fps!r})"
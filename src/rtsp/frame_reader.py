@@ -0,0 +1,82 @@
+"""
+最新帧读取模块
+每路从属流（画中画等）由独立线程持续读取到"最新帧"槽位中，合成端随取随用、从不阻塞；
+某路摄像机变慢或卡住不会再拖慢主画面，帧率不一致时也不会在管道中积压。
+"""
+import time
+from collections import deque
+from threading import Thread, Lock, Event
+
+
+class LatestFrameReader:
+    """独立读取线程 + 最新帧槽位
+
+    pipe: FFmpeg stdout（rawvideo）
+    frame_size: 每帧字节数，按整帧读取
+    每路流独立统计帧率与最近一帧的时间，用于界面上的 FPS / 无信号提示。
+    """
+    def __init__(self, pipe, frame_size, name='pip', fps_window=30):
+        self.pipe = pipe
+        self.frame_size = frame_size
+        self.name = name
+        self.lock = Lock()
+        self._frame = None
+        self._seq = 0
+        self._frame_time = 0
+        self._frame_times = deque(maxlen=fps_window)
+        self._stop = Event()
+        self._thread = None
+        self.started_at = 0
+        self.eof = False  # 管道已关闭（进程退出）
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = Thread(target=self._run, name=f"reader-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                data = self.pipe.read(self.frame_size)
+                if not data or len(data) != self.frame_size:
+                    break
+                now = time.time()
+                with self.lock:
+                    self._frame = data
+                    self._seq += 1
+                    self._frame_time = now
+                    self._frame_times.append(now)
+        except Exception as e:
+            if not self._stop.is_set():
+                print(f"[{self.name}] 读取线程异常: {e}")
+        finally:
+            self.eof = True
+
+    def stop(self):
+        """停止读取（线程在当前 read 返回后退出；进程被回收、管道关闭时立即返回）"""
+        self._stop.set()
+
+    def latest(self):
+        """返回 (最新帧 bytes 或 None, 帧序号, 帧时间)，不阻塞"""
+        with self.lock:
+            return self._frame, self._seq, self._frame_time
+
+    @property
+    def fps(self):
+        with self.lock:
+            times = list(self._frame_times)
+        if len(times) < 2:
+            return 0.0
+        # 若最近已无新帧，把当前时刻计入时间跨度，使停滞时 FPS 逐渐下降而不是停在旧值
+        span = max(times[-1], time.time() - 1.0) - times[0]
+        return (len(times) - 1) / span if span > 0 else 0.0
+
+    def age(self):
+        """距离最近一帧的秒数（尚未出帧时从启动开始计）"""
+        with self.lock:
+            last = self._frame_time or self.started_at
+        return time.time() - last if last else 0.0
+
+    def is_stale(self, threshold=2.0):
+        return self.eof or self.age() > threshold
@@ -0,0 +1,90 @@
+"""
+热备解码模块
+为关键摄像机预先建立第二路已连接的低开销解码器（可指向备用 URL）：只解关键帧、输出极小的画面并丢弃，
+用于保持 RTSP 会话在线并持续确认备用流可用。看门狗超时时跳过退避，立即按完整参数为热备地址启动解码
+（流参数已缓存，使用最小探测），而不是在故障的地址上反复退避重试。
+"""
+import time
+from threading import Thread, Event
+
+from .process_utils import reap_process
+
+# 热备进程的输出尺寸：只用于确认流在出帧，越小越省
+STANDBY_SIZE = (64, 36)
+
+
+class StandbyDecoder:
+    """热备解码器
+
+    spawn: 可调用对象 spawn(url) -> subprocess.Popen，应只解关键帧并输出 STANDBY_SIZE 大小的画面
+    frame_size: 每帧 rawvideo 字节数，丢帧线程按整帧读取
+    stale_after: 超过该秒数没有新帧即认为热备不可用（只解关键帧时帧间隔等于 GOP 长度）
+    """
+    def __init__(self, spawn, url, frame_size, stale_after=10.0):
+        self.spawn = spawn
+        self.url = url
+        self.frame_size = frame_size
+        self.stale_after = stale_after
+        self.proc = None
+        self.frames_discarded = 0
+        self.last_frame_time = 0
+        self._thread = None
+        self._stop = Event()
+        self._ready = Event()
+
+    def start(self):
+        """启动热备 FFmpeg 与丢帧线程"""
+        try:
+            self.proc = self.spawn(self.url)
+        except Exception as e:
+            print(f"启动热备流失败 ({self.url}): {e}")
+            self.proc = None
+            return False
+        if self.proc is None:
+            return False
+        self._thread = Thread(target=self._discard_loop, daemon=True)
+        self._thread.start()
+        print(f"热备流已启动: {self.url}")
+        return True
+
+    def _discard_loop(self):
+        """持续按整帧读取并丢弃，保持解码器追上直播"""
+        proc = self.proc
+        try:
+            while not self._stop.is_set():
+                data = proc.stdout.read(self.frame_size)
+                if not data or len(data) != self.frame_size:
+                    break  # 进程退出或管道关闭
+                self.frames_discarded += 1
+                self.last_frame_time = time.time()
+                self._ready.set()
+        except Exception:
+            pass
+
+    def is_ready(self):
+        """热备流是否可接管：进程存活、已出帧且最近仍在出帧"""
+        return (self.proc is not None and self.proc.poll() is None and self._ready.is_set()
+                and (time.time() - self.last_frame_time) < self.stale_after)
+
+    def promote(self, spawn_full):
+        """接管：用 spawn_full(url) 按完整参数启动热备地址的解码进程并返回，随后停止热备
+
+        热备不可用或启动失败时返回 None（热备保持不变）。
+        """
+        if not self.is_ready():
+            return None
+        try:
+            proc = spawn_full(self.url)
+        except Exception as e:
+            print(f"热备接管启动失败 ({self.url}): {e}")
+            return None
+        if proc is None or proc.poll() is not None:
+            return None
+        self.stop()
+        return proc
+
+    def stop(self):
+        """停止热备并回收进程"""
+        self._stop.set()
+        proc, self.proc = self.proc, None
+        reap_process(proc)
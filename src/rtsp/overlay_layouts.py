@@ -0,0 +1,93 @@
+"""
+FFmpeg 合成布局模块
+把多路输入按布局（画中画角落、2x2/3x3 宫格、并排）生成 filter_complex，
+由 FFmpeg 在 C 层完成合成，只输出一路 rgb24 管道，替代 N 路管道 + N 次 Python 合成。
+"""
+
+LAYOUT_PIP = 'pip'
+LAYOUT_GRID_2X2 = 'grid2x2'
+LAYOUT_GRID_3X3 = 'grid3x3'
+LAYOUT_SIDE_BY_SIDE = 'side_by_side'
+
+# 布局 -> 界面显示名称
+LAYOUTS = {
+    LAYOUT_PIP: '画中画',
+    LAYOUT_GRID_2X2: '2x2',
+    LAYOUT_GRID_3X3: '3x3',
+    LAYOUT_SIDE_BY_SIDE: '并排',
+}
+
+_GRID_SIZES = {LAYOUT_GRID_2X2: (2, 2), LAYOUT_GRID_3X3: (3, 3), LAYOUT_SIDE_BY_SIDE: (2, 1)}
+
+
+def layout_capacity(layout):
+    """布局最多容纳的输入路数"""
+    if layout == LAYOUT_PIP:
+        return 2
+    if layout in _GRID_SIZES:
+        cols, rows = _GRID_SIZES[layout]
+        return cols * rows
+    raise ValueError(f"未知的合成布局: {layout}")
+
+
+def _even(v):
+    """yuv420p 等格式要求宽高为偶数"""
+    v = int(v)
+    return v - (v % 2)
+
+
+def tile_rects(layout, n_inputs, width, height, pip_ratio=1 / 3, margin=10):
+    """返回每路输入在输出画面中的 (x, y, w, h)"""
+    n = min(n_inputs, layout_capacity(layout))
+    if layout == LAYOUT_PIP:
+        rects = [(0, 0, _even(width), _even(height))]
+        if n > 1:
+            pw, ph = _even(width * pip_ratio), _even(height * pip_ratio)
+            rects.append((max(0, width - pw - margin), max(0, height - ph - margin), pw, ph))
+        return rects
+    cols, rows = _GRID_SIZES[layout]
+    tw, th = _even(width / cols), _even(height / rows)
+    return [((i % cols) * tw, (i // cols) * th, tw, th) for i in range(n)]
+
+
+def build_filter_complex(layout, n_inputs, width, height, fps=25, pip_ratio=1 / 3, margin=10):
+    """生成 filter_complex 字符串，输出标签为 [out]
+
+    - 每路输入先 setpts=PTS-STARTPTS 对齐时间轴，再缩放到所在格子大小
+    - 所有叠加使用 eof_action=pass：某路输入断开（EOF）时该格子保持底色/主画面，其余路继续输出
+    - 宫格/并排以黑色底板为主输入，任何一路摄像机掉线都不会结束整个合成；
+      底板由各路输入交错（interleave）驱动，所有输入都结束时底板随之结束，整个合成输出 EOF，
+      看门狗能据此重连，而不是无限输出黑帧
+    """
+    rects = tile_rects(layout, n_inputs, width, height, pip_ratio, margin)
+    grid = layout != LAYOUT_PIP and bool(rects)
+    parts = []
+    for i, (_, _, w, h) in enumerate(rects):
+        # 宫格额外分出一路 [k{i}] 只用于驱动底板
+        tail = f",split[v{i}][k{i}]" if grid else f"[v{i}]"
+        parts.append(f"[{i}:v]setpts=PTS-STARTPTS,scale={w}:{h},setsar=1{tail}")
+
+    if layout == LAYOUT_PIP:
+        if len(rects) == 1:
+            parts.append("[v0]null[out]")
+        else:
+            x, y = rects[1][0], rects[1][1]
+            parts.append(f"[v0][v1]overlay={x}:{y}:eof_action=pass:repeatlast=0[out]")
+        return ';'.join(parts)
+
+    if grid:
+        # 底板：把各路帧交错后限帧、缩到 2x2 涂黑再补边到整幅画面，开销与输入分辨率无关；
+        # interleave 在所有输入都 EOF 后才结束
+        keys = ''.join(f"[k{i}]" for i in range(len(rects)))
+        parts.append(f"{keys}interleave=nb_inputs={len(rects)},fps={fps},scale=2:2,drawbox=c=black:t=fill,"
+                     f"pad={_even(width)}:{_even(height)}:0:0:black,setsar=1[bg]")
+    else:
+        parts.append(f"color=c=black:s={_even(width)}x{_even(height)}:r={fps}[bg]")
+    prev = 'bg'
+    for i, (x, y, _, _) in enumerate(rects):
+        label = 'out' if i == len(rects) - 1 else f"t{i}"
+        parts.append(f"[{prev}][v{i}]overlay={x}:{y}:eof_action=pass:repeatlast=0:shortest=0[{label}]")
+        prev = label
+    if not rects:
+        parts.append("[bg]null[out]")
+    return ';'.join(parts)
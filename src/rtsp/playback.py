@@ -0,0 +1,313 @@
+"""
+录像回放模块
+根据分段索引（SegmentIndex）把时间点直接映射到 分段文件 + 最近关键帧，
+FFmpeg 从该关键帧开始解码并只丢弃到目标帧为止，不扫描文件、不从头解码。
+支持 0.25x ~ 16x 变速：输出固定为显示帧率，高倍速时只解码关键帧；
+拖动时间轴时的缩略图按关键帧懒生成并缓存在磁盘上。
+"""
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event, Lock
+
+from .process_utils import reap_process
+from .segment_index import SegmentIndex
+
+SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+KEYFRAME_ONLY_SPEED = 4.0  # 达到该倍速时只解码关键帧（P/B 帧依赖前面的帧，无法单独跳过）
+
+
+class Timeline:
+    """录像目录的时间轴：墙上时间 <-> (分段, 偏移)"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = SegmentIndex(directory)
+
+    def reload(self):
+        self.index = SegmentIndex(self.directory)
+
+    @property
+    def segments(self):
+        return self.index.snapshot()
+
+    def span(self):
+        segments = self.segments
+        if not segments:
+            return None
+        last = segments[-1]
+        return segments[0]['start_wallclock'], last['start_wallclock'] + last.get('duration', 0)
+
+    def locate(self, wallclock):
+        """返回 (分段, 偏移, 关键帧偏移)；落在两段之间的空档时跳到下一段的开头"""
+        found = self.index.find(wallclock)
+        if found is not None:
+            return found
+        for entry in self.segments:
+            if entry['start_wallclock'] >= wallclock:
+                return entry, 0.0, 0.0
+        return None
+
+    def next_segment(self, entry):
+        segments = self.segments
+        for i, e in enumerate(segments):
+            if e['file'] == entry['file'] and i + 1 < len(segments):
+                return segments[i + 1]
+        return None
+
+    def path(self, entry):
+        return os.path.join(self.directory, entry['file'])
+
+    def coverage(self, start, end, gap=2.0):
+        """[start, end) 内有录像的时间段（相邻分段合并），用于时间轴绘制"""
+        spans = []
+        for e in self.segments:
+            s = e['start_wallclock']
+            t = s + e.get('duration', 0)
+            if t < start or s > end:
+                continue
+            if spans and s - spans[-1][1] <= gap:
+                spans[-1][1] = max(spans[-1][1], t)
+            else:
+                spans.append([s, t])
+        return [(max(s, start), min(t, end)) for s, t in spans]
+
+
+class SegmentPlayer:
+    """分段录像播放器
+
+    on_frame(rgb_bytes, wallclock, (width, height)) 在播放线程中调用，帧格式为 rgb24。
+    所有控制操作（seek/play/pause/set_speed）只更新目标状态，由播放线程以"最新请求为准"执行，
+    拖动时间轴产生的大量 seek 不会排队。
+    """
+    def __init__(self, timeline, width, height, on_frame, fps=25, ffmpeg='ffmpeg'):
+        self.timeline = timeline
+        self.width = width
+        self.height = height
+        self.on_frame = on_frame
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.lock = Lock()
+        self.speed = 1.0
+        self.playing = False
+        self.position = None  # 当前显示帧的墙上时间
+        self.seek_latency_ms = 0.0
+        self.dropped = 0
+        self._target = None  # 待执行的 seek 目标
+        self._seek_start = None
+        self._version = 0
+        self._wake = Event()
+        self._stop = Event()
+        self._proc = None
+        self._thread = Thread(target=self._run, name='playback', daemon=True)
+        self._thread.start()
+
+    # ---- 控制 ----
+
+    def _request(self, **changes):
+        with self.lock:
+            for k, v in changes.items():
+                setattr(self, k, v)
+            if self._target is None:
+                self._target = self.position
+            self._version += 1
+        self._kill()
+        self._wake.set()
+
+    def seek(self, wallclock):
+        self._request(_target=wallclock, _seek_start=time.perf_counter())
+
+    def play(self):
+        self._request(playing=True)
+
+    def pause(self):
+        self._request(playing=False)
+
+    def set_speed(self, speed):
+        self._request(speed=min(max(float(speed), SPEEDS[0]), SPEEDS[-1]))
+
+    def resize(self, width, height):
+        self._request(width=max(16, int(width) // 2 * 2), height=max(16, int(height) // 2 * 2))
+
+    def close(self):
+        self._stop.set()
+        self._kill()
+        self._wake.set()
+
+    def _kill(self):
+        proc, self._proc = self._proc, None
+        reap_process(proc, timeout=0.5)
+
+    # ---- 解码 ----
+
+    def _command(self, path, offset, keyframe, speed, width, height, frames=None):
+        cmd = [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin']
+        if speed >= KEYFRAME_ONLY_SPEED and frames is None:
+            cmd += ['-skip_frame', 'nokey']
+        if keyframe is not None:
+            # 索引给出的关键帧：从该处开始解码，trim 丢弃关键帧到目标之间的帧
+            cmd += ['-ss', f"{keyframe:.3f}", '-i', path]
+            trim = max(0.0, offset - keyframe)
+        else:
+            cmd += ['-ss', f"{offset:.3f}", '-i', path]
+            trim = 0.0
+        filters = []
+        if trim > 0.001:
+            filters.append(f"trim=start={trim:.3f}")
+        filters.append(f"setpts=(PTS-STARTPTS)/{speed}")
+        filters.append(f"fps={self.fps}")
+        filters.append(f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                       f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2")
+        cmd += ['-map', '0:v:0', '-an', '-sn', '-vf', ','.join(filters)]
+        if frames is not None:
+            cmd += ['-frames:v', str(frames)]
+        cmd += ['-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1']
+        return cmd
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            while not self._stop.is_set():
+                with self.lock:
+                    target, version = self._target, self._version
+                    playing, speed = self.playing, self.speed
+                    width, height = self.width, self.height
+                    seek_start = self._seek_start
+                    self._target = None
+                    self._seek_start = None
+                if target is None:
+                    break
+                located = self.timeline.locate(target)
+                if located is None:
+                    break
+                entry, offset, keyframe = located
+                if not entry.get('keyframes'):
+                    keyframe = None
+                try:
+                    finished = self._play_from(entry, offset, keyframe, playing, speed, width, height,
+                                               version, seek_start)
+                except Exception as e:
+                    print(f"回放错误: {e}")
+                    finished = None
+                if finished is None:
+                    break
+                # 当前分段播放完：接着播放下一段
+                nxt = self.timeline.next_segment(entry)
+                with self.lock:
+                    if version != self._version or nxt is None:
+                        break
+                    self._target = nxt['start_wallclock']
+
+    def _play_from(self, entry, offset, keyframe, playing, speed, width, height, version, seek_start):
+        """解码一个分段；返回 True 表示播放到分段结尾，None 表示被新请求打断或暂停"""
+        frame_size = width * height * 3
+        frames = None if playing else 1
+        cmd = self._command(self.timeline.path(entry), offset, keyframe, speed, width, height, frames)
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                bufsize=frame_size)
+        self._proc = proc
+        base = entry['start_wallclock'] + offset
+        step = speed / self.fps  # 每个输出帧对应的录像时长
+        started = None
+        n = 0
+        try:
+            while not self._stop.is_set() and version == self._version:
+                data = proc.stdout.read(frame_size)
+                if not data or len(data) != frame_size:
+                    return True if playing and version == self._version else None
+                now = time.perf_counter()
+                if started is None:
+                    started = now
+                    if seek_start is not None:
+                        self.seek_latency_ms = (now - seek_start) * 1000
+                else:
+                    due = started + n / self.fps
+                    if now < due:
+                        time.sleep(due - now)
+                    elif now - due > 2.0 / self.fps:
+                        # 显示跟不上：丢弃这一帧，保持播放速度
+                        self.dropped += 1
+                        n += 1
+                        continue
+                position = base + n * step
+                with self.lock:
+                    if version != self._version:
+                        return None
+                    self.position = position
+                self.on_frame(data, position, (width, height))
+                n += 1
+            return None
+        finally:
+            if self._proc is proc:
+                self._proc = None
+            reap_process(proc, timeout=0.5)
+
+
+class ThumbnailCache:
+    """时间轴缩略图：每个关键帧一张 JPEG，首次请求时生成并缓存在 directory 下
+
+    生成任务在小线程池中执行；排队中的过期请求（鼠标已移开）直接跳过。
+    """
+    def __init__(self, timeline, directory=None, width=160, ffmpeg='ffmpeg', max_workers=2):
+        self.timeline = timeline
+        self.directory = directory or os.path.join(timeline.directory, 'thumbs')
+        self.width = width
+        self.ffmpeg = ffmpeg
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thumbs')
+        self._pending = set()
+        self._generation = 0
+        self.lock = Lock()
+
+    def _key(self, wallclock):
+        located = self.timeline.locate(wallclock)
+        if located is None:
+            return None
+        entry, _, keyframe = located
+        stem = os.path.splitext(entry['file'])[0]
+        path = os.path.join(self.directory, f"{stem}_{int(keyframe * 1000):08d}.jpg")
+        return entry, keyframe, path
+
+    def get(self, wallclock, callback=None):
+        """返回已缓存的缩略图路径；尚未生成时提交生成任务，完成后调用 callback(path)"""
+        key = self._key(wallclock)
+        if key is None:
+            return None
+        entry, keyframe, path = key
+        if os.path.exists(path):
+            return path
+        with self.lock:
+            self._generation += 1
+            generation = self._generation
+            if path in self._pending:
+                return None
+            self._pending.add(path)
+        self._executor.submit(self._generate, entry, keyframe, path, generation, callback)
+        return None
+
+    def _generate(self, entry, keyframe, path, generation, callback):
+        try:
+            with self.lock:
+                # 期间又有更新的请求时放弃（拖动时只关心最新位置附近的缩略图）
+                stale = self._generation - generation > 4
+            if stale:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = path + '.tmp.jpg'
+            cmd = [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+                   '-skip_frame', 'nokey', '-ss', f"{keyframe:.3f}", '-i', self.timeline.path(entry),
+                   '-frames:v', '1', '-vf', f"scale={self.width}:-2", '-q:v', '5', tmp]
+            result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL, timeout=10)
+            if result.returncode == 0 and os.path.exists(tmp):
+                os.replace(tmp, path)
+                if callback:
+                    callback(path)
+        except Exception as e:
+            print(f"生成缩略图失败: {e}")
+        finally:
+            with self.lock:
+                self._pending.discard(path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
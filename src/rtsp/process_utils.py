@@ -0,0 +1,76 @@
+"""
+FFmpeg 子进程辅助函数
+"""
+import os
+import signal
+import subprocess
+from threading import Thread
+
+
+def reap_process(proc, timeout=2.0, block=False):
+    """终止并回收子进程，避免遗留僵尸进程
+
+    先 terminate，超时后 kill，最后一定会 wait 一次以回收进程表项。
+    默认在后台线程中等待，调用方（例如流线程的重启路径）不会被阻塞。
+    """
+    if proc is None:
+        return
+
+    def _reap():
+        try:
+            if proc.poll() is None:
+                resume_process(proc)  # 被挂起的进程需先恢复才能响应 SIGTERM
+                proc.terminate()
+                try:
+                    proc.wait(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+            proc.wait()
+        except Exception as e:
+            print(f"回收FFmpeg进程错误: {e}")
+        finally:
+            for pipe in (proc.stdout, proc.stderr, proc.stdin):
+                try:
+                    if pipe:
+                        pipe.close()
+                except Exception:
+                    pass
+
+    if block:
+        _reap()
+    else:
+        Thread(target=_reap, daemon=True).start()
+
+
+# 挂起超过该秒数的 RTSP 进程恢复时应重启而不是 SIGCONT：
+# 挂起期间不读套接字、不发 RTSP 保活，服务器通常在 60 秒左右超时断开会话
+MAX_SUSPEND_SECONDS = 30.0
+
+
+def suspend_process(proc):
+    """挂起进程（POSIX 下发送 SIGSTOP）
+
+    挂起期间进程不再读取网络数据，也不发送 RTSP 保活，连接只能短时间保留；
+    调用方应记录挂起时间，超过 MAX_SUSPEND_SECONDS 后恢复时改为重启进程。
+    返回是否挂起成功；不支持的平台返回 False，调用方停止读取管道即可依靠管道背压让 FFmpeg 阻塞。
+    """
+    if proc is None or proc.poll() is not None or not hasattr(signal, 'SIGSTOP'):
+        return False
+    try:
+        os.kill(proc.pid, signal.SIGSTOP)
+        return True
+    except Exception as e:
+        print(f"挂起FFmpeg进程失败: {e}")
+        return False
+
+
+def resume_process(proc):
+    """恢复被 suspend_process 挂起的进程"""
+    if proc is None or proc.poll() is not None or not hasattr(signal, 'SIGCONT'):
+        return False
+    try:
+        os.kill(proc.pid, signal.SIGCONT)
+        return True
+    except Exception as e:
+        print(f"恢复FFmpeg进程失败: {e}")
+        return False
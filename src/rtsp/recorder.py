@@ -0,0 +1,222 @@
+"""
+分段录像模块
+每路摄像机一个独立的 FFmpeg 进程，以 `-c copy` 把 RTSP 流直接封装为滚动的 MKV/MP4 分段，
+不解码也不编码，16 路同时录像的 CPU 开销也接近于零。
+分段完成后写入索引（开始时间、PTS、关键帧偏移），并按保留时长与磁盘配额淘汰最旧的分段。
+"""
+import os
+import re
+import subprocess
+import time
+from threading import Thread, Event, Lock
+
+from .process_utils import reap_process
+from .segment_index import SegmentIndex, probe_keyframes
+
+_TIME_PATTERN = '%Y%m%d-%H%M%S'
+
+
+def safe_name(text):
+    """把 URL 或摄像机名转换为可用作目录名的字符串"""
+    text = re.sub(r'^[a-z]+://', '', text or '')
+    text = re.sub(r'[^@]*@', '', text, count=1)  # 去掉认证信息
+    return re.sub(r'[^0-9A-Za-z._-]+', '_', text).strip('_')[:80] or 'camera'
+
+
+class SegmentRecorder:
+    """单路摄像机的分段录像
+
+    url: RTSP 地址
+    directory: 分段与索引的存放目录
+    segment_seconds: 每个分段的时长（实际在该时长后的第一个关键帧处切分）
+    container: 'mkv'（默认，可容纳大多数音频编码）或 'mp4'（仅视频，兼容性好）
+    retention_seconds / quota_bytes: 超过保留时长或目录总大小超过配额时删除最旧的分段（None 表示不限制）
+    """
+    def __init__(self, url, directory, segment_seconds=60, container='mkv', retention_seconds=None,
+                 quota_bytes=None, name=None, ffmpeg='ffmpeg', ffprobe='ffprobe'):
+        self.url = url
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.container = container
+        self.retention_seconds = retention_seconds
+        self.quota_bytes = quota_bytes
+        self.name = name or safe_name(url)
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.index = SegmentIndex(directory)
+        self.proc = None
+        self.restarts = 0
+        self.last_error = None
+        self._stop = Event()
+        self._proc_lock = Lock()  # stop() 取走进程与 _run 启动新进程互斥，停止后不会再留下无人回收的 FFmpeg
+        self._thread = None
+        self._list_path = os.path.join(directory, 'segments.csv')
+        self._list_offset = 0
+
+    def _command(self):
+        pattern = os.path.join(self.directory, f"{self.name}_{_TIME_PATTERN}.{self.container}")
+        cmd = [self.ffmpeg, '-hide_banner', '-loglevel', 'error',
+               '-rtsp_transport', 'tcp', '-timeout', '5000000',
+               '-fflags', '+genpts',
+               '-i', self.url,
+               '-map', '0:v:0']
+        if self.container == 'mkv':
+            cmd += ['-map', '0:a?']
+        cmd += ['-c', 'copy',
+                '-f', 'segment',
+                '-segment_time', str(self.segment_seconds),
+                '-segment_format', 'matroska' if self.container == 'mkv' else 'mp4',
+                '-reset_timestamps', '1',
+                '-strftime', '1',
+                '-segment_list', self._list_path,
+                '-segment_list_type', 'csv',
+                '-segment_list_flags', 'live']
+        if self.container == 'mp4':
+            cmd += ['-segment_format_options', 'movflags=+faststart']
+        cmd.append(pattern)
+        return cmd
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # 上一次运行留下的分段列表已经全部处理过（或随索引加载），从文件末尾开始读取
+        try:
+            self._list_offset = os.path.getsize(self._list_path)
+        except OSError:
+            self._list_offset = 0
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name=f"recorder-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._proc_lock:
+            self._stop.set()
+            proc, self.proc = self.proc, None
+        if proc is not None:
+            try:
+                # 发送 q 让 FFmpeg 正常收尾，写完当前分段的文件尾
+                proc.stdin.write(b'q')
+                proc.stdin.flush()
+            except Exception:
+                pass
+            reap_process(proc, timeout=5.0)
+
+    @property
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def _spawn(self):
+        self.proc = subprocess.Popen(self._command(), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.DEVNULL)
+
+    def _run(self):
+        backoff = 1.0
+        spawned_at = time.time()
+        while not self._stop.is_set():
+            try:
+                proc = self.proc
+                if proc is None or proc.poll() is not None:
+                    if proc is not None:
+                        self.restarts += 1
+                        self.last_error = f"FFmpeg 退出，返回码 {proc.returncode}"
+                        print(f"[录像 {self.name}] {self.last_error}，{backoff:.0f}s 后重启")
+                        with self._proc_lock:
+                            if self.proc is proc:
+                                self.proc = None
+                        reap_process(proc)
+                        if self._stop.wait(backoff):
+                            break
+                        backoff = min(backoff * 2, 60.0)
+                    with self._proc_lock:
+                        # stop() 可能在此之前刚取走旧进程：停止后不再启动新进程
+                        if self._stop.is_set():
+                            break
+                        self._spawn()
+                    spawned_at = time.time()
+                elif time.time() - spawned_at > self.segment_seconds * 2:
+                    backoff = 1.0  # 稳定运行后重置退避
+                self._collect_segments()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[录像 {self.name}] 错误: {e}")
+            self._stop.wait(1.0)
+        self._collect_segments()
+
+    def _collect_segments(self):
+        """读取 FFmpeg 追加到分段列表中的新行（每行对应一个已写完的分段）"""
+        try:
+            with open(self._list_path, 'r', encoding='utf-8') as f:
+                f.seek(self._list_offset)
+                data = f.read()
+        except OSError:
+            return
+        if not data:
+            return
+        complete = data[:data.rfind('\n') + 1]  # 只处理完整的行
+        self._list_offset += len(complete.encode('utf-8'))
+        added = False
+        for line in complete.splitlines():
+            parts = line.rsplit(',', 2)
+            if len(parts) != 3:
+                continue
+            filename, start, end = parts
+            try:
+                self._index_segment(os.path.basename(filename), float(start), float(end))
+                added = True
+            except Exception as e:
+                print(f"[录像 {self.name}] 索引分段失败 {filename}: {e}")
+        if added:
+            self._enforce_limits()
+
+    def _index_segment(self, filename, stream_start, stream_end):
+        path = os.path.join(self.directory, filename)
+        if not os.path.exists(path):
+            return
+        stem = os.path.splitext(filename)[0]
+        try:
+            wallclock = time.mktime(time.strptime(stem.rsplit('_', 1)[-1], _TIME_PATTERN))
+        except ValueError:
+            wallclock = os.path.getmtime(path) - (stream_end - stream_start)
+        keyframes, last_pts = probe_keyframes(path, self.ffprobe)
+        start_pts = keyframes[0][0] if keyframes else 0.0
+        self.index.add({
+            'file': filename,
+            'start_wallclock': wallclock,
+            'stream_start': stream_start,
+            'start_pts': start_pts,
+            'duration': max(stream_end - stream_start, (last_pts or 0.0) - start_pts),
+            'size': os.path.getsize(path),
+            'keyframes': keyframes,
+        })
+
+    def _enforce_limits(self):
+        """按保留时长与磁盘配额删除最旧的分段"""
+        segments = self.index.snapshot()
+        total = sum(s.get('size', 0) for s in segments)
+        now = time.time()
+        evict = []
+        for s in segments[:-1]:  # 至少保留最新的一个分段
+            expired = self.retention_seconds and s.get('start_wallclock', 0) + s.get('duration', 0) < now - self.retention_seconds
+            over_quota = self.quota_bytes and total > self.quota_bytes
+            if not (expired or over_quota):
+                break
+            evict.append(s['file'])
+            total -= s.get('size', 0)
+        for filename in evict:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+        if evict:
+            self.index.remove(evict)
+            print(f"[录像 {self.name}] 淘汰 {len(evict)} 个旧分段，当前占用 {total / 1e6:.1f}MB")
+
+    def status(self):
+        segments = self.index.snapshot()
+        return {
+            'running': self.running,
+            'restarts': self.restarts,
+            'segments': len(segments),
+            'bytes': sum(s.get('size', 0) for s in segments),
+            'last_error': self.last_error,
+        }
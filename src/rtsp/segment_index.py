@@ -0,0 +1,116 @@
+"""
+录像分段索引模块
+每个录像目录下维护一个 index.jsonl，每行描述一个已完成的分段：
+文件名、开始的墙上时间、分段内的起止 PTS、文件大小以及关键帧（PTS, 字节偏移）列表。
+回放时据此直接定位到某个时间点最近的关键帧，无需扫描文件。
+"""
+import bisect
+import json
+import os
+import subprocess
+from threading import Lock
+
+
+def probe_keyframes(path, ffprobe='ffprobe', timeout=30):
+    """用 ffprobe 只读取视频包头（不解码）得到关键帧的 (pts_time, pos) 列表以及最后一个包的时间"""
+    cmd = [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,pos,flags',
+           '-of', 'csv=p=0', path]
+    try:
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             timeout=timeout, check=False).stdout.decode('utf-8', 'ignore')
+    except Exception as e:
+        print(f"读取关键帧失败 {path}: {e}")
+        return [], None
+    keyframes = []
+    last_pts = None
+    for line in out.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 3:
+            continue
+        try:
+            pts = float(parts[0])
+        except ValueError:
+            continue
+        last_pts = pts if last_pts is None else max(last_pts, pts)
+        if 'K' in parts[2]:
+            try:
+                pos = int(parts[1])
+            except ValueError:
+                pos = -1
+            keyframes.append((pts, pos))
+    return keyframes, last_pts
+
+
+class SegmentIndex:
+    """录像目录的分段索引（追加写入，淘汰时整体重写）"""
+    def __init__(self, directory, filename='index.jsonl'):
+        self.directory = directory
+        self.path = os.path.join(directory, filename)
+        self.lock = Lock()
+        self.segments = []  # 按开始时间排序的 dict 列表
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 写入中断留下的残行
+                    if os.path.exists(os.path.join(self.directory, entry.get('file', ''))):
+                        self.segments.append(entry)
+        except OSError:
+            return
+        self.segments.sort(key=lambda e: e.get('start_wallclock', 0))
+
+    def add(self, entry):
+        with self.lock:
+            self.segments.append(entry)
+            self.segments.sort(key=lambda e: e.get('start_wallclock', 0))
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            except OSError as e:
+                print(f"写入分段索引失败: {e}")
+
+    def remove(self, files):
+        """从索引中删除指定文件名并重写索引文件"""
+        files = set(files)
+        with self.lock:
+            self.segments = [e for e in self.segments if e.get('file') not in files]
+            try:
+                tmp = self.path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    for e in self.segments:
+                        f.write(json.dumps(e, ensure_ascii=False) + '\n')
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"重写分段索引失败: {e}")
+
+    def total_bytes(self):
+        with self.lock:
+            return sum(e.get('size', 0) for e in self.segments)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.segments)
+
+    def find(self, wallclock):
+        """返回 (分段, 分段内偏移秒数, 该偏移之前最近的关键帧时间)；不在任何分段内时返回 None"""
+        with self.lock:
+            segments = list(self.segments)
+        starts = [e.get('start_wallclock', 0) for e in segments]
+        i = bisect.bisect_right(starts, wallclock) - 1
+        if i < 0:
+            return None
+        entry = segments[i]
+        offset = wallclock - entry.get('start_wallclock', 0)
+        if offset > entry.get('duration', 0) + 1.0:
+            return None
+        start_pts = entry.get('start_pts') or 0.0
+        key_times = [pts - start_pts for pts, _ in entry.get('keyframes', [])]
+        k = bisect.bisect_right(key_times, offset) - 1
+        keyframe = key_times[k] if k >= 0 else 0.0
+        return entry, offset, keyframe
@@ -0,0 +1,303 @@
+"""
+摄像机快照服务
+为几十路摄像机的预览墙提供低分辨率快照：每次只用一个短命的 FFmpeg 进程解码一个关键帧
+（或由已在运行的解码器直接"旁路"一帧），缩放并编码为 JPEG 一次，之后所有读者共享同一份字节。
+快照放在带 TTL 的 LRU 内存缓存中（按字节数限制），并落盘一份，程序重启后立即有旧图可显示。
+"""
+import io
+import os
+import subprocess
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Lock, Thread, Event
+
+from .recorder import safe_name
+
+
+@dataclass
+class Snapshot:
+    """一张 JPEG 快照"""
+    camera: str
+    jpeg: bytes
+    timestamp: float
+    source: str = 'grab'  # grab（短进程抓取）/ tap（解码器旁路）/ disk（磁盘缓存）
+
+    @property
+    def age(self):
+        return time.time() - self.timestamp
+
+
+def grab_snapshot(url, width=320, ffmpeg='ffmpeg', timeout=10.0, probe_args=None, quality=5):
+    """用一次短 FFmpeg 运行抓取一个关键帧，缩放到 width 宽后编码为 JPEG 字节
+
+    -skip_frame nokey 让解码器跳过所有非关键帧，只付出解一个 I 帧的代价。
+    probe_args: 可选的探测参数（例如 StreamInfoCache.probe_args 的结果），命中缓存时启动更快。
+    """
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin']
+    if url.startswith('rtsp://'):
+        cmd += ['-rtsp_transport', 'tcp', '-timeout', str(int(timeout * 1e6))]
+    cmd += list(probe_args or [])
+    cmd += ['-skip_frame', 'nokey', '-i', url,
+            '-map', '0:v:0', '-frames:v', '1',
+            '-vf', f"scale={int(width)}:-2", '-q:v', str(quality),
+            '-f', 'image2pipe', '-vcodec', 'mjpeg', 'pipe:1']
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, timeout=timeout + 5)
+    if result.returncode != 0 or not result.stdout.startswith(b'\xff\xd8'):
+        err = result.stderr.decode('utf-8', 'ignore').strip().splitlines()
+        raise RuntimeError(err[-1] if err else f"FFmpeg 返回码 {result.returncode}")
+    return result.stdout
+
+
+class SnapshotService:
+    """快照缓存与刷新
+
+    ttl: 快照多久后视为过期（过期仍可返回，同时后台刷新）
+    memory_bytes: 内存层上限（LRU 淘汰）
+    disk_dir: 磁盘层目录，None 表示不落盘
+    width: 快照宽度（高度按比例）
+    max_workers: 同时运行的抓取进程数，几十路摄像机时限制瞬时 CPU 与网络占用
+    """
+    def __init__(self, ttl=5.0, memory_bytes=64 * 1024 * 1024, disk_dir=None, width=320,
+                 max_workers=4, ffmpeg='ffmpeg', stream_info_cache=None):
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir if disk_dir is not None else os.path.join(os.getcwd(), 'cache', 'snapshots')
+        self.width = width
+        self.ffmpeg = ffmpeg
+        self.stream_info_cache = stream_info_cache
+        self.lock = Lock()
+        self._urls = {}  # camera -> url
+        self._cache = OrderedDict()  # camera -> Snapshot，最近使用的在末尾
+        self._bytes = 0
+        self._inflight = set()
+        self._failures = {}  # camera -> (连续失败次数, 下次允许重试的时间)
+        self._listeners = []
+        self._watched = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='snapshot')
+        self._stop = Event()
+        self._refresher = None
+        self.stats = {'hits': 0, 'stale_hits': 0, 'disk_hits': 0, 'misses': 0,
+                      'grabs': 0, 'taps': 0, 'failures': 0, 'evictions': 0}
+
+    # ---- 摄像机登记 ----
+
+    def register(self, camera, url):
+        """登记摄像机 ID 与其 RTSP 地址（建议使用子码流，抓取更快）"""
+        with self.lock:
+            self._urls[camera] = url
+
+    def unregister(self, camera):
+        with self.lock:
+            self._urls.pop(camera, None)
+            self._watched.discard(camera)
+            snap = self._cache.pop(camera, None)
+            if snap is not None:
+                self._bytes -= len(snap.jpeg)
+
+    def cameras(self):
+        with self.lock:
+            return list(self._urls)
+
+    def set_width(self, width):
+        """调整快照宽度（网格尺寸变化时），已缓存的快照在下次刷新时按新尺寸生成"""
+        self.width = max(32, int(width) // 2 * 2)
+
+    def subscribe(self, callback):
+        """callback(snapshot) 在刷新线程中调用"""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        try:
+            self._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    # ---- 读取 ----
+
+    def get(self, camera, refresh=True):
+        """立即返回缓存中的快照（可能过期或为 None）；过期或缺失时在后台刷新"""
+        now = time.time()
+        with self.lock:
+            snap = self._cache.get(camera)
+            if snap is not None:
+                self._cache.move_to_end(camera)
+                fresh = now - snap.timestamp <= self.ttl
+                self.stats['hits' if fresh else 'stale_hits'] += 1
+            else:
+                fresh = False
+        if snap is None:
+            snap = self._load_disk(camera)
+            if snap is None:
+                self.stats['misses'] += 1
+        if refresh and not fresh:
+            self.refresh(camera)
+        return snap
+
+    def get_blocking(self, camera, timeout=10.0):
+        """返回不超过 ttl 的快照，必要时等待一次抓取完成（供 API 等需要新图的调用方使用）"""
+        snap = self.get(camera, refresh=False)
+        if snap is not None and snap.age <= self.ttl:
+            return snap
+        future = self.refresh(camera)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+        return self.get(camera, refresh=False)
+
+    # ---- 写入 ----
+
+    def refresh(self, camera):
+        """提交一次抓取（同一摄像机同时只有一个抓取任务；失败后指数退避），返回 Future 或 None"""
+        now = time.time()
+        with self.lock:
+            url = self._urls.get(camera)
+            if url is None or camera in self._inflight:
+                return None
+            failures, retry_at = self._failures.get(camera, (0, 0.0))
+            if now < retry_at:
+                return None
+            self._inflight.add(camera)
+        return self._executor.submit(self._grab, camera, url)
+
+    def _grab(self, camera, url):
+        try:
+            probe_args = self.stream_info_cache.probe_args(url) if self.stream_info_cache else None
+            jpeg = grab_snapshot(url, self.width, self.ffmpeg, probe_args=probe_args)
+            self.stats['grabs'] += 1
+            with self.lock:
+                self._failures.pop(camera, None)
+            self.put(camera, jpeg, source='grab')
+        except Exception as e:
+            self.stats['failures'] += 1
+            with self.lock:
+                failures = self._failures.get(camera, (0, 0.0))[0] + 1
+                self._failures[camera] = (failures, time.time() + min(self.ttl * 2 ** failures, 300.0))
+            print(f"抓取快照失败 {camera}: {e}")
+        finally:
+            with self.lock:
+                self._inflight.discard(camera)
+
+    def put(self, camera, jpeg, timestamp=None, source='grab'):
+        """写入一张已编码的 JPEG 快照（内存层 + 磁盘层）并通知订阅者"""
+        snap = Snapshot(camera, jpeg, timestamp or time.time(), source)
+        with self.lock:
+            old = self._cache.pop(camera, None)
+            if old is not None:
+                self._bytes -= len(old.jpeg)
+            self._cache[camera] = snap
+            self._bytes += len(jpeg)
+            while self._bytes > self.memory_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= len(evicted.jpeg)
+                self.stats['evictions'] += 1
+        self._save_disk(snap)
+        for callback in list(self._listeners):
+            try:
+                callback(snap)
+            except Exception as e:
+                print(f"快照回调错误: {e}")
+        return snap
+
+    def tap(self, camera, image, quality=75):
+        """解码器旁路：已在解码的流直接提供一帧（PIL Image），不再单独抓取
+
+        只有缓存过期时才真正缩放和编码，调用方可以每帧都调用。
+        """
+        with self.lock:
+            snap = self._cache.get(camera)
+            if snap is not None and time.time() - snap.timestamp < self.ttl:
+                return None
+            if camera in self._inflight:
+                return None
+            self._inflight.add(camera)
+        try:
+            thumb = image.copy()
+            thumb.thumbnail((self.width, self.width))
+            buf = io.BytesIO()
+            thumb.convert('RGB').save(buf, 'JPEG', quality=quality)
+            self.stats['taps'] += 1
+            return self.put(camera, buf.getvalue(), source='tap')
+        except Exception as e:
+            print(f"旁路快照编码失败 {camera}: {e}")
+            return None
+        finally:
+            with self.lock:
+                self._inflight.discard(camera)
+
+    # ---- 磁盘层 ----
+
+    def _disk_path(self, camera):
+        return os.path.join(self.disk_dir, f"{safe_name(camera)}.jpg")
+
+    def _save_disk(self, snap):
+        if not self.disk_dir:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            path = self._disk_path(snap.camera)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(snap.jpeg)
+            os.replace(tmp, path)
+            os.utime(path, (snap.timestamp, snap.timestamp))
+        except OSError as e:
+            print(f"保存快照失败 {snap.camera}: {e}")
+
+    def _load_disk(self, camera):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(camera)
+        try:
+            with open(path, 'rb') as f:
+                jpeg = f.read()
+            timestamp = os.path.getmtime(path)
+        except OSError:
+            return None
+        snap = Snapshot(camera, jpeg, timestamp, 'disk')
+        with self.lock:
+            if camera not in self._cache:
+                self._cache[camera] = snap
+                self._bytes += len(jpeg)
+        self.stats['disk_hits'] += 1
+        return snap
+
+    # ---- 自动刷新 ----
+
+    def watch(self, cameras):
+        """设置需要保持新鲜的摄像机集合（例如预览墙当前可见的格子）"""
+        with self.lock:
+            self._watched = set(cameras)
+        if self._refresher is None:
+            self._stop.clear()
+            self._refresher = Thread(target=self._refresh_loop, name='snapshot-refresh', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(min(1.0, self.ttl / 2)):
+            with self.lock:
+                watched = list(self._watched)
+            now = time.time()
+            # 最旧的先刷新，并发数由线程池限制
+            pending = []
+            for camera in watched:
+                with self.lock:
+                    snap = self._cache.get(camera)
+                age = now - snap.timestamp if snap is not None else float('inf')
+                if age > self.ttl:
+                    pending.append((age, camera))
+            for _, camera in sorted(pending, reverse=True):
+                self.refresh(camera)
+
+    def memory_usage(self):
+        with self.lock:
+            return self._bytes, len(self._cache)
+
+    def shutdown(self):
+        self._stop.set()
+        self._refresher = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,199 @@
+"""
+流参数缓存模块
+按摄像机 URL 缓存编码格式、分辨率、帧率、像素格式以及由 SPS/PPS 推导出的参数（profile/level/参考帧等），
+首次连接时通过 ffprobe 学习并持久化到磁盘，之后的启动与看门狗重启即可使用最小探测参数快速出图。
+"""
+import json
+import os
+import subprocess
+import time
+from threading import Lock, Thread
+from urllib.parse import urlsplit, urlunsplit
+
+
+# 使用缓存时的最小探测参数：SDP 中通常已带 sprop-parameter-sets，只需极少数据即可完成初始化
+FAST_PROBE_SIZE = '65536'          # 64KB
+FAST_ANALYZE_DURATION = '100000'   # 0.1s
+
+# 未命中缓存时沿用原有的探测参数
+LOW_LATENCY_PROBE_ARGS = ['-analyzeduration', '500000', '-probesize', '32768']
+QUALITY_PROBE_ARGS = ['-analyzeduration', '10000000', '-probesize', '10000000']
+
+# 支持按编码格式选择的硬件解码器后缀
+_HW_DECODER_CODECS = ('h264', 'hevc')
+
+
+def cache_key(url):
+    """缓存键：去掉 URL 中的认证信息（user:pass@），摄像机密码不会写入缓存文件"""
+    try:
+        parts = urlsplit(url)
+        if '@' not in parts.netloc:
+            return url
+        host = parts.hostname or ''
+        if ':' in host:
+            host = f"[{host}]"  # IPv6
+        if parts.port:
+            host += f":{parts.port}"
+        return urlunsplit(parts._replace(netloc=host))
+    except ValueError:
+        return url
+
+
+class StreamInfoCache:
+    """按 URL 保存的流参数缓存（线程安全，JSON 持久化；键为去掉认证信息的 URL）
+
+    缓存项示例::
+
+        {
+            "codec": "h264", "profile": "High", "level": 41,
+            "width": 1920, "height": 1080, "fps": 25.0, "pix_fmt": "yuvj420p",
+            "has_b_frames": 0, "refs": 1, "learned_at": 1700000000.0
+        }
+    """
+    def __init__(self, path=None, max_age=7 * 24 * 3600):
+        self.path = path or os.path.join(os.getcwd(), 'cache', 'stream_info.json')
+        self.max_age = max_age  # 缓存有效期（秒），过期后重新学习
+        self.lock = Lock()
+        self._entries = {}
+        self._learning = set()  # 正在学习中的 URL，避免重复启动 ffprobe
+        self._load()
+
+    def _load(self):
+        """从磁盘加载缓存，文件不存在或损坏时从空缓存开始"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                # 旧版本以完整 URL（可能带密码）为键：加载时改写并立即覆盖文件
+                self._entries = {cache_key(k): v for k, v in data.items()}
+                if list(self._entries) != list(data):
+                    with self.lock:
+                        self._save()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"加载流参数缓存失败: {e}")
+
+    def _save(self):
+        """原子写入磁盘（先写临时文件再替换），调用方需持有锁"""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"保存流参数缓存失败: {e}")
+
+    def get(self, url):
+        """返回 URL 对应的缓存项，不存在或已过期时返回 None"""
+        with self.lock:
+            info = self._entries.get(cache_key(url))
+        if not info:
+            return None
+        if self.max_age and time.time() - info.get('learned_at', 0) > self.max_age:
+            return None
+        return info
+
+    def put(self, url, info):
+        """写入缓存项并持久化"""
+        info = dict(info)
+        info['learned_at'] = time.time()
+        with self.lock:
+            self._entries[cache_key(url)] = info
+            self._save()
+
+    def invalidate(self, url):
+        """删除缓存项（例如使用快速探测启动失败时），下次启动回退到完整探测"""
+        key = cache_key(url)
+        with self.lock:
+            if self._entries.pop(key, None) is not None:
+                print(f"流参数缓存已失效: {key}")
+                self._save()
+
+    def probe_args(self, url, low_latency=False):
+        """返回放在 -i 之前的探测参数：命中缓存时使用最小探测，否则按模式使用原有参数"""
+        if self.get(url):
+            return ['-analyzeduration', FAST_ANALYZE_DURATION,
+                    '-probesize', FAST_PROBE_SIZE,
+                    '-fpsprobesize', '0']  # 帧率已知，跳过帧率探测
+        return list(LOW_LATENCY_PROBE_ARGS if low_latency else QUALITY_PROBE_ARGS)
+
+    def codec_for(self, url, default='h264'):
+        """返回缓存的编码格式（仅限支持硬件解码器选择的格式），未知时返回 default"""
+        info = self.get(url)
+        codec = (info or {}).get('codec')
+        return codec if codec in _HW_DECODER_CODECS else default
+
+    @staticmethod
+    def probe(url, timeout=15.0):
+        """使用 ffprobe 完整探测一次流参数，失败返回 None"""
+        cmd = ['ffprobe', '-v', 'error', '-hide_banner']
+        if url.startswith('rtsp://'):
+            cmd += ['-rtsp_transport', 'tcp']
+        cmd += [
+            '-analyzeduration', '10000000', '-probesize', '10000000',
+            '-select_streams', 'v:0',
+            '-show_entries',
+            'stream=codec_name,profile,level,width,height,pix_fmt,r_frame_rate,avg_frame_rate,'
+            'has_b_frames,refs,field_order',
+            '-of', 'json', url,
+        ]
+        try:
+            out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 timeout=timeout, check=False)
+            data = json.loads(out.stdout.decode('utf-8', errors='ignore') or '{}')
+            streams = data.get('streams') or []
+            if not streams:
+                return None
+            s = streams[0]
+            return {
+                'codec': s.get('codec_name'),
+                'profile': s.get('profile'),
+                'level': s.get('level'),
+                'width': s.get('width'),
+                'height': s.get('height'),
+                'fps': _parse_rate(s.get('avg_frame_rate')) or _parse_rate(s.get('r_frame_rate')),
+                'pix_fmt': s.get('pix_fmt'),
+                'has_b_frames': s.get('has_b_frames'),
+                'refs': s.get('refs'),
+                'field_order': s.get('field_order'),
+            }
+        except Exception as e:
+            print(f"ffprobe 探测失败 ({cache_key(url)}): {e}")
+            return None
+
+    def learn_async(self, url, on_done=None):
+        """后台学习 URL 的流参数（已缓存或正在学习时直接返回）"""
+        if not url or self.get(url):
+            return
+        key = cache_key(url)
+        with self.lock:
+            if key in self._learning:
+                return
+            self._learning.add(key)
+
+        def _run():
+            try:
+                info = self.probe(url)
+                if info and info.get('width') and info.get('height'):
+                    self.put(url, info)
+                    print(f"已缓存流参数: {key} -> {info.get('codec')} "
+                          f"{info.get('width')}x{info.get('height')} @ {info.get('fps')}fps")
+                if on_done:
+                    on_done(url, info)
+            finally:
+                with self.lock:
+                    self._learning.discard(key)
+
+        Thread(target=_run, daemon=True).start()
+
+
+def _parse_rate(rate):
+    """把 ffprobe 的 '25/1' 形式帧率转换为浮点数"""
+    try:
+        num, den = str(rate).split('/')
+        den = float(den)
+        return round(float(num) / den, 3) if den else None
+    except Exception:
+        return None
@@ -0,0 +1,161 @@
+"""
+宫格预览的单格解码模块
+每个格子一个 FFmpeg 进程，输出尺寸等于格子在屏幕上的尺寸，帧率与码流按格子大小选择：
+大格子全速解码主码流，小格子限帧解码子码流，被放大的格子之外只解关键帧，不可见的格子直接挂起。
+解码 CPU 随屏幕上显示的像素数增长，而不是随摄像机数量增长。
+"""
+import subprocess
+import time
+from threading import Lock
+
+from .decode_policy import DecodePolicy
+from .frame_reader import LatestFrameReader
+from .process_utils import reap_process, suspend_process, resume_process, MAX_SUSPEND_SECONDS
+
+# 达到该像素数的格子使用主码流（否则子码流足够清晰）
+MAIN_STREAM_PIXELS = 960 * 540
+# 达到该像素数的格子全速解码
+FULL_RATE_PIXELS = 640 * 360
+# 后台（另一格被放大时）格子的输出尺寸
+THUMBNAIL_SIZE = (320, 180)
+
+
+def plan_tile(width, height, visible=True, background=False):
+    """根据格子的屏幕尺寸与可见性给出 (输出宽, 输出高, 是否用主码流, DecodePolicy)"""
+    if background:
+        width, height = THUMBNAIL_SIZE
+    width, height = max(32, int(width) // 2 * 2), max(18, int(height) // 2 * 2)
+    if not visible:
+        return width, height, False, DecodePolicy.paused()
+    if background:
+        return width, height, False, DecodePolicy.keyframes_only()
+    pixels = width * height
+    use_main = pixels >= MAIN_STREAM_PIXELS
+    if pixels >= FULL_RATE_PIXELS:
+        return width, height, use_main, DecodePolicy.full()
+    if pixels >= FULL_RATE_PIXELS // 4:
+        return width, height, use_main, DecodePolicy.at_fps(12)
+    return width, height, use_main, DecodePolicy.at_fps(5)
+
+
+class TileDecoder:
+    """单个格子的解码进程
+
+    configure() 可以反复调用：仅在地址、尺寸或解码参数变化时重启进程；
+    切换为暂停策略时挂起进程，短时间内恢复可见时立即继续出图；
+    挂起超过 MAX_SUSPEND_SECONDS 后 RTSP 会话可能已失效，恢复时重启进程。
+    """
+    def __init__(self, name, ffmpeg='ffmpeg', stream_info_cache=None):
+        self.name = name
+        self.ffmpeg = ffmpeg
+        self.stream_info_cache = stream_info_cache
+        self.lock = Lock()
+        self.proc = None
+        self.reader = None
+        self.url = None
+        self.size = None
+        self.policy = None
+        self._launched = None  # 当前进程启动时使用的策略
+        self._suspended = False
+        self._suspended_at = 0.0
+        self._restart_at = 0.0
+        self._backoff = 1.0
+        self.restarts = 0
+
+    def _command(self, url, width, height, policy):
+        cmd = [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin']
+        if url.startswith('rtsp://'):
+            cmd += ['-rtsp_transport', 'tcp', '-timeout', '5000000']
+        cmd += ['-fflags', '+genpts+discardcorrupt', '-flags', '+low_delay']
+        if self.stream_info_cache is not None:
+            cmd += self.stream_info_cache.probe_args(url)
+        cmd += policy.input_args()
+        cmd += ['-i', url, '-map', '0:v:0', '-an', '-sn']
+        filters = []
+        if policy.fps:
+            filters.append(f"fps={policy.fps:g}")
+        # 保持画面比例，四周补黑边到格子尺寸，帧大小固定
+        filters.append(f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                       f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2")
+        cmd += ['-vf', ','.join(filters), '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-vsync', '0', '-']
+        return cmd
+
+    def configure(self, url, width, height, policy):
+        with self.lock:
+            self.policy = policy
+            if policy.is_paused:
+                if self.proc is not None and not self._suspended:
+                    self._suspended = suspend_process(self.proc)
+                    self._suspended_at = time.time()
+                return
+            running = self.proc is not None and self.proc.poll() is None
+            if (running and url == self.url and (width, height) == self.size
+                    and not policy.requires_restart(self._launched)
+                    and not (self._suspended and time.time() - self._suspended_at > MAX_SUSPEND_SECONDS)):
+                if self._suspended:
+                    resume_process(self.proc)
+                    self._suspended = False
+                return
+            self.url, self.size = url, (width, height)
+            self._restart_locked()
+
+    def _restart_locked(self):
+        self._stop_locked()
+        if not self.url or self.policy is None or self.policy.is_paused:
+            return
+        width, height = self.size
+        try:
+            self.proc = subprocess.Popen(self._command(self.url, width, height, self.policy),
+                                         stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL, bufsize=width * height * 3)
+        except Exception as e:
+            print(f"[{self.name}] 启动解码失败: {e}")
+            self.proc = None
+            self._restart_at = time.time() + self._backoff
+            return
+        self._launched = self.policy
+        self.reader = LatestFrameReader(self.proc.stdout, width * height * 3, name=self.name).start()
+
+    def _stop_locked(self):
+        proc, self.proc = self.proc, None
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+        self._suspended = False
+        reap_process(proc, timeout=1.0)
+
+    def poll(self):
+        """由界面定时调用：进程意外退出时按退避时间重启"""
+        with self.lock:
+            if self.policy is None or self.policy.is_paused or not self.url:
+                return
+            dead = self.proc is None or (self.reader is not None and self.reader.eof)
+            if not dead:
+                if self.reader is not None and self.reader.age() < 5.0:
+                    self._backoff = 1.0
+                return
+            now = time.time()
+            if now < self._restart_at:
+                return
+            self.restarts += 1
+            self._restart_at = now + self._backoff
+            self._backoff = min(self._backoff * 2, 30.0)
+            self._restart_locked()
+
+    def latest(self):
+        """返回 (帧 bytes 或 None, 帧序号, (宽, 高))"""
+        reader, size = self.reader, self.size
+        if reader is None:
+            return None, 0, size
+        frame, seq, _ = reader.latest()
+        return frame, seq, size
+
+    @property
+    def fps(self):
+        reader = self.reader
+        return reader.fps if reader is not None and not self._suspended else 0.0
+
+    def stop(self):
+        with self.lock:
+            self.policy = None
+            self._stop_locked()
@@ -1 +1,469 @@
-# This file is intentionally left blank.
\ No newline at end of file
+"""
+播放器配置（TOML / YAML 文件 + 环境变量覆盖）
+启动时加载并校验，运行中由 ConfigWatcher 轮询文件修改时间热加载。
+
+文件结构（TOML 示例见项目根目录 config.example.toml）：
+- [player]     主画面/画中画地址、当前摄像机、退避与队列等全局参数
+- [profile]    所有摄像机的默认配置（解码尺寸、硬件解码、低延迟、检测节奏/类别/置信度/ROI）
+- [cameras.X]  按摄像机覆盖 [profile] 中的任意字段，url 用于匹配主画面地址
+- [recording] / [clips] / [api]
+
+环境变量覆盖：RTSP_PLAYER__<段>__<键>=<值>（双下划线分隔层级，值按 TOML 语法解析，
+解析失败时按字符串处理），例如 RTSP_PLAYER__PROFILE__DECODE_WIDTH=1920、
+RTSP_PLAYER__CAMERAS__GATE__ROI="[0, 0, 0.5, 0.5]"；RTSP_PLAYER_CONFIG 指定配置文件路径。
+"""
+import os
+import time
+import dataclasses
+from dataclasses import dataclass, field
+from threading import Thread, Event
+
+from src.utils.lazy_import import PRELOAD_TARGETS
+from src.detection.pipeline import POLICIES as DETECT_POLICIES
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except Exception:
+    YAML_AVAILABLE = False
+
+ENV_PREFIX = 'RTSP_PLAYER__'
+ENV_CONFIG_PATH = 'RTSP_PLAYER_CONFIG'
+DEFAULT_FILENAMES = ('config.toml', 'config.yaml', 'config.yml')
+
+HW_ACCEL_CHOICES = ('off', 'auto', 'cuda', 'qsv', 'vaapi')
+# 检测类别与界面复选框的对应关系（车辆复选框对应一组类别）
+VEHICLE_CLASSES = ('car', 'truck', 'bus', 'motorcycle', 'bicycle')
+KNOWN_CLASSES = ('person', 'drone') + VEHICLE_CLASSES
+
+
+class ConfigError(ValueError):
+    """配置文件无法解析或校验失败；errors 为全部错误信息列表"""
+    def __init__(self, errors, path=None):
+        self.errors = list(errors)
+        self.path = path
+        where = f"{path}: " if path else ''
+        super().__init__(where + '；'.join(self.errors))
+
+
+@dataclass(frozen=True)
+class CameraProfile:
+    """单路摄像机的解码与检测参数"""
+    name: str = 'default'
+    url: str = ''
+    decode_width: int = 3840
+    decode_height: int = 2160
+    hw_accel: str = 'off'  # off / auto（依次尝试 CUDA、QSV、VAAPI）/ 指定一种
+    low_latency: bool = False
+    frame_timeout: float = 10.0  # 看门狗：超过此秒数无新帧则重启
+    detect_interval: int = 10  # 每 N 帧提交一次检测
+    detect_size: int = 640  # 检测下采样尺寸
+    classes: tuple = ('person', 'car', 'truck', 'bus', 'motorcycle', 'bicycle', 'drone')
+    conf_threshold: float = 0.25
+    roi: tuple = (0.0, 0.0, 1.0, 1.0)  # 检测区域（归一化 x1, y1, x2, y2），区域外不做检测
+    tilt_sign: int = 1  # 云台方向：1 表示 tilt 增大时画面向下（与界面方向按钮一致），镜头倒装时设为 -1
+
+    def validate(self):
+        errors = []
+        if not (16 <= self.decode_width <= 7680 and 16 <= self.decode_height <= 4320):
+            errors.append(f"decode_width/decode_height 超出范围: {self.decode_width}x{self.decode_height}")
+        elif self.decode_width % 2 or self.decode_height % 2:
+            errors.append(f"解码尺寸必须为偶数: {self.decode_width}x{self.decode_height}")
+        if self.hw_accel not in HW_ACCEL_CHOICES:
+            errors.append(f"hw_accel 必须为 {'/'.join(HW_ACCEL_CHOICES)} 之一: {self.hw_accel}")
+        if self.frame_timeout <= 0:
+            errors.append(f"frame_timeout 必须大于 0: {self.frame_timeout}")
+        if self.detect_interval < 1:
+            errors.append(f"detect_interval 必须不小于 1: {self.detect_interval}")
+        if not 64 <= self.detect_size <= 1920 or self.detect_size % 32:
+            errors.append(f"detect_size 必须为 64~1920 之间 32 的倍数: {self.detect_size}")
+        unknown = [c for c in self.classes if c not in KNOWN_CLASSES]
+        if unknown:
+            errors.append(f"未知的检测类别 {unknown}，可选: {', '.join(KNOWN_CLASSES)}")
+        if not 0.0 < self.conf_threshold < 1.0:
+            errors.append(f"conf_threshold 必须在 0~1 之间: {self.conf_threshold}")
+        if len(self.roi) != 4:
+            errors.append(f"roi 必须为 [x1, y1, x2, y2]: {list(self.roi)}")
+        else:
+            x1, y1, x2, y2 = self.roi
+            if not (0.0 <= x1 < x2 <= 1.0 and 0.0 <= y1 < y2 <= 1.0):
+                errors.append(f"roi 必须是 0~1 之间的归一化坐标且 x1<x2、y1<y2: {list(self.roi)}")
+        if self.tilt_sign not in (1, -1):
+            errors.append(f"tilt_sign 必须为 1 或 -1: {self.tilt_sign}")
+        return [f"[{self.name}] {e}" for e in errors]
+
+    @property
+    def full_frame(self):
+        return tuple(self.roi) == (0.0, 0.0, 1.0, 1.0)
+
+
+@dataclass(frozen=True)
+class PlayerConfig:
+    stream1: str = 'rtsp://172.20.4.99/live/VideoChannel1'
+    stream2: str = 'rtsp://172.20.4.99/live/VideoChannel2'
+    backup: str = ''
+    camera: str = ''  # 主画面使用的 [cameras.X]；为空时按 url 匹配
+    pip_fps: float = 10.0
+    pip_stale_threshold: float = 2.0
+    max_backoff: float = 60.0
+    ui_queue_size: int = 1  # 只在启动时生效
+    detect_queue_size: int = 1
+    detect_policy: str = 'latest_only'  # 检测队列满时的丢弃策略：latest_only / drop_oldest / drop_newest
+    onvif_log_max_lines: int = 3000
+    reload_interval: float = 2.0  # 配置文件轮询间隔（秒），0 表示不热加载
+    preload: tuple = ('cv2', 'onvif')  # 窗口显示后在后台预加载的依赖（可选 cv2 / onvif / yolo）
+
+    def validate(self):
+        errors = []
+        if self.pip_fps <= 0:
+            errors.append(f"pip_fps 必须大于 0: {self.pip_fps}")
+        if self.pip_stale_threshold <= 0:
+            errors.append(f"pip_stale_threshold 必须大于 0: {self.pip_stale_threshold}")
+        if self.max_backoff < 1:
+            errors.append(f"max_backoff 必须不小于 1: {self.max_backoff}")
+        for key in ('ui_queue_size', 'detect_queue_size'):
+            if not 1 <= getattr(self, key) <= 64:
+                errors.append(f"{key} 必须在 1~64 之间: {getattr(self, key)}")
+        if self.detect_policy not in DETECT_POLICIES:
+            errors.append(f"detect_policy 必须为 {'/'.join(DETECT_POLICIES)} 之一: {self.detect_policy}")
+        if self.onvif_log_max_lines < 100:
+            errors.append(f"onvif_log_max_lines 必须不小于 100: {self.onvif_log_max_lines}")
+        if self.reload_interval < 0:
+            errors.append(f"reload_interval 不能为负: {self.reload_interval}")
+        unknown = [n for n in self.preload if n not in PRELOAD_TARGETS]
+        if unknown:
+            errors.append(f"未知的预加载项 {unknown}，可选: {', '.join(PRELOAD_TARGETS)}")
+        return [f"[player] {e}" for e in errors]
+
+
+@dataclass(frozen=True)
+class RecordingConfig:
+    dir: str = 'recordings'
+    segment_seconds: int = 60
+    retention_hours: float = 7 * 24
+    quota_gb: float = 50.0  # 每路摄像机的磁盘配额
+
+    def validate(self):
+        errors = []
+        if not 2 <= self.segment_seconds <= 3600:
+            errors.append(f"segment_seconds 必须在 2~3600 之间: {self.segment_seconds}")
+        if self.retention_hours <= 0 or self.quota_gb <= 0:
+            errors.append("retention_hours 与 quota_gb 必须大于 0")
+        return [f"[recording] {e}" for e in errors]
+
+
+@dataclass(frozen=True)
+class ClipConfig:
+    dir: str = os.path.join('recordings', 'clips')
+    pre_seconds: float = 10.0
+    post_seconds: float = 10.0
+    trigger_classes: tuple = ('person', 'drone')
+
+    def validate(self):
+        errors = []
+        if not 0 <= self.pre_seconds <= 300 or not 0 <= self.post_seconds <= 300:
+            errors.append(f"pre_seconds/post_seconds 必须在 0~300 之间: {self.pre_seconds}/{self.post_seconds}")
+        unknown = [c for c in self.trigger_classes if c not in KNOWN_CLASSES]
+        if unknown:
+            errors.append(f"未知的触发类别 {unknown}")
+        return [f"[clips] {e}" for e in errors]
+
+
+@dataclass(frozen=True)
+class ApiConfig:
+    """API 服务参数只在启动时生效；默认不启动"""
+    enabled: bool = False
+    host: str = '127.0.0.1'
+    port: int = 8765
+    token: str = ''  # 访问令牌（Authorization: Bearer 或 ?token=），为空时不校验
+    allowed_origins: tuple = ()  # 允许访问的网页来源，其他网页的跨域请求与 WebSocket 一律拒绝
+
+    def validate(self):
+        errors = []
+        if not 0 < self.port < 65536:
+            errors.append(f"[api] port 超出范围: {self.port}")
+        if self.host not in ('127.0.0.1', 'localhost', '::1') and not self.token:
+            errors.append(f"[api] 监听非本机地址 {self.host} 时必须设置 token")
+        bad = [o for o in self.allowed_origins if not o.startswith(('http://', 'https://'))]
+        if bad:
+            errors.append(f"[api] allowed_origins 必须是 http(s)://主机[:端口] 形式: {bad}")
+        return errors
+
+
+@dataclass(frozen=True)
+class AppConfig:
+    player: PlayerConfig = field(default_factory=PlayerConfig)
+    profile: CameraProfile = field(default_factory=CameraProfile)
+    cameras: dict = field(default_factory=dict)  # 名称 -> CameraProfile（已合并默认配置）
+    recording: RecordingConfig = field(default_factory=RecordingConfig)
+    clips: ClipConfig = field(default_factory=ClipConfig)
+    api: ApiConfig = field(default_factory=ApiConfig)
+    path: str = ''  # 加载来源（未找到文件时为空）
+    mtime: float = 0.0
+
+    def profile_for(self, url=None):
+        """主画面使用的摄像机配置：[player] camera 指定的优先，其次按 url 匹配，否则为默认配置"""
+        if self.player.camera:
+            return self.cameras[self.player.camera]
+        if url:
+            for profile in self.cameras.values():
+                if profile.url and profile.url == url:
+                    return profile
+        return self.profile
+
+    def validate(self):
+        errors = []
+        for section in (self.player, self.profile, self.recording, self.clips, self.api):
+            errors.extend(section.validate())
+        for profile in self.cameras.values():
+            errors.extend(profile.validate())
+        if self.player.camera and self.player.camera not in self.cameras:
+            errors.append(f"[player] camera 未在 [cameras] 中定义: {self.player.camera}")
+        if errors:
+            raise ConfigError(errors, self.path)
+        return self
+
+
+def _coerce(section, key, value, default):
+    """按默认值的类型转换并检查单个字段"""
+    if isinstance(value, _EnvValue):
+        value = _parse_env_value(value, default)
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in ('true', 'false', '1', '0', 'yes', 'no', 'on', 'off'):
+            return value.lower() in ('true', '1', 'yes', 'on')
+    elif isinstance(default, int):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+    elif isinstance(default, float):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    elif isinstance(default, str):
+        if isinstance(value, str):
+            return value
+    elif isinstance(default, tuple):
+        if isinstance(value, str):
+            value = [v.strip() for v in value.split(',') if v.strip()]
+        if isinstance(value, (list, tuple)):
+            if default and isinstance(default[0], float):
+                if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+                    return tuple(float(v) for v in value)
+            elif all(isinstance(v, str) for v in value):
+                return tuple(value)
+    raise ConfigError([f"[{section}] {key} 类型错误: 期望 {type(default).__name__}，实际为 {value!r}"])
+
+
+def _build(cls, section, data, base=None, **extra):
+    """用字典构造配置段：未知键报错，缺省键取 base（或类的默认值）"""
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        raise ConfigError([f"[{section}] 必须是表/字典"])
+    base = base if base is not None else cls()
+    names = {f.name for f in dataclasses.fields(cls)}
+    values = {}
+    errors = []
+    for key, value in data.items():
+        if key not in names or key in extra:
+            errors.append(f"[{section}] 未知的配置项: {key}")
+            continue
+        try:
+            values[key] = _coerce(section, key, value, getattr(base, key))
+        except ConfigError as e:
+            errors.extend(e.errors)
+    if errors:
+        raise ConfigError(errors)
+    values.update(extra)
+    return dataclasses.replace(base, **values)
+
+
+class _EnvValue(str):
+    """来自环境变量的原始字符串：类型要等到与字段默认值对照时才能确定"""
+
+
+def _parse_env_value(raw, default):
+    """按字段默认值的类型解析环境变量：字符串字段保留原文（只去掉 TOML 引号），其余按 TOML 字面量解析"""
+    raw = str(raw)
+    if tomllib is not None:
+        try:
+            value = tomllib.loads(f"v = {raw}")['v']
+        except Exception:
+            return raw
+        if isinstance(default, str) and not isinstance(value, str):
+            # 例如数字形式的令牌、密码或摄像机名 "01"
+            return raw
+        return value
+    return raw
+
+
+def apply_env_overrides(data, environ=None):
+    """把 RTSP_PLAYER__段__键 形式的环境变量合并进配置字典（键名不区分大小写，统一转小写）"""
+    environ = os.environ if environ is None else environ
+    for name, raw in environ.items():
+        if not name.startswith(ENV_PREFIX):
+            continue
+        path = [p.lower() for p in name[len(ENV_PREFIX):].split('__') if p]
+        if len(path) < 2:
+            continue
+        node = data
+        for part in path[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        node[path[-1]] = _EnvValue(raw)
+    return data
+
+
+def read_file(path):
+    """读取 TOML / YAML 文件为字典"""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in ('.yaml', '.yml'):
+            if not YAML_AVAILABLE:
+                raise ConfigError(["未安装 PyYAML，无法读取 YAML 配置（可改用 TOML）"], path)
+            with open(path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f) or {}
+        else:
+            if tomllib is None:
+                raise ConfigError(["当前 Python 不支持 TOML（需要 3.11+ 或安装 tomli）"], path)
+            with open(path, 'rb') as f:
+                data = tomllib.load(f)
+    except ConfigError:
+        raise
+    except Exception as e:
+        raise ConfigError([f"解析失败: {e}"], path)
+    if not isinstance(data, dict):
+        raise ConfigError(["顶层必须是表/字典"], path)
+    return data
+
+
+def find_config_path(directory=None):
+    """RTSP_PLAYER_CONFIG 指定的路径，或当前目录下第一个存在的默认文件名（都没有时返回 None）"""
+    path = os.environ.get(ENV_CONFIG_PATH)
+    if path:
+        return path
+    directory = directory or os.getcwd()
+    for name in DEFAULT_FILENAMES:
+        candidate = os.path.join(directory, name)
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def build_config(data, path=''):
+    """由（已合并环境变量的）字典构造并校验 AppConfig"""
+    data = dict(data)
+    errors = []
+    sections = {}
+    for key, cls in (('player', PlayerConfig), ('profile', CameraProfile), ('recording', RecordingConfig),
+                     ('clips', ClipConfig), ('api', ApiConfig)):
+        try:
+            sections[key] = _build(cls, key, data.pop(key, None))
+        except ConfigError as e:
+            errors.extend(e.errors)
+    cameras = {}
+    camera_data = data.pop('cameras', None) or {}
+    if not isinstance(camera_data, dict):
+        errors.append("[cameras] 必须是表/字典")
+        camera_data = {}
+    base = sections.get('profile', CameraProfile())
+    for name, overrides in camera_data.items():
+        try:
+            cameras[name] = _build(CameraProfile, f"cameras.{name}", overrides, base=base, name=name)
+        except ConfigError as e:
+            errors.extend(e.errors)
+    for key in data:
+        errors.append(f"未知的配置段: [{key}]")
+    if errors:
+        raise ConfigError(errors, path)
+    mtime = 0.0
+    if path:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            pass
+    return AppConfig(cameras=cameras, path=path or '', mtime=mtime, **sections).validate()
+
+
+def load_config(path=None, environ=None):
+    """加载配置：文件（可缺省）→ 环境变量覆盖 → 校验；失败时抛出 ConfigError"""
+    path = path or find_config_path()
+    data = {}
+    if path:
+        if os.path.exists(path):
+            data = read_file(path)
+        elif os.environ.get(ENV_CONFIG_PATH) == path:
+            raise ConfigError(["配置文件不存在"], path)
+    apply_env_overrides(data, environ)
+    return build_config(data, path if path and os.path.exists(path) else '')
+
+
+class ConfigWatcher:
+    """后台线程轮询配置文件的修改时间，变化后重新加载
+
+    on_change(config): 新配置校验通过后调用（在监视线程中，调用方自行切回 UI 线程）
+    on_error(error): 加载失败时调用，旧配置继续生效
+    文件启动时不存在、之后才创建的情况同样会被发现。
+    """
+    def __init__(self, path, on_change, on_error=None, interval=2.0):
+        self.path = path
+        self.on_change = on_change
+        self.on_error = on_error
+        self.interval = interval
+        self._mtime = self._stat()
+        self._stop = Event()
+        self.reloads = 0
+        self._thread = Thread(target=self._run, name='config-watcher', daemon=True)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            stamp = self._stat()
+            if stamp is None or stamp == self._mtime:
+                continue
+            # 编辑器保存可能分多次写入，稍等文件稳定后再读取
+            time.sleep(0.2)
+            if self._stat() != stamp:
+                continue
+            self._mtime = stamp
+            try:
+                config = load_config(self.path)
+            except ConfigError as e:
+                print(f"配置热加载失败，保留当前配置: {e}")
+                if self.on_error:
+                    self.on_error(e)
+                continue
+            except Exception as e:
+                print(f"配置热加载异常: {e}")
+                continue
+            self.reloads += 1
+            print(f"配置文件已变化，重新加载: {self.path}")
+            try:
+                self.on_change(config)
+            except Exception as e:
+                print(f"应用新配置失败: {e}")
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,81 @@
+"""
+重量级依赖的延迟导入与后台预加载
+cv2、ultralytics（连带 torch）、zeep / lxml / onvif-zeep 只在第一次用到时导入，主窗口不必等它们；
+窗口显示后再由后台线程按配置预加载，用户第一次点击"连接"/"智能模式"时模块多半已在内存中。
+"""
+import importlib
+import importlib.util
+import sys
+import time
+from threading import Thread, Lock
+
+_lock = Lock()
+_missing = {}  # 模块名 -> 导入失败的异常（只尝试一次）
+
+
+def module_available(name):
+    """模块是否已安装（只查找，不导入）"""
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def optional_import(name):
+    """导入可选模块，未安装或导入失败时返回 None（失败结果会被缓存，不重复尝试）"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if name in _missing:
+        return None
+    with _lock:
+        if name in _missing:
+            return None
+        try:
+            return importlib.import_module(name)
+        except Exception as e:
+            _missing[name] = e
+            return None
+
+
+def _load_onvif():
+    from src.onvif.onvif_controller import load_onvif_camera
+    load_onvif_camera()
+
+
+def _load_yolo():
+    from src.detection.yolo_detector import load_yolo
+    load_yolo()
+
+
+# 预加载目标：名称 -> 加载函数（配置项 [player] preload 中使用这些名称）
+PRELOAD_TARGETS = {
+    'cv2': lambda: optional_import('cv2'),
+    'onvif': _load_onvif,  # zeep、lxml、requests 与 onvif-zeep
+    'yolo': _load_yolo,  # ultralytics 与 torch，内存占用较大，默认不预加载
+}
+
+
+def preload(names, on_done=None):
+    """在后台线程中依次加载 names 中的模块，返回 {名称: 耗时毫秒}（通过 on_done 回调）"""
+    def _run():
+        timings = {}
+        for name in names:
+            loader = PRELOAD_TARGETS.get(name)
+            if loader is None:
+                continue
+            start = time.perf_counter()
+            try:
+                loader()
+            except Exception as e:
+                print(f"后台预加载 {name} 失败: {e}")
+            timings[name] = (time.perf_counter() - start) * 1000
+        print("[诊断] 后台预加载: " + "，".join(f"{n} {ms:.0f} ms" for n, ms in timings.items()))
+        if on_done:
+            on_done(timings)
+
+    thread = Thread(target=_run, name='preload', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,98 @@
+"""
+启动耗时基准
+1. 用 `python -X importtime` 导入主窗口模块，统计总导入耗时、最慢的模块，
+   并检查 cv2 / ultralytics / torch / zeep / lxml 等重量级依赖没有在启动时被导入；
+2. （有图形界面时）以基准模式启动程序 N 次，统计启动到首个窗口的耗时。
+
+用法（在项目根目录）：
+    python -m src.utils.startup_benchmark [--runs 5] [--top 15] [--no-window]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 启动阶段不应导入的模块（第一次使用或后台预加载时才导入）
+HEAVY_MODULES = ('cv2', 'ultralytics', 'torch', 'zeep', 'lxml', 'onvif', 'requests')
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块名, 自身微秒, 累计微秒, 层级)]"""
+    rows = []
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), (len(m.group(3)) - 1) // 2))
+    return rows
+
+
+def measure_imports(module='src.gui.player_window'):
+    """在新解释器中导入 module，返回 (每个模块的统计, 墙钟耗时秒, 子进程返回码)"""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=PROJECT_ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        # 缺少依赖时把错误信息以外的导入统计照常输出，但结果无效
+        print(f"导入 {module} 失败: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+    return parse_importtime(proc.stderr), elapsed, proc.returncode
+
+
+def measure_first_window(runs):
+    """以基准模式启动程序，返回每次启动到首个窗口的耗时（毫秒）"""
+    env = dict(os.environ, RTSP_PLAYER_STARTUP_BENCHMARK='1')
+    results = []
+    for _ in range(runs):
+        try:
+            proc = subprocess.run([sys.executable, '-m', 'src.main'], cwd=PROJECT_ROOT, env=env,
+                                  capture_output=True, text=True, timeout=60)
+        except subprocess.TimeoutExpired:
+            print("启动超时（60 秒）")
+            break
+        m = re.search(r'启动到首个窗口: (\d+) ms', proc.stdout)
+        if not m:
+            print(f"未能启动窗口（无图形界面？）: {(proc.stderr.strip().splitlines() or [''])[-1]}")
+            break
+        results.append(int(m.group(1)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='启动耗时基准')
+    parser.add_argument('--runs', type=int, default=5, help='启动窗口的次数')
+    parser.add_argument('--top', type=int, default=15, help='列出累计耗时最多的模块数')
+    parser.add_argument('--no-window', action='store_true', help='只统计导入耗时，不启动窗口')
+    args = parser.parse_args(argv)
+
+    rows, elapsed, returncode = measure_imports()
+    top_level = [r for r in rows if r[3] == 0]
+    total_us = sum(r[2] for r in top_level)
+    print(f"导入 src.gui.player_window: 合计 {total_us / 1000:.0f} ms（解释器墙钟 {elapsed * 1000:.0f} ms）")
+    print(f"累计耗时最多的 {args.top} 个顶层模块:")
+    for name, self_us, cumulative_us, _ in sorted(top_level, key=lambda r: -r[2])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    loaded = sorted({r[0] for r in rows if r[0].split('.')[0] in HEAVY_MODULES})
+    if returncode != 0:
+        # 导入中途失败：耗时只是失败前的部分，也无法判断重量级依赖是否会被导入
+        print("结果无效: 主窗口模块导入失败，以上统计不完整")
+        return 2
+    if loaded:
+        print(f"警告: 启动时导入了重量级依赖: {', '.join(loaded)}")
+    else:
+        print(f"启动时未导入重量级依赖（{', '.join(HEAVY_MODULES)}）")
+
+    if not args.no_window:
+        results = measure_first_window(args.runs)
+        if results:
+            print(f"启动到首个窗口（{len(results)} 次）: 中位数 {statistics.median(results):.0f} ms，"
+                  f"最小 {min(results)} ms，最大 {max(results)} ms")
+    return 1 if loaded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
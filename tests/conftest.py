@@ -0,0 +1,5 @@
+"""测试公共设置：把项目根目录加入 sys.path，测试中按 `src.xxx` 导入"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,140 @@
+"""StreamServer：在本机随机端口上启动服务，检查健康状态、令牌、来源限制与 WebSocket 增量"""
+import base64
+import http.client
+import json
+import os
+import socket
+import struct
+import time
+from collections import namedtuple
+
+import pytest
+
+from src.api import StreamServer
+from src.api.websocket import accept_key
+
+TOKEN = 's3cret'
+ORIGIN = 'http://localhost:3000'
+
+Track = namedtuple('Track', 'track_id class_name conf box')
+
+
+@pytest.fixture
+def server():
+    srv = StreamServer('127.0.0.1', 0, token=TOKEN, allowed_origins=(ORIGIN + '/',))
+    assert srv.start()
+    assert srv.port != 0
+    yield srv
+    srv.stop()
+
+
+def get(server, path, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+    try:
+        conn.request('GET', path, headers=headers or {})
+        resp = conn.getresponse()
+        return resp.status, dict(resp.getheaders()), resp.read()
+    finally:
+        conn.close()
+
+
+def ws_connect(server, path, headers=None):
+    """发起 WebSocket 握手，返回 (socket, 状态行)"""
+    sock = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    lines = [f'GET {path} HTTP/1.1', 'Host: 127.0.0.1', 'Upgrade: websocket', 'Connection: Upgrade',
+             f'Sec-WebSocket-Key: {key}', 'Sec-WebSocket-Version: 13']
+    lines += [f'{k}: {v}' for k, v in (headers or {}).items()]
+    sock.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode('ascii'))
+    head = b''
+    while b'\r\n\r\n' not in head:
+        chunk = sock.recv(1)
+        if not chunk:
+            break
+        head += chunk
+    status_line, *rest = head.decode('latin-1').split('\r\n')
+    if ' 101 ' in status_line:
+        assert f'Sec-WebSocket-Accept: {accept_key(key)}' in rest
+    return sock, status_line
+
+
+def _recv_exact(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError('连接已关闭')
+        data += chunk
+    return data
+
+
+def ws_read(sock):
+    b0, b1 = _recv_exact(sock, 2)
+    length = b1 & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', _recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', _recv_exact(sock, 8))[0]
+    return b0 & 0x0F, json.loads(_recv_exact(sock, length))
+
+
+def test_health_requires_token(server):
+    status, _, _ = get(server, '/health')
+    assert status == 401
+    status, _, _ = get(server, '/health', {'Authorization': 'Bearer wrong'})
+    assert status == 401
+    status, headers, body = get(server, '/health', {'Authorization': f'Bearer {TOKEN}'})
+    assert status == 200
+    assert headers['Content-Type'].startswith('application/json')
+    data = json.loads(body)
+    assert data['status'] == 'ok' and data['ws_clients'] == 0
+    status, _, body = get(server, f'/cameras?token={TOKEN}')
+    assert status == 200 and json.loads(body) == []
+    assert server.rejected == 2
+
+
+def test_origin_allowlist(server):
+    status, headers, _ = get(server, f'/health?token={TOKEN}', {'Origin': 'http://evil.example'})
+    assert status == 403
+    assert 'Access-Control-Allow-Origin' not in headers
+    status, headers, _ = get(server, f'/health?token={TOKEN}', {'Origin': ORIGIN})
+    assert status == 200
+    assert headers['Access-Control-Allow-Origin'] == ORIGIN
+
+
+def test_websocket_rejects_foreign_origin_and_missing_token(server):
+    sock, status_line = ws_connect(server, f'/ws/detections?token={TOKEN}', {'Origin': 'http://evil.example'})
+    sock.close()
+    assert ' 403 ' in status_line
+    sock, status_line = ws_connect(server, '/ws/detections', {'Origin': ORIGIN})
+    sock.close()
+    assert ' 401 ' in status_line
+
+
+def test_websocket_snapshot_then_delta(server):
+    server.publish_detections('cam1', 100.0, [Track(1, 'person', 0.9, (10, 10, 50, 90))], 200, 100)
+    sock, status_line = ws_connect(server, f'/ws/detections?camera=cam1&token={TOKEN}', {'Origin': ORIGIN})
+    try:
+        assert ' 101 ' in status_line
+        opcode, snapshot = ws_read(sock)
+        assert opcode == 0x1
+        assert snapshot['type'] == 'snapshot' and snapshot['seq'] == 1
+        assert snapshot['tracks'] == [{'id': 1, 'class': 'person', 'conf': 0.9, 'box': [10, 10, 50, 90],
+                                       'nbox': [0.05, 0.1, 0.25, 0.9]}]
+        deadline = time.time() + 5
+        while not server._ws_clients and time.time() < deadline:
+            time.sleep(0.01)
+        # 1 号只抖动 1 像素（不算更新），2 号新增；另一路摄像机的增量不应发给该订阅者
+        server.publish_detections('cam2', 100.5, [Track(7, 'car', 0.5, (0, 0, 5, 5))])
+        server.publish_detections('cam1', 101.0, [Track(1, 'person', 0.9, (11, 10, 50, 90)),
+                                                  Track(2, 'car', 0.8, (100, 20, 180, 60))], 200, 100)
+        server.publish_detections('cam1', 102.0, [Track(2, 'car', 0.8, (120, 20, 200, 60))], 200, 100)
+        _, delta = ws_read(sock)
+        assert delta['type'] == 'delta' and delta['camera'] == 'cam1' and delta['seq'] == 2
+        assert [t['id'] for t in delta['added']] == [2]
+        assert delta['updated'] == [] and delta['removed'] == []
+        _, delta = ws_read(sock)
+        assert delta['seq'] == 3 and delta['removed'] == [1]
+        assert delta['updated'][0]['box'] == [120, 20, 200, 60]
+    finally:
+        sock.close()
@@ -0,0 +1,194 @@
+"""AsyncONVIFController / AsyncCameraGroup：对本机上的模拟 ONVIF 设备发起真实的 HTTP/SOAP 请求"""
+import asyncio
+import threading
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from src.onvif.async_controller import AsyncONVIFController, AsyncCameraGroup, SoapFault, build_envelope
+from src.onvif.camera_manager import CameraManager
+
+_ENVELOPE = ('<?xml version="1.0" encoding="UTF-8"?>'
+             '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" '
+             'xmlns:tt="http://www.onvif.org/ver10/schema"><s:Body>{}</s:Body></s:Envelope>')
+
+
+class FakeDevice:
+    """最小的 ONVIF 设备：按请求中的操作名返回固定响应；delay 秒后才响应 GetStatus（用于超时测试）"""
+
+    def __init__(self, delay=0.0, fault=False):
+        self.delay = delay
+        self.fault = fault
+        self.usernames = []
+        self.requests = []
+        self.connections = 0
+        self.port = None
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.decode('latin-1').split('\r\n'):
+                    if line.lower().startswith('content-length:'):
+                        length = int(line.split(':', 1)[1])
+                body = (await reader.readexactly(length)).decode('utf-8')
+                root = ET.fromstring(body)  # 报文必须是合法 XML
+                user = next((n.text for n in root.iter() if n.tag.endswith('}Username')), None)
+                if user is not None:
+                    self.usernames.append(user)
+                payload = await self._respond(body)
+                data = _ENVELOPE.format(payload).encode('utf-8')
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/soap+xml\r\n'
+                             b'Content-Length: %d\r\n\r\n' % len(data) + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, body):
+        base = f'http://127.0.0.1:{self.port}'
+        for op in ('GetSystemDateAndTime', 'GetCapabilities', 'GetProfiles', 'GetStatus', 'ContinuousMove'):
+            if op in body:
+                self.requests.append(op)
+                break
+        else:
+            return ''
+        if op == 'GetSystemDateAndTime':
+            return ('<tds:GetSystemDateAndTimeResponse xmlns:tds="http://www.onvif.org/ver10/device/wsdl">'
+                    '<tds:SystemDateAndTime><tt:UTCDateTime><tt:Date><tt:Year>2030</tt:Year><tt:Month>1</tt:Month>'
+                    '<tt:Day>1</tt:Day></tt:Date><tt:Time><tt:Hour>0</tt:Hour><tt:Minute>0</tt:Minute>'
+                    '<tt:Second>0</tt:Second></tt:Time></tt:UTCDateTime></tds:SystemDateAndTime>'
+                    '</tds:GetSystemDateAndTimeResponse>')
+        if op == 'GetCapabilities':
+            return (f'<tds:GetCapabilitiesResponse xmlns:tds="http://www.onvif.org/ver10/device/wsdl">'
+                    f'<tds:Capabilities><tt:Media><tt:XAddr>{base}/onvif/media</tt:XAddr></tt:Media>'
+                    f'<tt:PTZ><tt:XAddr>{base}/onvif/ptz</tt:XAddr></tt:PTZ></tds:Capabilities>'
+                    f'</tds:GetCapabilitiesResponse>')
+        if op == 'GetProfiles':
+            return ('<trt:GetProfilesResponse xmlns:trt="http://www.onvif.org/ver10/media/wsdl">'
+                    '<trt:Profiles token="main&amp;1"/></trt:GetProfilesResponse>')
+        if op == 'GetStatus':
+            await asyncio.sleep(self.delay)
+            if self.fault:
+                return ('<s:Fault><s:Reason><s:Text xml:lang="en">Not authorized</s:Text></s:Reason></s:Fault>')
+            return ('<tptz:GetStatusResponse xmlns:tptz="http://www.onvif.org/ver20/ptz/wsdl"><tptz:PTZStatus>'
+                    '<tt:Position><tt:PanTilt x="0.25" y="-0.5"/><tt:Zoom x="0.1"/></tt:Position>'
+                    '<tt:MoveStatus><tt:PanTilt>IDLE</tt:PanTilt><tt:Zoom>IDLE</tt:Zoom></tt:MoveStatus>'
+                    '</tptz:PTZStatus></tptz:GetStatusResponse>')
+        return '<tptz:ContinuousMoveResponse xmlns:tptz="http://www.onvif.org/ver20/ptz/wsdl"/>'
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_envelope_escapes_username():
+    envelope = build_envelope('<x/>', 'a&b<c>', 'pw')
+    root = ET.fromstring(envelope)
+    assert next(n.text for n in root.iter() if n.tag.endswith('}Username')) == 'a&b<c>'
+
+
+def test_connect_and_get_status():
+    async def scenario():
+        device = await FakeDevice().start()
+        controller = AsyncONVIFController('127.0.0.1', device.port, 'ad&min', 'secret', timeout=2.0)
+        try:
+            await controller.connect()
+            assert controller.ptz_url.endswith('/onvif/ptz')
+            assert controller.profile_token == 'main&1'
+            assert controller.time_offset > 0  # 设备时间在 2030 年
+            status = await controller.get_status()
+            await controller.continuous_move(0.1, 0.0)
+        finally:
+            controller.close()
+            await device.close()
+        return device, status
+
+    device, status = run(scenario())
+    assert status == {'pan': 0.25, 'tilt': -0.5, 'zoom': 0.1, 'pan_tilt_status': 'IDLE', 'zoom_status': 'IDLE'}
+    assert device.usernames and set(device.usernames) == {'ad&min'}
+    assert device.requests == ['GetSystemDateAndTime', 'GetCapabilities', 'GetProfiles', 'GetStatus', 'ContinuousMove']
+    assert device.connections == 1  # 所有请求复用同一条 keep-alive 连接
+
+
+def test_call_raises_soap_fault():
+    async def scenario():
+        device = await FakeDevice(fault=True).start()
+        controller = AsyncONVIFController('127.0.0.1', device.port, 'admin', 'secret')
+        try:
+            await controller.connect()
+            with pytest.raises(SoapFault, match='Not authorized'):
+                await controller.get_status()
+        finally:
+            controller.close()
+            await device.close()
+
+    run(scenario())
+
+
+def test_group_timeout_is_per_camera():
+    async def scenario():
+        fast, slow = await FakeDevice().start(), await FakeDevice(delay=1.0).start()
+        group = AsyncCameraGroup([AsyncONVIFController('127.0.0.1', d.port, 'admin', 'pw') for d in (fast, slow)])
+        try:
+            connected = await group.connect_all()
+            assert not any(isinstance(r, BaseException) for r in connected.values())
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            results = await group.poll_status(timeout=0.2)
+            elapsed = loop.time() - start
+        finally:
+            group.close()
+            await fast.close()
+            await slow.close()
+        return fast, slow, results, elapsed
+
+    fast, slow, results, elapsed = run(scenario())
+    assert results[f'127.0.0.1:{fast.port}']['pan'] == 0.25
+    assert isinstance(results[f'127.0.0.1:{slow.port}'], asyncio.TimeoutError)
+    assert elapsed < 0.9
+
+
+async def _shutdown(device):
+    await device.close()
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_camera_manager_polls_ptz_status(tmp_path):
+    loop = asyncio.new_event_loop()
+    device = loop.run_until_complete(FakeDevice().start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    manager = CameraManager('admin', 'pw', cache_path=str(tmp_path / 'cameras.json'))
+    info = manager.add('127.0.0.1', device.port)
+    info.status, info.has_ptz = 'connected', True
+    other = manager.add('127.0.0.1', 1)  # 未连接的摄像机不参与轮询
+    updated = threading.Event()
+    try:
+        manager.start_status_polling(interval=0.1, timeout=1.0, on_update=updated.set)
+        assert updated.wait(5.0)
+    finally:
+        manager.shutdown()
+        asyncio.run_coroutine_threadsafe(_shutdown(device), loop).result(2.0)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(2.0)
+        loop.close()
+    assert info.ptz_error == ''
+    assert info.ptz_status['tilt'] == -0.5
+    assert other.ptz_status is None
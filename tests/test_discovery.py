@@ -0,0 +1,92 @@
+"""WS-Discovery：discover() 指向本机 UDP 应答线程，检查 Probe 报文、响应解析与去重"""
+import socket
+import threading
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from src.onvif.discovery import discover, parse_probe_matches
+
+_MATCHES = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:a="http://schemas.xmlsoap.org/ws/2004/08/addressing" '
+    'xmlns:d="http://schemas.xmlsoap.org/ws/2005/04/discovery">'
+    '<s:Header><a:RelatesTo>{relates_to}</a:RelatesTo></s:Header>'
+    '<s:Body><d:ProbeMatches>{matches}</d:ProbeMatches></s:Body></s:Envelope>'
+)
+_MATCH = (
+    '<d:ProbeMatch><a:EndpointReference><a:Address>{endpoint}</a:Address></a:EndpointReference>'
+    '<d:Types>dn:NetworkVideoTransmitter</d:Types>'
+    '<d:Scopes>onvif://www.onvif.org/type/video_encoder onvif://www.onvif.org/name/{name}</d:Scopes>'
+    '<d:XAddrs>{xaddrs}</d:XAddrs></d:ProbeMatch>'
+)
+
+
+class Responder:
+    """本机 UDP 应答程序：对每个 Probe 先回一个无法解析的包，再回 ProbeMatches"""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.probes = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.2)
+        self.address = self.sock.getsockname()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(2.0)
+        self.sock.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                data, peer = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            root = ET.fromstring(data)
+            message_id = next(n.text for n in root.iter() if n.tag.endswith('}MessageID'))
+            self.probes.append((message_id, data.decode('utf-8')))
+            self.sock.sendto(b'not xml', peer)
+            matches = ''.join(_MATCH.format(**d) for d in self.devices)
+            self.sock.sendto(_MATCHES.format(relates_to=message_id, matches=matches).encode('utf-8'), peer)
+
+
+DEVICES = [
+    {'endpoint': 'urn:uuid:cam-1', 'name': 'Gate', 'xaddrs': 'http://192.0.2.10/onvif/device_service'},
+    {'endpoint': 'urn:uuid:cam-2', 'name': 'Yard',
+     'xaddrs': 'http://192.0.2.11:8080/onvif/device_service http://[2001:db8::11]/onvif/device_service'},
+]
+
+
+def test_discover_against_local_responder():
+    with Responder(DEVICES) as responder:
+        devices = discover(timeout=0.5, address=responder.address, retries=2)
+    # Probe 重复发送两次，同一条 MessageID；重复的响应按设备标识去重
+    assert len(responder.probes) == 2
+    assert len({message_id for message_id, _ in responder.probes}) == 1
+    assert 'NetworkVideoTransmitter' in responder.probes[0][1]
+    by_endpoint = {d.endpoint: d for d in devices}
+    assert sorted(by_endpoint) == ['urn:uuid:cam-1', 'urn:uuid:cam-2']
+    gate, yard = by_endpoint['urn:uuid:cam-1'], by_endpoint['urn:uuid:cam-2']
+    assert (gate.name, gate.host, gate.port) == ('Gate', '192.0.2.10', 80)
+    assert (yard.name, yard.host, yard.port) == ('Yard', '192.0.2.11', 8080)
+    assert len(yard.xaddrs) == 2
+
+
+def test_discover_without_responses_returns_empty():
+    with Responder([]) as responder:
+        assert discover(timeout=0.3, address=responder.address, retries=1) == []
+    assert len(responder.probes) == 1
+
+
+@pytest.mark.parametrize('data', [b'', b'<unclosed', b'<a/>'])
+def test_parse_probe_matches_ignores_invalid(data):
+    assert parse_probe_matches(data) == []